@@ -0,0 +1,60 @@
+import timeit
+
+from callback_router import CallbackRouter
+
+print("⏱️ Бенчмарк разбора callback_data: if/elif против CallbackRouter")
+print("=" * 60)
+
+
+def handler(*args):
+    return args
+
+
+def build_chain(actions):
+    """Строит функцию с цепочкой if/elif, как в старом handle_callback"""
+    lines = ["def chain(data):"]
+    for i, action in enumerate(actions):
+        keyword = "if" if i == 0 else "elif"
+        lines.append(f"    {keyword} data == {action!r}:")
+        lines.append("        return handler()")
+    for i, action in enumerate(actions):
+        lines.append(f"    elif data.startswith({action + '_item_'!r}):")
+        lines.append("        return handler(int(data.split('_')[-1]))")
+    namespace = {'handler': handler}
+    exec("\n".join(lines), namespace)
+    return namespace['chain']
+
+
+def build_router(actions):
+    router = CallbackRouter()
+    for action in actions:
+        router.route(action, handler)
+        router.prefix(action + "_item_", handler, int)
+    return router
+
+
+def measure(func, data, number=100000):
+    return timeit.timeit(lambda: func(data), number=number) / number * 1e9
+
+
+print(f"{'действий':>10} | {'if/elif, нс':>12} | {'router, нс':>12} | {'префикс if/elif':>16} | {'префикс router':>15}")
+for count in (10, 100, 1000):
+    actions = [f"action{i}" for i in range(count)]
+    chain = build_chain(actions)
+    router = build_router(actions)
+
+    # Худший случай для цепочки - последнее действие
+    last = actions[-1]
+    last_prefixed = f"{last}_item_42"
+
+    def route(data):
+        found, args = router.resolve(data)
+        return found(*args)
+
+    print(
+        f"{count:>10} | {measure(chain, last):>12.0f} | {measure(route, last):>12.0f} | "
+        f"{measure(chain, last_prefixed):>16.0f} | {measure(route, last_prefixed):>15.0f}"
+    )
+
+print("=" * 60)
+print("🏁 Время разбора через CallbackRouter не растет с числом действий")
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import json
+import time
+
+from shop_core import OzonClient, ShopCatalog, STRATEGIES
+
+print("⏱️ Бенчмарк стратегий загрузки каталога: время и число запросов к Ozon")
+print("=" * 60)
+
+# Имитация сетевой задержки одного запроса к Ozon
+LATENCY = 0.005
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self.text = ""
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def iter_content(self, chunk_size):
+        body = json.dumps(self._data).encode()
+        return (body[start:start + chunk_size] for start in range(0, len(body), chunk_size))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def product(product_id):
+    return {
+        'product_id': product_id,
+        'id': product_id,
+        'offer_id': f"SKU-{product_id}",
+        'name': f"Товар {product_id}",
+        'description': f"<p>Описание товара {product_id}</p>",
+        'stock': 5,
+        'stocks': {'stocks': [{'present': 5, 'reserved': 1}]},
+    }
+
+
+def fake_ozon(size):
+    """Транспорт с ответами в формате Ozon для каталога из size товаров"""
+    ids = list(range(1, size + 1))
+
+    def items_for(payload):
+        batch = payload.get('product_id') or payload.get('filter', {}).get('product_id') or []
+        return [product(product_id) for product_id in batch]
+
+    def post(url, idempotent=True, headers=None, json=None, timeout=None, stream=False):
+        time.sleep(LATENCY)
+        path = url.split("api-seller.ozon.ru", 1)[1]
+        if path == "/v3/product/list":
+            data = {'result': {'items': [{'product_id': i, 'offer_id': f"SKU-{i}"} for i in ids[:json['limit']]]}}
+        elif path == "/v1/product/info/description":
+            data = {'result': product(json['product_id'])}
+        elif path == "/v5/product/info/prices":
+            data = {'items': [{'product_id': item['product_id'], 'price': {'price': "990"}} for item in items_for(json)]}
+        elif path == "/v3/product/info/stocks":
+            data = {'result': {'items': [
+                {'product_id': item['product_id'], 'stocks': [{'present': 5, 'reserved': 1}]} for item in items_for(json)
+            ]}}
+        else:
+            data = {'result': {'items': items_for(json)}}
+        return FakeResponse(data)
+
+    return post
+
+
+print(f"{'товаров':>8} | {'стратегия':>12} | {'время, мс':>10} | {'запросов':>9}")
+for size in (20, 50, 200):
+    for name in STRATEGIES:
+        catalog = ShopCatalog(name, limit=size, client_factory=lambda: OzonClient("id", "key", fake_ozon(size)))
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            products = catalog.load()
+        elapsed = (time.perf_counter() - started) * 1000
+        assert len(products) == size
+        print(f"{size:>8} | {name:>12} | {elapsed:>10.1f} | {catalog.client.calls:>9}")
+
+print("=" * 60)
+print("🏁 Стратегии с v1/product/info/description делают запрос на каждый товар;\n"
+      "   info-v3 берет названия, описания и остатки из одного пакетного ответа")
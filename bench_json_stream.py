@@ -0,0 +1,90 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from catalog_columns import PriceBatch
+from json_stream import CHUNK_SIZE, iter_items
+
+# Размер имитируемого ответа v5/product/info/prices
+ITEMS = 100_000
+
+
+def price_item(product_id):
+    return {
+        'product_id': product_id,
+        'offer_id': f"SKU-{product_id}",
+        'price': {
+            'price': "1990.00",
+            'old_price': "2490.00",
+            'marketing_price': "1790.00",
+            'min_price': "1500.00",
+            'currency_code': "RUB",
+        },
+        'commissions': {'fbo_deliv_to_customer_amount': 14.75, 'sales_percent_fbs': 15},
+        'volume_weight': 0.4,
+    }
+
+
+def body_chunks(count):
+    """Ответ Ozon кусками по CHUNK_SIZE, как их отдает requests.iter_content"""
+    buffer = b'{"items": ['
+    for product_id in range(count):
+        if product_id:
+            buffer += b","
+        buffer += json.dumps(price_item(product_id)).encode()
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer
+            buffer = b""
+    yield buffer + b'], "total": %d}' % count
+
+
+def prices(items):
+    batch = PriceBatch()
+    for item in items:
+        batch.add(item)
+    return batch.columns()[1]
+
+
+def full(count):
+    """Как response.json(): тело целиком, потом весь dict, потом извлечение"""
+    data = json.loads(b"".join(body_chunks(count)))
+    return prices(data['items'])
+
+
+def streamed(count):
+    return prices(iter_items(body_chunks(count), ('items',)))
+
+
+def run(mode):
+    started = time.perf_counter()
+    result = {'full': full, 'stream': streamed, 'idle': lambda count: ()}[mode](ITEMS)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux - в килобайтах
+    print(json.dumps({'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'time': elapsed, 'items': len(result)}))
+
+
+def measure(mode):
+    """Каждый режим в отдельном процессе, чтобы пиковая память не смешивалась"""
+    output = subprocess.run([sys.executable, __file__, mode], capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    run(sys.argv[1])
+    sys.exit()
+
+print(f"⏱️ Бенчмарк разбора ответа цен на {ITEMS} товаров: response.json() против потока")
+print("=" * 60)
+
+idle = measure('idle')
+print(f"{'режим':>8} | {'пик RSS, МБ':>12} | {'сверх базы, МБ':>15} | {'время, с':>9}")
+for mode in ('full', 'stream'):
+    result = measure(mode)
+    assert result['items'] == ITEMS
+    print(f"{mode:>8} | {result['rss']:>12.1f} | {result['rss'] - idle['rss']:>15.1f} | {result['time']:>9.2f}")
+
+print("=" * 60)
+print("🏁 Потоковый разбор держит в памяти один кусок ответа и один элемент;\n"
+      "   остается только колонка цен")
@@ -0,0 +1,70 @@
+import timeit
+
+from message_templates import Template
+
+print("⏱️ Бенчмарк сборки сообщений: цепочка += против шаблонов format_map")
+print("=" * 60)
+
+ORDER = {
+    'total': 12990,
+    'items_count': 3,
+    'customer_name': "Иван Петров",
+    'customer_phone': "+7 900 123-45-67",
+    'customer_city': "Москва",
+    'customer_address': "ул. Тверская, д. 1, кв. 2",
+    'date': "2024-01-15 12:30",
+}
+
+SUMMARY = Template(
+    "✅ *Заказ создан в Ozon!*\n\n"
+    "💰 Сумма: {total} ₽\n"
+    "📦 Товаров: {items_count} шт.\n"
+    "👤 Получатель: {customer_name}\n"
+    "📞 Телефон: {customer_phone}\n"
+    "🏠 Адрес: {customer_city}, {customer_address}\n"
+    "\n📅 Дата: {date}\n\n"
+    "Состав заказа:\n"
+)
+ITEM = Template("• {name} - {quantity} шт. × {price} ₽\n")
+FOOTER = "\n📱 Вы можете отслеживать статус заказа в личном кабинете Ozon"
+
+
+def concat(order, items):
+    """Как в старом process_order"""
+    order_text = "✅ *Заказ создан в Ozon!*\n\n"
+    order_text += f"💰 Сумма: {order['total']} ₽\n"
+    order_text += f"📦 Товаров: {order['items_count']} шт.\n"
+    order_text += f"👤 Получатель: {order['customer_name']}\n"
+    order_text += f"📞 Телефон: {order['customer_phone']}\n"
+    order_text += f"🏠 Адрес: {order['customer_city']}, {order['customer_address']}\n"
+    order_text += f"\n📅 Дата: {order['date']}\n\n"
+    order_text += "Состав заказа:\n"
+    for item in items:
+        order_text += f"• {item['name']} - {item['quantity']} шт. × {item['price']} ₽\n"
+    order_text += FOOTER
+    return order_text
+
+
+def templated(order, items):
+    return "".join((SUMMARY.render(order), ITEM.render_many(items), FOOTER))
+
+
+def measure(func, items, number=20000):
+    return timeit.timeit(lambda: func(ORDER, items), number=number) / number * 1e6
+
+
+print(f"{'товаров':>8} | {'+=, мкс':>9} | {'шаблон, мкс':>12}")
+results = []
+for count in (1, 10, 100):
+    items = [{'name': f"Товар {i}", 'quantity': i % 3 + 1, 'price': 990 + i} for i in range(count)]
+    assert concat(ORDER, items) == templated(ORDER, items)
+    results.append((count, measure(concat, items), measure(templated, items)))
+    print(f"{count:>8} | {results[-1][1]:>9.2f} | {results[-1][2]:>12.2f}")
+
+compile_time = timeit.timeit(lambda: Template(SUMMARY.source), number=1000) / 1000 * 1e6
+print(f"\nРазбор шаблона: {compile_time:.1f} мкс (один раз при запуске)")
+print("=" * 60)
+for count, concat_time, template_time in results:
+    faster = "шаблон" if template_time < concat_time else "цепочка +="
+    print(f"🏁 {count} товаров: быстрее {faster} на {abs(concat_time - template_time):.2f} мкс "
+          f"({abs(concat_time - template_time) / max(concat_time, template_time):.0%})")
@@ -1,13 +1,60 @@
 import os
+import asyncio
 import requests
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, filters, ContextTypes
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from telegram.error import Forbidden
+from city_index import CityIndex
+from weather_cache import PopularityTracker, WeatherCache
+from weather_subscriptions import SubscriptionStore, parse_time, slots_between
+from telegram_sender import message_governor
+from geo_grid import grid_place, is_cell_key, place_for_cell
+from weather_columns import ForecastColumns
+from weather_providers import WeatherApiError, build_weather_client
+from weather_views import WEATHER_MESSAGES, format_date, format_time, format_week_view, format_hourly_view, format_rain_view
+from message_templates import user_language
 
 # Токены из переменных окружения Render
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY')
 
+# Провайдеры погоды (основной и запасной, см. WEATHER_PROVIDERS); None - погода недоступна
+weather_client = build_weather_client(WEATHER_API_KEY)
+
+# Локальный справочник городов: синонимы и опечатки разрешаются без запросов к API
+city_index = CityIndex()
+
+# Кэш погоды и счетчик популярности городов для фонового прогрева
+WEATHER_TTL = 600  # секунд
+PREFETCH_INTERVAL = 60  # как часто проверять популярные города
+PREFETCH_REFRESH_AT = 0.8  # обновлять, когда прошло 80% TTL
+PREFETCH_TOP_K = 20
+WEATHER_MAX_STALE = 6 * 3600  # сколько можно показывать устаревшие данные
+WEATHER_NEGATIVE_TTL = 900  # сколько помнить ошибки API
+# Сколько мест держать в кэше погоды: ключи ячеек сетки не ограничены справочником
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 2000))
+# Один ответ forecast.json на N дней питает все представления (неделя, часы, дожди)
+FORECAST_DAYS = int(os.environ.get('FORECAST_DAYS', 7))
+weather_cache = WeatherCache(
+    ttl=WEATHER_TTL, max_stale=WEATHER_MAX_STALE, negative_ttl=WEATHER_NEGATIVE_TTL, max_entries=WEATHER_CACHE_SIZE
+)
+weather_refreshes = {}  # ключ города -> задача загрузки
+
+# Подписки на ежедневный прогноз; время подписки - в часовом поясе бота
+SUBSCRIPTION_TZ = ZoneInfo(os.environ.get('SUBSCRIPTION_TZ', 'Europe/Moscow'))
+subscriptions = SubscriptionStore()
+popular_cities = PopularityTracker(top_k=PREFETCH_TOP_K)
+
+# Inline-режим: запросы приходят на каждое нажатие клавиши
+INLINE_DEBOUNCE = 0.4  # секунд тишины, после которых запрос считается набранным
+INLINE_SUGGESTIONS = 5
+INLINE_CACHE_TIME = 300  # сколько Telegram хранит ответ, если все данные из кэша
+INLINE_MISS_CACHE_TIME = 5  # если часть городов еще грузится
+inline_latest = {}  # user_id -> id последнего inline-запроса
+inline_articles = {}  # ключ города -> (данные, готовый InlineQueryResultArticle)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
     await update.message.reply_text(
@@ -16,7 +63,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Например: Москва, London, Paris\n\n"
         "Команды:\n"
         "/start - начать работу\n"
-        "/help - помощь"
+        "/help - помощь\n"
+        "/week Город - прогноз на неделю\n"
+        "/lang ru|en - язык ответов\n"
+        "/subscribe Город ЧЧ:ММ - ежедневный прогноз\n"
+        "/subscriptions - мои подписки\n"
+        "/unsubscribe [Город] - отписаться"
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -28,45 +80,28 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Москва\n"
         "• Лондон\n"
         "• Berlin\n"
-        "• Париж"
+        "• Париж\n\n"
+        "📍 Можно отправить геопозицию - покажу погоду для вашего места\n\n"
+        "💬 В любом чате наберите @имя_бота и город - погода подставится в сообщение"
     )
 
-def format_time(time_str):
-    """Форматирование времени из формата API в читаемый вид"""
-    try:
-        # Преобразуем время из формата "2024-01-15 07:45" в "07:45"
-        dt = datetime.strptime(time_str, "%Y-%m-%d %H:%M")
-        return dt.strftime("%H:%M")
-    except:
-        return time_str
-
-def format_date(date_str):
-    """Форматирование даты в читаемый вид"""
-    try:
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        months = ["янв", "фев", "мар", "апр", "мая", "июн", 
-                 "июл", "авг", "сен", "окт", "ноя", "дек"]
-        return f"{dt.day} {months[dt.month-1]} ({days[dt.weekday()]})"
-    except:
-        return date_str
-
 def hpa_to_mmhg(pressure_hpa):
     """Конвертирует давление из гПа в мм рт. ст."""
     return round(pressure_hpa * 0.750062, 1)
 
-def get_wave_height_description(wave_height_m):
+def get_wave_height_description(wave_height_m, lang='ru'):
     """Получить описание высоты волн"""
     if wave_height_m < 0.3:
-        return "🟢 Спокойное море"
+        key = 'wave_calm'
     elif wave_height_m < 0.6:
-        return "🟡 Легкое волнение"
+        key = 'wave_light'
     elif wave_height_m < 1.2:
-        return "🟠 Умеренное волнение"
+        key = 'wave_moderate'
     elif wave_height_m < 2.5:
-        return "🟣 Сильное волнение"
+        key = 'wave_rough'
     else:
-        return "🔴 Очень сильное волнение"
+        key = 'wave_high'
+    return WEATHER_MESSAGES.render(key, lang)
 
 def should_show_marine_data(marine_data, city_name):
     """Определяет, нужно ли показывать данные о волнах"""
@@ -112,148 +147,249 @@ def should_show_marine_data(marine_data, city_name):
         print(f"Error in should_show_marine_data: {e}")
         return False
 
+async def refresh_weather(city_match):
+    """Загружает данные о погоде и обновляет кэш; параллельные запросы
+    одного города ждут одну и ту же загрузку"""
+    task = weather_refreshes.get(city_match.key)
+    if task is None:
+        task = asyncio.create_task(_refresh_weather(city_match))
+        weather_refreshes[city_match.key] = task
+    return await asyncio.shield(task)
+
+async def _refresh_weather(city_match):
+    try:
+        bundle = await weather_client.fetch(city_match, FORECAST_DAYS)
+        # Почасовые ряды разбираются один раз на ответ и кэшируются вместе с ним
+        bundle['columns'] = ForecastColumns(bundle['forecast'], bundle['marine'])
+        weather_cache.put(city_match.key, bundle)
+        return bundle
+    except WeatherApiError as e:
+        # Ошибку API запоминаем, чтобы мусорный ввод не ходил в API повторно
+        weather_cache.put_negative(city_match.key, str(e))
+        raise
+    finally:
+        weather_refreshes.pop(city_match.key, None)
+
+def _log_background_refresh(task):
+    if not task.cancelled() and task.exception():
+        print(f"⚠️ Фоновое обновление погоды не удалось: {task.exception()}")
+
+async def get_weather_bundle(city_match):
+    """Данные о погоде и их возраст в секундах.
+
+    Устаревшие данные отдаются сразу, а обновление запускается в фоне.
+    """
+    bundle, age = weather_cache.lookup(city_match.key)
+    if bundle is None:
+        # Недавняя ошибка API для этого места - не повторяем запрос
+        error_message = weather_cache.get_negative(city_match.key)
+        if error_message:
+            raise WeatherApiError(error_message)
+        return await refresh_weather(city_match), 0
+    
+    if not weather_cache.is_fresh(age) and city_match.key not in weather_refreshes:
+        task = asyncio.create_task(refresh_weather(city_match))
+        task.add_done_callback(_log_background_refresh)
+    return bundle, age
+
+def format_age(age_seconds, lang='ru'):
+    """Возраст данных для подписи к сообщению"""
+    minutes = int(age_seconds // 60)
+    if minutes < 60:
+        return WEATHER_MESSAGES.render('age_minutes', lang, minutes=minutes)
+    return WEATHER_MESSAGES.render('age_hours', lang, hours=minutes // 60, minutes=minutes % 60)
+
+def format_place_title(city_match, bundle=None, lang='ru'):
+    """Название места для заголовка; для точек на карте берется из ответа API,
+    а пока данных нет - координаты ячейки"""
+    if city_match.name_ru and lang != 'ru':
+        # Страна в справочнике записана по-русски
+        return city_match.name_en
+    if city_match.name_ru:
+        return f"{city_match.name_ru}, {city_match.country}"
+    if bundle is None:
+        return f"📍 {city_match.lat:.2f}, {city_match.lon:.2f}"
+    location = bundle['current']['location']
+    return "📍 " + ", ".join(part for part in (location['name'], location['country']) if part)
+
+def format_weather(city_match, bundle, lang='ru'):
+    """Формирует текст сообщения о погоде"""
+    current_data = bundle['current']
+    astronomy_data = bundle['astronomy']
+    forecast_data = bundle['forecast']
+    marine_data = bundle['marine']
+    
+    # Парсим данные о текущей погоде
+    current = current_data['current']
+    
+    # Парсим астрономические данные
+    astronomy = astronomy_data['astronomy']['astro']
+    
+    # Базовый текст с текущей погодой - по скомпилированному шаблону
+    parts = [WEATHER_MESSAGES.render(
+        'current', lang,
+        place=format_place_title(city_match, bundle, lang),
+        temp_c=current['temp_c'],
+        feelslike_c=current['feelslike_c'],
+        condition=current['condition']['text'],
+        humidity=current['humidity'],
+        wind_kph=current['wind_kph'],
+        # Конвертируем давление в мм рт. ст.
+        pressure_mmhg=hpa_to_mmhg(current['pressure_mb']),
+        vis_km=current['vis_km'],
+        sunrise=format_time(astronomy['sunrise']),
+        sunset=format_time(astronomy['sunset']),
+    )]
+    
+    # Добавляем прогноз на завтра
+    if 'error' not in forecast_data and 'forecast' in forecast_data:
+        forecast_days = forecast_data['forecast']['forecastday']
+        if len(forecast_days) > 1:
+            tomorrow = forecast_days[1]
+            tomorrow_astro = tomorrow['astro']
+            tomorrow_day = tomorrow['day']
+            
+            parts.append(WEATHER_MESSAGES.render(
+                'tomorrow', lang,
+                date=format_date(tomorrow['date'], lang),
+                maxtemp_c=tomorrow_day['maxtemp_c'],
+                mintemp_c=tomorrow_day['mintemp_c'],
+                condition=tomorrow_day['condition']['text'],
+                avghumidity=tomorrow_day['avghumidity'],
+                maxwind_kph=tomorrow_day['maxwind_kph'],
+                daily_chance_of_rain=tomorrow_day['daily_chance_of_rain'],
+                daily_chance_of_snow=tomorrow_day['daily_chance_of_snow'],
+                sunrise=format_time(tomorrow_astro['sunrise']),
+                sunset=format_time(tomorrow_astro['sunset']),
+            ))
+    
+    # Проверяем, нужно ли показывать данные о волнах
+    if marine_data and should_show_marine_data(marine_data, city_match.name_en):
+        columns = bundle['columns']
+        current_hour_data = marine_data['forecast']['forecastday'][0]['hour'][0]
+        wave_height_m = columns.wave_height[0]
+        
+        parts.append(WEATHER_MESSAGES.render(
+            'marine', lang,
+            wave_height=wave_height_m,
+            wave_period=columns.wave_period[0],
+            wave_direction=current_hour_data.get('swell_direction_deg', 0),
+            description=get_wave_height_description(wave_height_m, lang),
+        ))
+        peak = columns.wave_peak
+        if peak:
+            start, end, height = peak
+            parts.append(WEATHER_MESSAGES.render(
+                'marine_peak', lang,
+                start=format_time(columns.marine_time[start]),
+                end=format_time(columns.marine_time[end]),
+                height=height,
+            ))
+    else:
+        print(f"Not showing marine data for {city_match.name_en}")
+    
+    return "".join(parts)
+
+# Представления погоды: все строятся из одного закэшированного набора данных
+WEATHER_VIEWS = {
+    'now': format_weather,
+    'week': lambda city_match, bundle, lang: format_week_view(format_place_title(city_match, bundle, lang), bundle['forecast'], bundle['columns'], lang),
+    'hours': lambda city_match, bundle, lang: format_hourly_view(format_place_title(city_match, bundle, lang), bundle['columns'], lang),
+    'rain': lambda city_match, bundle, lang: format_rain_view(format_place_title(city_match, bundle, lang), bundle['columns'], lang),
+}
+
+def weather_views_keyboard(city_key, current_view, lang='ru'):
+    """Кнопки переключения представлений; текущее не показываем"""
+    buttons = [
+        InlineKeyboardButton(WEATHER_MESSAGES.render(f"view_{view}", lang), callback_data=f"wv:{view}:{city_key}")
+        for view in WEATHER_VIEWS if view != current_view
+    ]
+    return InlineKeyboardMarkup([buttons])
+
+def render_weather_view(view, city_match, bundle, age, lang='ru'):
+    """Текст представления с пометкой об устаревших данных"""
+    text = WEATHER_VIEWS[view](city_match, bundle, lang)
+    if not weather_cache.is_fresh(age):
+        text += WEATHER_MESSAGES.render('stale', lang, age=format_age(age, lang))
+    return text
+
+def resolve_place_key(key):
+    """Место по ключу кэша: город справочника или ячейка сетки"""
+    if is_cell_key(key):
+        return place_for_cell(key[3:])
+    return city_index.resolve(key)
+
 async def handle_city_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка сообщений с названием города"""
     city = update.message.text.strip()
     
-    if not WEATHER_API_KEY:
+    if not weather_client:
+        await update.message.reply_text("❌ Сервис погоды временно недоступен")
+        return
+    
+    # Определяем город локально: неизвестный ввод не тратит запросы к API
+    city_match = city_index.resolve(city)
+    if not city_match:
+        await update.message.reply_text(
+            f"❌ Город «{city}» не найден.\n"
+            "Проверьте написание или попробуйте другой город поблизости."
+        )
+        return
+    
+    await reply_weather(update, context, city_match)
+
+async def handle_location_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка геопозиции: соседние пользователи делят одну ячейку кэша"""
+    if not weather_client:
         await update.message.reply_text("❌ Сервис погоды временно недоступен")
         return
     
+    location = update.message.location
+    await reply_weather(update, context, grid_place(location.latitude, location.longitude))
+
+async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /lang ru|en - язык ответов о погоде"""
+    lang = context.args[0].lower() if context.args else ''
+    if lang not in WEATHER_MESSAGES.templates:
+        await update.message.reply_text("🌐 Формат: /lang ru или /lang en")
+        return
+    
+    context.user_data['lang'] = lang
+    await update.message.reply_text("✅ Язык: русский" if lang == 'ru' else "✅ Language: English")
+
+async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /week <город>"""
+    if not context.args:
+        await update.message.reply_text("🗓️ Формат: /week Город\nНапример: /week Москва")
+        return
+    
+    if not weather_client:
+        await update.message.reply_text("❌ Сервис погоды временно недоступен")
+        return
+    
+    city = " ".join(context.args)
+    city_match = city_index.resolve(city)
+    if not city_match:
+        await update.message.reply_text(f"❌ Город «{city}» не найден.")
+        return
+    
+    await reply_weather(update, context, city_match, view='week')
+
+async def reply_weather(update: Update, context: ContextTypes.DEFAULT_TYPE, city_match, view='now'):
+    """Отвечает погодой для найденного места на языке пользователя"""
+    lang = user_language(update.effective_user, context.user_data)
+    # Учитываем популярность места для фонового прогрева кэша
+    popular_cities.record(city_match.key)
+    
     try:
-        # Получаем текущую погоду
-        current_url = "http://api.weatherapi.com/v1/current.json"
-        current_params = {
-            'key': WEATHER_API_KEY,
-            'q': city,
-            'lang': 'ru'
-        }
-        
-        # Получаем астрономические данные (восход, закат)
-        astronomy_url = "http://api.weatherapi.com/v1/astronomy.json"
-        astronomy_params = {
-            'key': WEATHER_API_KEY,
-            'q': city,
-            'dt': 'today'
-        }
-        
-        # Получаем прогноз на 2 дня (сегодня и завтра)
-        forecast_url = "http://api.weatherapi.com/v1/forecast.json"
-        forecast_params = {
-            'key': WEATHER_API_KEY,
-            'q': city,
-            'days': 2,
-            'lang': 'ru'
-        }
-        
-        # Делаем основные запросы
-        current_response = requests.get(current_url, params=current_params, timeout=10)
-        astronomy_response = requests.get(astronomy_url, params=astronomy_params, timeout=10)
-        forecast_response = requests.get(forecast_url, params=forecast_params, timeout=10)
-        
-        current_data = current_response.json()
-        astronomy_data = astronomy_response.json()
-        forecast_data = forecast_response.json()
-        
-        if 'error' in current_data:
-            error_message = current_data['error']['message']
-            await update.message.reply_text(f"❌ {error_message}")
-            return
-        
-        if 'error' in astronomy_data:
-            error_message = astronomy_data['error']['message']
-            await update.message.reply_text(f"❌ {error_message}")
-            return
-        
-        # Парсим данные о текущей погоде
-        location = current_data['location']
-        current = current_data['current']
-        
-        # Парсим астрономические данные
-        astronomy = astronomy_data['astronomy']['astro']
-        
-        # Конвертируем давление в мм рт. ст.
-        pressure_mmhg = hpa_to_mmhg(current['pressure_mb'])
-        
-        # Формируем базовый текст с текущей погодой
-        weather_text = (
-            f"🌍 {location['name']}, {location['country']}\n\n"
-            f"📅 **СЕГОДНЯ**\n"
-            f"🌡️ Температура: {current['temp_c']}°C\n"
-            f"💭 Ощущается как: {current['feelslike_c']}°C\n"
-            f"📝 {current['condition']['text']}\n"
-            f"💧 Влажность: {current['humidity']}%\n"
-            f"🌬️ Ветер: {current['wind_kph']} км/ч\n"
-            f"📊 Давление: {pressure_mmhg} мм рт. ст.\n"
-            f"🌫️ Видимость: {current['vis_km']} км\n"
-            f"🌅 Восход: {format_time(astronomy['sunrise'])}\n"
-            f"🌇 Закат: {format_time(astronomy['sunset'])}"
+        bundle, age = await get_weather_bundle(city_match)
+        await update.message.reply_text(
+            render_weather_view(view, city_match, bundle, age, lang),
+            reply_markup=weather_views_keyboard(city_match.key, view, lang)
         )
-        
-        # Добавляем прогноз на завтра
-        if 'error' not in forecast_data and 'forecast' in forecast_data:
-            forecast_days = forecast_data['forecast']['forecastday']
-            if len(forecast_days) > 1:
-                tomorrow = forecast_days[1]
-                tomorrow_astro = tomorrow['astro']
-                tomorrow_day = tomorrow['day']
-                
-                # Конвертируем давление для завтра
-                tomorrow_pressure_mmhg = hpa_to_mmhg(tomorrow_day['avgvis_km']) if tomorrow_day.get('avgvis_km') else hpa_to_mmhg(tomorrow_day.get('avghumidity', 1013))
-                
-                forecast_text = (
-                    f"\n\n📅 **ЗАВТРА** ({format_date(tomorrow['date'])})\n"
-                    f"🌡️ Макс: {tomorrow_day['maxtemp_c']}°C\n"
-                    f"🌡️ Мин: {tomorrow_day['mintemp_c']}°C\n"
-                    f"📝 {tomorrow_day['condition']['text']}\n"
-                    f"💧 Влажность: {tomorrow_day['avghumidity']}%\n"
-                    f"🌬️ Ветер: {tomorrow_day['maxwind_kph']} км/ч\n"
-                    f"🌧️ Вероятность дождя: {tomorrow_day['daily_chance_of_rain']}%\n"
-                    f"❄️ Вероятность снега: {tomorrow_day['daily_chance_of_snow']}%\n"
-                    f"🌅 Восход: {format_time(tomorrow_astro['sunrise'])}\n"
-                    f"🌇 Закат: {format_time(tomorrow_astro['sunset'])}"
-                )
-                weather_text += forecast_text
-        
-        # Пытаемся получить marine данные
-        try:
-            marine_url = "http://api.weatherapi.com/v1/marine.json"
-            marine_params = {
-                'key': WEATHER_API_KEY,
-                'q': city,
-                'days': 1
-            }
-            
-            print(f"Requesting marine data for: {city}")
-            marine_response = requests.get(marine_url, params=marine_params, timeout=5)
-            marine_data = marine_response.json()
-            
-            # Проверяем, нужно ли показывать данные о волнах
-            if should_show_marine_data(marine_data, city):
-                marine_forecast = marine_data['forecast']['forecastday'][0]
-                current_hour_data = marine_forecast['hour'][0]
-                wave_height_m = current_hour_data.get('sig_ht_mt', 0)
-                wave_period = current_hour_data.get('swell_period_secs', 0)
-                wave_direction = current_hour_data.get('swell_direction_deg', 0)
-                
-                wave_info = (
-                    f"\n\n🌊 **Морские условия:**\n"
-                    f"📏 Высота волн: {wave_height_m:.1f} м\n"
-                    f"⏱️ Период волн: {wave_period:.1f} сек\n"
-                    f"🧭 Направление: {wave_direction}°\n"
-                    f"📋 {get_wave_height_description(wave_height_m)}"
-                )
-                weather_text += wave_info
-            else:
-                print(f"Not showing marine data for {city}")
-            
-        except requests.exceptions.Timeout:
-            print(f"Marine API timeout for {city}")
-        except Exception as e:
-            print(f"Marine API error for {city}: {e}")
-        
-        await update.message.reply_text(weather_text)
             
+    except WeatherApiError as e:
+        await update.message.reply_text(f"❌ {e}")
     except requests.exceptions.Timeout:
         await update.message.reply_text("❌ Превышено время ожидания ответа от сервера погоды")
     except requests.exceptions.RequestException as e:
@@ -262,24 +398,293 @@ async def handle_city_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         print(f"Ошибка: {e}")  # Для отладки
         await update.message.reply_text("❌ Ошибка при получении погоды. Попробуйте другой город или позже.")
 
+async def handle_weather_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переключение представления кнопкой: данные берутся из кэша, без новых запросов"""
+    query = update.callback_query
+    await query.answer()
+    
+    _, view, city_key = query.data.split(':', 2)
+    city_match = resolve_place_key(city_key)
+    if view not in WEATHER_VIEWS or not city_match:
+        return
+    
+    try:
+        bundle, age = await get_weather_bundle(city_match)
+    except Exception as e:
+        print(f"❌ Нет данных для представления {view} по {city_key}: {e}")
+        await message_governor.reply(query.message, "❌ Ошибка при получении погоды. Попробуйте позже.")
+        return
+    
+    lang = user_language(query.from_user, context.user_data)
+    await message_governor.edit(
+        query,
+        render_weather_view(view, city_match, bundle, age, lang),
+        reply_markup=weather_views_keyboard(city_key, view, lang)
+    )
+
+def build_inline_article(city_match, bundle):
+    """Готовый результат inline-запроса; пересобирается только при новых данных"""
+    cached = inline_articles.get(city_match.key)
+    if cached and cached[0] is bundle:
+        return cached[1]
+    
+    current = bundle['current']['current']
+    article = InlineQueryResultArticle(
+        id=city_match.key,
+        title=f"{format_place_title(city_match, bundle)}: {current['temp_c']}°C",
+        description=f"{current['condition']['text']}, ветер {current['wind_kph']} км/ч",
+        input_message_content=InputTextMessageContent(format_weather(city_match, bundle)),
+    )
+    inline_articles[city_match.key] = (bundle, article)
+    return article
+
+def build_pending_article(city_match):
+    """Результат для места, данных которого еще нет в кэше"""
+    title = format_place_title(city_match)
+    return InlineQueryResultArticle(
+        id=city_match.key,
+        title=title,
+        description="⏳ Загружаем погоду, продолжите ввод или повторите запрос",
+        input_message_content=InputTextMessageContent(
+            f"🌍 {title}: спросите погоду у бота - просто напишите название города"
+        ),
+    )
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-запрос "@bot Париж": подсказки городов с погодой из кэша.
+    
+    Ответ строится без запросов к API; недостающие данные загружаются в фоне
+    только для набранного до конца запроса.
+    """
+    inline_query = update.inline_query
+    user_id = inline_query.from_user.id
+    inline_latest[user_id] = inline_query.id
+    
+    # Ждем паузы в наборе: если пришел новый запрос, этот уже не нужен
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if inline_latest.get(user_id) != inline_query.id:
+        return
+    inline_latest.pop(user_id, None)
+    
+    text = inline_query.query.strip()
+    if text:
+        cities = city_index.suggest(text, INLINE_SUGGESTIONS)
+        if not cities:
+            city_match = city_index.resolve(text)
+            cities = [city_match] if city_match else []
+    else:
+        cities = [city for city in map(resolve_place_key, popular_cities.top()[:INLINE_SUGGESTIONS]) if city]
+    
+    results = []
+    missing = []
+    oldest = 0
+    for city_match in cities:
+        bundle, age = weather_cache.lookup(city_match.key)
+        if bundle is None:
+            missing.append(city_match)
+            results.append(build_pending_article(city_match))
+        else:
+            oldest = max(oldest, age)
+            results.append(build_inline_article(city_match, bundle))
+    
+    if weather_client and missing:
+        # Загружаем в фоне только лучшее совпадение, остальные - по мере уточнения ввода
+        popular_cities.record(missing[0].key)
+        if missing[0].key not in weather_refreshes:
+            task = asyncio.create_task(refresh_weather(missing[0]))
+            task.add_done_callback(_log_background_refresh)
+    
+    try:
+        # Ответ одинаков для всех пользователей, поэтому Telegram может делить кэш
+        await inline_query.answer(
+            results,
+            cache_time=INLINE_MISS_CACHE_TIME if missing else int(min(INLINE_CACHE_TIME, max(INLINE_MISS_CACHE_TIME, WEATHER_TTL - oldest))),
+            is_personal=False,
+        )
+    except Exception as e:
+        # Запрос мог устареть, пока мы ждали паузы в наборе
+        print(f"⚠️ Не удалось ответить на inline-запрос: {e}")
+
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /subscribe <город> <ЧЧ:ММ>"""
+    if len(context.args) < 2:
+        await update.message.reply_text(
+            "📬 Формат: /subscribe Город ЧЧ:ММ\n"
+            "Например: /subscribe Москва 08:00"
+        )
+        return
+    
+    slot = parse_time(context.args[-1])
+    if not slot:
+        await update.message.reply_text("❌ Время укажите в формате ЧЧ:ММ, например 07:30")
+        return
+    
+    city = " ".join(context.args[:-1])
+    city_match = city_index.resolve(city)
+    if not city_match:
+        await update.message.reply_text(f"❌ Город «{city}» не найден.")
+        return
+    
+    lang = user_language(update.effective_user, context.user_data)
+    subscriptions.add(update.message.chat_id, city_match.key, slot, lang)
+    await update.message.reply_text(
+        f"✅ Подписка оформлена: {city_match.name_ru}, каждый день в {slot} ({SUBSCRIPTION_TZ.key})"
+    )
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /unsubscribe [город]"""
+    city_key = None
+    if context.args:
+        city_match = city_index.resolve(" ".join(context.args))
+        if not city_match:
+            await update.message.reply_text("❌ Город не найден.")
+            return
+        city_key = city_match.key
+    
+    removed = subscriptions.remove(update.message.chat_id, city_key)
+    if removed:
+        await update.message.reply_text(f"🗑️ Удалено подписок: {removed}")
+    else:
+        await update.message.reply_text("📭 Подписок не найдено")
+
+async def show_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /subscriptions"""
+    chat_subscriptions = subscriptions.for_chat(update.message.chat_id)
+    if not chat_subscriptions:
+        await update.message.reply_text("📭 У вас нет подписок.\nОформить: /subscribe Город ЧЧ:ММ")
+        return
+    
+    lines = ["📬 Ваши подписки:\n"]
+    for city_key, slot in sorted(chat_subscriptions.items(), key=lambda item: item[1]):
+        city_match = resolve_place_key(city_key)
+        lines.append(f"• {(city_match and city_match.name_ru) or city_key} - {slot}")
+    await update.message.reply_text("\n".join(lines))
+
+async def deliver_forecast(bot, chat_id, text):
+    """Отправляет прогноз подписчику; заблокировавших бота отписывает"""
+    try:
+        await message_governor.send(bot, chat_id, text)
+    except Forbidden:
+        print(f"📭 Чат {chat_id} заблокировал бота - удаляем подписки")
+        subscriptions.remove(chat_id)
+    except Exception as e:
+        print(f"❌ Не удалось отправить прогноз в чат {chat_id}: {e}")
+
+async def broadcast_slot(bot, slot):
+    """Рассылка одного слота: каждый город запрашивается один раз на всех подписчиков"""
+    due = subscriptions.due(slot)
+    if not due:
+        return
+    
+    print(f"📬 Рассылка {slot}: {len(due)} городов, {sum(len(chats) for chats in due.values())} подписчиков")
+    deliveries = []
+    for city_key, chats in due.items():
+        city_match = resolve_place_key(city_key)
+        if not city_match:
+            continue
+        try:
+            bundle, age = await get_weather_bundle(city_match)
+            if not weather_cache.is_fresh(age):
+                # Ежедневный прогноз не отправляем по старым данным, если их можно обновить
+                try:
+                    bundle, age = await refresh_weather(city_match), 0
+                except Exception as e:
+                    print(f"⚠️ Рассылка {city_key} по данным {int(age)} с назад: {e}")
+        except Exception as e:
+            print(f"❌ Нет данных для рассылки по {city_key}: {e}")
+            continue
+        # Текст собирается один раз на язык, а не на каждого подписчика
+        texts = {}
+        for chat_id, lang in chats.items():
+            if lang not in texts:
+                texts[lang] = WEATHER_MESSAGES.render('daily_title', lang) + format_weather(city_match, bundle, lang)
+                if not weather_cache.is_fresh(age):
+                    texts[lang] += WEATHER_MESSAGES.render('stale_daily', lang, age=format_age(age, lang))
+            deliveries.append(deliver_forecast(bot, chat_id, texts[lang]))
+    
+    # Отправка идет через общий планировщик с лимитами Telegram
+    await asyncio.gather(*deliveries)
+
+async def run_subscription_scheduler(application):
+    """Фоновая задача: раз в минуту запускает рассылку наступивших слотов.
+
+    Запоминается последняя обработанная минута по местным часам: ранний
+    запуск и перевод часов назад не повторяют слот, а минуты, пропущенные
+    из-за опоздания или перевода часов вперед, досылаются.
+    """
+    last_sent = datetime.now(SUBSCRIPTION_TZ)
+    while True:
+        now = datetime.now(SUBSCRIPTION_TZ)
+        # Спим до начала следующей минуты
+        await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000)
+        now = datetime.now(SUBSCRIPTION_TZ)
+        slots = slots_between(last_sent, now)
+        if not slots:
+            continue
+        last_sent = now
+        for slot in slots:
+            # Большая рассылка не должна задерживать следующий слот
+            task = asyncio.create_task(broadcast_slot(application.bot, slot))
+            application.bot_data.setdefault('broadcast_tasks', set()).add(task)
+            task.add_done_callback(application.bot_data['broadcast_tasks'].discard)
+
+async def prefetch_popular_cities():
+    """Фоновая задача: держит данные популярных городов свежими в кэше"""
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        for key in popular_cities.top():
+            age = weather_cache.age(key)
+            # Обновляем заранее, пока запись еще не истекла
+            if age is not None and age < WEATHER_TTL * PREFETCH_REFRESH_AT:
+                continue
+            city_match = resolve_place_key(key)
+            if not city_match:
+                continue
+            try:
+                await refresh_weather(city_match)
+                print(f"🔥 Прогрет кэш погоды: {city_match.name_ru}")
+            except Exception as e:
+                print(f"⚠️ Не удалось прогреть кэш для {key}: {e}")
+
+async def post_init(application):
+    """Запускает фоновые задачи после старта бота"""
+    if weather_client:
+        # Храним ссылку на задачу, чтобы ее не собрал сборщик мусора
+        application.bot_data['prefetch_task'] = asyncio.create_task(prefetch_popular_cities())
+        application.bot_data['subscription_task'] = asyncio.create_task(run_subscription_scheduler(application))
+
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN не найден!")
         return
     
-    if not WEATHER_API_KEY:
-        print("⚠️ WEATHER_API_KEY не найден. Бот будет работать без погоды.")
+    if not weather_client:
+        print("⚠️ Нет доступных провайдеров погоды (WEATHER_API_KEY / WEATHER_PROVIDERS). Бот будет работать без погоды.")
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
     
     # Обработчики команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("week", week_command))
+    application.add_handler(CommandHandler("lang", language_command))
+    application.add_handler(CommandHandler("subscribe", subscribe))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe))
+    application.add_handler(CommandHandler("subscriptions", show_subscriptions))
     
     # Обработчик текстовых сообщений (названия городов)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_city_message))
     
+    # Переключение представлений погоды
+    application.add_handler(CallbackQueryHandler(handle_weather_view, pattern=r'^wv:'))
+    
+    # Inline-запросы: без блокировки, чтобы пауза антидребезга не задерживала остальные обновления
+    application.add_handler(InlineQueryHandler(handle_inline_query, block=False))
+    
+    # Обработчик геопозиции
+    application.add_handler(MessageHandler(filters.LOCATION, handle_location_message))
+    
     print("🌤️ Бот погоды запущен!")
     application.run_polling()
 
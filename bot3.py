@@ -1,388 +1,39 @@
 import os
-import requests
+from telegram_sender import message_governor
+from product_cards import product_cards
+from callback_router import CallbackRouter
+from callback_codec import callback_payloads, product_token_decoder, expired_product_index
+from shop_core import ShopCatalog
+from order_store import OrderStore, orders_db_path
+from stock_ledger import stock_ledger
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 import asyncio
 
 # Токены
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
-OZON_API_KEY = os.environ.get('OZON_API_KEY')
-OZON_CLIENT_ID = os.environ.get('OZON_CLIENT_ID')
 
-# Кэш товаров
-products_cache = {}
+# Корзины: user_id -> {sku: количество} и версия каталога, в которой корзину начали
 user_carts = {}
-user_orders = {}
+cart_versions = {}
 current_product_index = {}
 
-class OzonSellerAPI:
-    def __init__(self):
-        self.headers = {
-            "Client-Id": OZON_CLIENT_ID,
-            "Api-Key": OZON_API_KEY,
-            "Content-Type": "application/json"
-        }
-    
-    def get_products_with_prices(self, limit=50):
-        """Получает реальные товары с реальными ценами из Ozon"""
-        print("🔄 Получение реальных товаров из Ozon API...")
-        
-        try:
-            # 1. Получаем список товаров через v2/product/list
-            print("🔍 Получаем список товаров через v2/product/list...")
-            list_response = requests.post(
-                "https://api-seller.ozon.ru/v3/product/list",
-                headers=self.headers,
-                json={
-                    "filter": {"visibility": "ALL"},
-                    "limit": limit
-                },
-                timeout=10
-            )
-            
-            if list_response.status_code != 200:
-                print(f"❌ Ошибка v2/product/list: {list_response.status_code}")
-                print(f"Текст ошибки: {list_response.text}")
-                return None
-            
-            list_data = list_response.json()
-            items = list_data.get('result', {}).get('items', [])
-            print(f"✅ Получено товаров: {len(items)}")
-            
-            if not items:
-                print("❌ Нет товаров в ответе")
-                return None
-            
-            # Получаем product_id для запроса описаний
-            product_ids = [item['product_id'] for item in items if 'product_id' in item]
-            print(f"🔍 Получено {len(product_ids)} product_id")
-            
-            # 2. Получаем описания товаров через v1/product/info/description
-            print("🔍 Получаем описания товаров через v1/product/info/description...")
-            descriptions_data = self._get_products_descriptions(product_ids)
-            
-            # 3. Получаем цены через v5/product/info/prices
-            print("🔍 Получаем цены через v5/product/info/prices...")
-            prices_data = self._get_products_prices(product_ids)
-            
-            # 4. Получаем остатки через v3/product/info/stocks
-            print("🔍 Получаем остатки через v3/product/info/stocks...")
-            stocks_data = self._get_products_stocks(product_ids)
-            
-            # Формируем итоговый список товаров
-            products = []
-            for item in items:
-                try:
-                    product_id = item.get('product_id')
-                    offer_id = item.get('offer_id')
-                    
-                    if not product_id:
-                        continue
-                    
-                    # Получаем описание из v1/product/info/description
-                    description_info = descriptions_data.get(product_id, {})
-                    name = description_info.get('name', offer_id or f"Товар {product_id}")
-                    description = description_info.get('description', '')
-                    
-                    # Если нет описания из v1, используем базовое
-                    if not description:
-                        description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-                    
-                    # Получаем цену
-                    price = self._extract_price(prices_data.get(product_id, {}))
-                    if price == 0:
-                        print(f"⚠️ Пропускаем товар без цены: {name}")
-                        continue
-                    
-                    # Получаем количество
-                    quantity = self._extract_quantity(stocks_data.get(product_id, {}))
-                    
-                    # Очищаем описание от HTML тегов и обрезаем
-                    description = self._clean_description(description)
-                    if len(description) > 150:
-                        description = description[:150] + "..."
-                    
-                    products.append({
-                        'product_id': product_id,
-                        'offer_id': offer_id,
-                        'name': name,
-                        'price': price,
-                        'description': description,
-                        'quantity': quantity
-                    })
-                    
-                    print(f"📦 {name} - {price} ₽ (Остаток: {quantity})")
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка обработки товара: {e}")
-                    continue
-            
-            print(f"✅ Обработано {len(products)} товаров с реальными ценами")
-            return products
-                
-        except Exception as e:
-            print(f"❌ Ошибка запроса к Ozon API: {e}")
-            return None
-    
-    def _get_products_descriptions(self, product_ids):
-        """Получает описания товаров через v1/product/info/description"""
-        descriptions_data = {}
-        try:
-            # Обрабатываем каждый product_id отдельно
-            for product_id in product_ids:
-                description_response = requests.post(
-                    "https://api-seller.ozon.ru/v1/product/info/description",
-                    headers=self.headers,
-                    json={"product_id": product_id},  # Отправляем один product_id
-                    timeout=10
-                )
-                
-                if description_response.status_code == 200:
-                    description_result = description_response.json().get('result', {})
-                    if description_result:
-                        descriptions_data[product_id] = {
-                            'name': description_result.get('name', ''),
-                            'description': description_result.get('description', '')
-                        }
-                        print(f"📝 Получено описание для товара {product_id}")
-                else:
-                    print(f"⚠️ Ошибка получения описания для {product_id}: {description_response.status_code}")
-            
-            print(f"📝 Всего получено описаний: {len(descriptions_data)}")
-            return descriptions_data
-            
-        except Exception as e:
-            print(f"❌ Ошибка получения описаний: {e}")
-            return {}
-    
-    def _get_products_prices(self, product_ids):
-        """Получает цены товаров через v4/product/info/prices"""
-        prices_data = {}
-        try:
-            # Разбиваем на группы по 50 product_id
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-                
-                prices_response = requests.post(
-                    "https://api-seller.ozon.ru/v5/product/info/prices",
-                    headers=self.headers,
-                    json={
-                        "filter": {
-                            "product_id": batch_ids,
-                            "visibility": "ALL"
-                        },
-                        "limit": 1000
-                    },
-                    timeout=10
-                )
-                
-                if prices_response.status_code == 200:
-                    prices_result = prices_response.json().get('result', {})
-                    price_items = prices_result.get('items', [])
-                    print(f"💰 Получены цены для {len(price_items)} товаров")
-                    
-                    for price_item in price_items:
-                        product_id = price_item.get('product_id')
-                        prices_data[product_id] = price_item
-                else:
-                    print(f"⚠️ Ошибка получения цен: {prices_response.status_code}")
-            
-            return prices_data
-            
-        except Exception as e:
-            print(f"❌ Ошибка получения цен: {e}")
-            return {}
-    
-    def _get_products_stocks(self, product_ids):
-        """Получает остатки товаров через v3/product/info/stocks"""
-        stocks_data = {}
-        try:
-            # Разбиваем на группы по 50 product_id
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-                
-                stocks_response = requests.post(
-                    "https://api-seller.ozon.ru/v3/product/info/stocks",
-                    headers=self.headers,
-                    json={
-                        "filter": {
-                            "product_id": batch_ids,
-                            "visibility": "ALL"
-                        },
-                        "limit": 1000
-                    },
-                    timeout=10
-                )
-                
-                if stocks_response.status_code == 200:
-                    stocks_result = stocks_response.json().get('result', {})
-                    stock_items = stocks_result.get('items', [])
-                    print(f"📦 Получены остатки для {len(stock_items)} товаров")
-                    
-                    for stock_item in stock_items:
-                        product_id = stock_item.get('product_id')
-                        stocks_data[product_id] = stock_item
-                else:
-                    print(f"⚠️ Ошибка получения остатков: {stocks_response.status_code}")
-            
-            return stocks_data
-            
-        except Exception as e:
-            print(f"❌ Ошибка получения остатков: {e}")
-            return {}
-    
-    def _extract_price(self, price_item):
-        """Извлекает цену из структуры цены"""
-        if not price_item:
-            return 0
-        
-        # Основная цена
-        price_info = price_item.get('price', '')
-        if isinstance(price_info, dict):
-            # Если цена вложенная структура
-            for key in ['price', 'value', 'amount']:
-                price = price_info.get(key)
-                if price and str(price).replace('.', '').isdigit():
-                    price_value = int(float(price))
-                    if price_value > 0:
-                        return price_value
-        elif price_info and str(price_info).replace('.', '').isdigit():
-            # Если цена прямое значение
-            price_value = int(float(price_info))
-            if price_value > 0:
-                return price_value
-        
-        # Альтернативные поля с ценой
-        alternative_prices = [
-            price_item.get('old_price'),
-            price_item.get('marketing_price'),
-            price_item.get('min_price'),
-        ]
-        
-        for price in alternative_prices:
-            if price and str(price).replace('.', '').isdigit():
-                price_value = int(float(price))
-                if price_value > 0:
-                    return price_value
-        
-        return 0
-    
-    def _extract_quantity(self, stock_item):
-        """Извлекает количество из структуры остатков"""
-        try:
-            if not stock_item:
-                return 10  # По умолчанию
-            
-            # Пробуем разные поля с количеством
-            stocks = stock_item.get('stocks', [])
-            if stocks:
-                total = 0
-                for stock in stocks:
-                    present = stock.get('present', 0)
-                    reserved = stock.get('reserved', 0)
-                    total += max(0, present - reserved)
-                if total > 0:
-                    return total
-            
-            # Прямые поля
-            quantity_fields = [
-                stock_item.get('stock'),
-                stock_item.get('fbo_stock'),
-                stock_item.get('fbs_stock'),
-            ]
-            
-            for quantity in quantity_fields:
-                if quantity and str(quantity).isdigit():
-                    quantity_value = int(quantity)
-                    if quantity_value > 0:
-                        return quantity_value
-            
-            return 10  # По умолчанию
-            
-        except Exception as e:
-            print(f"⚠️ Ошибка извлечения количества: {e}")
-            return 10
-    
-    def _clean_description(self, description):
-        """Очищает описание от HTML тегов"""
-        if not description:
-            return ""
-        
-        # Удаляем основные HTML теги
-        import re
-        clean_text = re.sub(r'<br\s*/?>', '\n', description)  # Заменяем <br> на переносы
-        clean_text = re.sub(r'<[^>]+>', '', clean_text)  # Удаляем все остальные теги
-        clean_text = re.sub(r'\n\s*\n', '\n', clean_text)  # Удаляем лишние переносы
-        clean_text = clean_text.strip()
-        
-        return clean_text
+# История заказов
+order_store = OrderStore(orders_db_path('bot3'))
 
-# Инициализация API
-ozon_api = OzonSellerAPI()
+# Каталог товаров Ozon
+catalog = ShopCatalog('stocks-v3')
 
 async def load_real_products():
-    """Загружает только реальные товары из Ozon API"""
-    global products_cache
-    
-    print("🔄 Загрузка реальных товаров из Ozon...")
-    
-    # Проверяем наличие API ключей
-    if not OZON_CLIENT_ID or not OZON_API_KEY:
-        print("❌ API ключи не настроены!")
-        products_cache = {}
-        return {}
-    
-    # Получаем реальные товары с реальными ценами
-    products_data = ozon_api.get_products_with_prices(limit=50)
-    
-    if not products_data:
-        print("❌ Не удалось получить реальные товары через Ozon API")
-        products_cache = {}
-        return {}
-    
-    products = {}
-    product_counter = 1
-    
-    # Обрабатываем только реальные товары
-    for item in products_data:
-        try:
-            product_id = item.get('product_id', '')
-            offer_id = item.get('offer_id', '')
-            name = item.get('name', '')
-            price = item.get('price', 0)
-            description = item.get('description', '')
-            quantity = item.get('quantity', 0)
-            
-            # Пропускаем товары без цены
-            if price == 0:
-                continue
-            
-            # Формируем описание
-            if not description:
-                description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-            
-            product_key = product_counter
-            
-            products[product_key] = {
-                'ozon_id': product_id,
-                'offer_id': offer_id,
-                'name': name,
-                'price': price,
-                'image': "📦",
-                'description': description,
-                'quantity': quantity
-            }
-            
-            print(f"✅ Товар {product_counter}: {name} - {price} ₽ (Остаток: {quantity})")
-            product_counter += 1
-            
-        except Exception as e:
-            print(f"❌ Ошибка обработки товара: {e}")
-            continue
-    
-    print(f"🎯 Загружено {len(products)} реальных товаров с реальными ценами из Ozon")
-    products_cache = products
-    return products
+    """Перезагружает каталог из Ozon, сверяет резервы и заранее рендерит карточки новой версии"""
+    previous = catalog.current
+    snapshot = await catalog.refresh()
+    if snapshot is not previous:
+        # Каждая новая версия каталога - свежие остатки Ozon с учетом резервов корзин
+        stock_ledger.reconcile_catalog(snapshot)
+    if snapshot.version != product_cards.version:
+        product_cards.prerender(snapshot.version, snapshot.products.keys(), lambda key: render_product_card(snapshot, key))
+    return snapshot.products
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -394,7 +45,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Добро пожаловать в Ozon Client Bot! 🛍️
 
 📊 Реальные товары из вашего Ozon магазина
-📦 Доступно товаров: {len(products_cache)}
+📦 Доступно товаров: {len(catalog.products)}
 
 Здесь вы можете:
 • 📦 Просматривать реальные товары
@@ -417,9 +68,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def refresh_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /refresh"""
     await update.message.reply_text("🔄 Обновляем список реальных товаров...")
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         await update.message.reply_text(
@@ -437,24 +88,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    callback_data = query.data
-    
-    if callback_data == "view_products":
-        await show_products(query, context)
-    elif callback_data == "view_cart":
-        await show_cart(query, context)
-    elif callback_data == "view_orders":
-        await show_orders(query, context)
-    elif callback_data == "refresh_products":
-        await refresh_products_callback(query, context)
-    elif callback_data.startswith("product_"):
-        await handle_product_action(query, context, callback_data)
-    elif callback_data.startswith("cart_"):
-        await handle_cart_action(query, context, callback_data)
+    # Маршрут выбирается по таблице callback_router (см. конец модуля)
+    await callback_router.dispatch(query.data, query, context)
 
 async def show_products(query, context):
     """Показывает список реальных товаров"""
-    if not products_cache:
+    if not catalog.products:
         await query.edit_message_text(
             "❌ Нет доступных товаров.\n"
             "Используйте /refresh для загрузки товаров из Ozon."
@@ -464,12 +103,10 @@ async def show_products(query, context):
     # Показываем первый товар
     await show_product_detail(query, context, 1)
 
-async def show_product_detail(query, context, product_index):
-    """Показывает детали реального товара"""
-    product = products_cache.get(product_index)
-    if not product:
-        await query.edit_message_text("❌ Товар не найден")
-        return
+def render_product_card(snapshot, product_index):
+    """Формирует текст и клавиатуру карточки товара из одного снимка каталога"""
+    product = snapshot.products[product_index]
+    payload = (product_index, product['ozon_id'])
     
     product_text = f"""
 📦 *{product['name']}*
@@ -483,53 +120,75 @@ async def show_product_detail(query, context, product_index):
     """
     
     keyboard = [
-        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"product_add_{product_index}")],
-        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=f"product_prev_{product_index}"),
-         InlineKeyboardButton("Следующий ➡️", callback_data=f"product_next_{product_index}")],
+        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=callback_payloads.encode("pa", payload, snapshot.version))],
+        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=callback_payloads.encode("pp", payload, snapshot.version)),
+         InlineKeyboardButton("Следующий ➡️", callback_data=callback_payloads.encode("pn", payload, snapshot.version))],
         [InlineKeyboardButton("📋 К списку товаров", callback_data="view_products"),
          InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return product_text, InlineKeyboardMarkup(keyboard)
+
+async def show_product_detail(query, context, product_index):
+    """Показывает детали реального товара"""
+    # Товар и версия карточки берутся из одного снимка, даже если каталог сейчас обновляется
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
+    if not product:
+        await query.edit_message_text("❌ Товар не найден")
+        return
     
-    await query.edit_message_text(product_text, reply_markup=reply_markup, parse_mode='Markdown')
+    # Карточка зависит только от товара и версии каталога - берем готовую
+    product_text, reply_markup = product_cards.get(
+        snapshot.version, product_index, lambda: render_product_card(snapshot, product_index)
+    )
+    
+    # Быстрые клики сводятся к последней правке с учетом лимитов Telegram
+    await message_governor.edit(query, product_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def handle_product_action(query, context, callback_data):
-    """Обрабатывает действия с товарами"""
-    parts = callback_data.split('_')
-    action = parts[1]
-    product_index = int(parts[2])
-    
-    if action == "add":
-        await add_to_cart(query, context, product_index)
-    elif action == "next":
-        next_index = product_index + 1
-        if next_index > len(products_cache):
-            next_index = 1
-        await show_product_detail(query, context, next_index)
-    elif action == "prev":
-        prev_index = product_index - 1
-        if prev_index < 1:
-            prev_index = len(products_cache)
-        await show_product_detail(query, context, prev_index)
+async def show_next_product(query, context, product_index):
+    """Показывает следующий товар (по кругу)"""
+    if product_index is None:
+        # Кнопка устарела и товара больше нет - начинаем с первого
+        await show_products(query, context)
+        return
+    next_index = product_index + 1
+    if next_index > len(catalog.products):
+        next_index = 1
+    await show_product_detail(query, context, next_index)
+
+async def show_prev_product(query, context, product_index):
+    """Показывает предыдущий товар (по кругу)"""
+    if product_index is None:
+        await show_products(query, context)
+        return
+    prev_index = product_index - 1
+    if prev_index < 1:
+        prev_index = len(catalog.products)
+    await show_product_detail(query, context, prev_index)
 
 async def add_to_cart(query, context, product_index):
     """Добавляет товар в корзину"""
     user_id = query.from_user.id
-    product = products_cache.get(product_index)
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
     
     if not product:
         await query.answer("❌ Товар не найден", show_alert=True)
         return
     
-    if user_id not in user_carts:
+    # Единица товара держится за покупателем, чтобы ее не купил другой
+    sku = snapshot.sku(product_index)
+    if not stock_ledger.reserve(sku, user_id):
+        await query.answer("❌ Товар закончился", show_alert=True)
+        return
+    
+    if not user_carts.get(user_id):
         user_carts[user_id] = {}
+        cart_versions[user_id] = snapshot.version
     
+    # Корзина хранит SKU: позиция товара меняется при обновлении каталога
     cart = user_carts[user_id]
-    
-    if product_index in cart:
-        cart[product_index] += 1
-    else:
-        cart[product_index] = 1
+    cart[sku] = cart.get(sku, 0) + 1
     
     await query.answer(f"✅ {product['name']} добавлен в корзину!")
     await show_product_detail(query, context, product_index)
@@ -546,8 +205,7 @@ async def show_cart(query, context):
     total = 0
     cart_text = "🛒 *Ваша корзина:*\n\n"
     
-    for product_index, quantity in cart.items():
-        product = products_cache.get(product_index)
+    for product, quantity in catalog.cart_items(cart, cart_versions.get(user_id)):
         if product:
             item_total = product['price'] * quantity
             total += item_total
@@ -564,19 +222,18 @@ async def show_cart(query, context):
     
     await query.edit_message_text(cart_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_orders(query, context):
-    """Показывает заказы пользователя"""
-    user_id = query.from_user.id
+async def show_orders(query, context, before=None):
+    """Показывает страницу истории заказов пользователя (от новых к старым)"""
+    orders, next_cursor = order_store.page(query.from_user.id, before)
     
-    if user_id not in user_orders or not user_orders[user_id]:
+    if not orders:
         await query.edit_message_text("📦 У вас пока нет заказов")
         return
     
-    orders = user_orders[user_id]
     orders_text = "📦 *Ваши заказы:*\n\n"
     
-    for i, order in enumerate(orders, 1):
-        orders_text += f"*Заказ #{i}:*\n"
+    for order in orders:
+        orders_text += f"*Заказ #{order['number']}:*\n"
         orders_text += f"💰 Сумма: {order['total']} ₽\n"
         orders_text += f"📅 Дата: {order['date']}\n"
         orders_text += f"📋 Товаров: {order['items_count']} шт.\n\n"
@@ -585,6 +242,10 @@ async def show_orders(query, context):
         [InlineKeyboardButton("🛍️ К товарам", callback_data="view_products")],
         [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")]
     ]
+    if next_cursor:
+        keyboard.insert(0, [InlineKeyboardButton("⬅️ Более ранние заказы", callback_data=f"orders_before_{next_cursor}")])
+    if before is not None:
+        keyboard.insert(0, [InlineKeyboardButton("⏮ Последние заказы", callback_data="view_orders")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(orders_text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -592,9 +253,9 @@ async def show_orders(query, context):
 async def refresh_products_callback(query, context):
     """Обновляет товары через callback"""
     await query.edit_message_text("🔄 Обновляем список реальных товаров...")
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         await query.edit_message_text(
@@ -607,13 +268,6 @@ async def refresh_products_callback(query, context):
             "Проверьте настройки API ключей Ozon."
         )
 
-async def handle_cart_action(query, context, callback_data):
-    """Обрабатывает действия с корзиной"""
-    if callback_data == "checkout":
-        await checkout(query, context)
-    elif callback_data == "clear_cart":
-        await clear_cart(query, context)
-
 async def checkout(query, context):
     """Оформляет заказ"""
     user_id = query.from_user.id
@@ -622,14 +276,28 @@ async def checkout(query, context):
         await query.answer("❌ Корзина пуста", show_alert=True)
         return
     
+    # Списываем резервы корзины; если резерв истек и товар уже купили - сообщаем
+    cart = user_carts[user_id]
+    missing = stock_ledger.commit(user_id, cart)
+    if missing:
+        names = "".join(
+            f"• {product['name']}\n"
+            for product, _ in catalog.cart_items(dict.fromkeys(missing, 0), cart_versions.get(user_id)) if product
+        )
+        keyboard = [[InlineKeyboardButton("🛒 Корзина", callback_data="view_cart"),
+                     InlineKeyboardButton("🗑️ Очистить корзину", callback_data="clear_cart")]]
+        await query.edit_message_text(
+            f"❌ Пока вы оформляли заказ, часть товаров закончилась:\n\n{names}\nИзмените корзину и попробуйте снова.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
     # Создаем заказ
     import datetime
-    cart = user_carts[user_id]
     total = 0
     items_count = 0
     
-    for product_index, quantity in cart.items():
-        product = products_cache.get(product_index)
+    for product, quantity in catalog.cart_items(cart, cart_versions.get(user_id)):
         if product:
             total += product['price'] * quantity
             items_count += quantity
@@ -641,11 +309,11 @@ async def checkout(query, context):
         'products': cart.copy()
     }
     
-    if user_id not in user_orders:
-        user_orders[user_id] = []
-    
-    user_orders[user_id].append(order)
+    order_store.add(user_id, order)
+    # Заказ не уходит в Ozon: продажа вычитается из его остатков SOLD_MEMORY
+    stock_ledger.mark_local(user_id, cart)
     user_carts[user_id] = {}  # Очищаем корзину
+    cart_versions.pop(user_id, None)
     
     await query.edit_message_text(
         f"✅ *Заказ оформлен!*\n\n"
@@ -659,18 +327,38 @@ async def checkout(query, context):
 async def clear_cart(query, context):
     """Очищает корзину"""
     user_id = query.from_user.id
+    stock_ledger.release_all(user_id, user_carts.get(user_id, {}))
     user_carts[user_id] = {}
+    cart_versions.pop(user_id, None)
     await query.edit_message_text("🗑️ Корзина очищена")
 
 async def preload_products():
     """Предзагрузка товаров при запуске"""
     print("🔄 Предзагрузка реальных товаров...")
     await load_real_products()
-    if products_cache:
-        print(f"✅ Загружено {len(products_cache)} реальных товаров")
+    if catalog.products:
+        print(f"✅ Загружено {len(catalog.products)} реальных товаров")
     else:
         print("❌ Не удалось загрузить реальные товары")
 
+# Таблица маршрутов callback-кнопок
+callback_router = CallbackRouter()
+decode_product_token = product_token_decoder(catalog)
+callback_router.route("view_products", show_products)
+callback_router.route("view_cart", show_cart)
+callback_router.route("view_orders", show_orders)
+callback_router.prefix("orders_before_", show_orders, int)
+callback_router.route("refresh_products", refresh_products_callback)
+callback_router.route("checkout", checkout)
+callback_router.route("clear_cart", clear_cart)
+callback_router.prefix("pa:", add_to_cart, decode_product_token)
+callback_router.prefix("pn:", show_next_product, decode_product_token)
+callback_router.prefix("pp:", show_prev_product, decode_product_token)
+# Кнопки в сообщениях, отправленных до перехода на токены
+callback_router.prefix("product_add_", add_to_cart, expired_product_index)
+callback_router.prefix("product_next_", show_next_product, expired_product_index)
+callback_router.prefix("product_prev_", show_prev_product, expired_product_index)
+
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
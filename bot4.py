@@ -1,6 +1,11 @@
 import os
-import requests
-import re
+from telegram_sender import message_governor
+from product_cards import product_cards
+from callback_router import CallbackRouter
+from callback_codec import callback_payloads, product_token_decoder, expired_product_index
+from shop_core import ShopCatalog
+from order_store import OrderStore, orders_db_path
+from stock_ledger import stock_ledger
 import asyncio
 import datetime
 import logging
@@ -16,341 +21,15 @@ logger = logging.getLogger(__name__)
 
 # Токены
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
-OZON_API_KEY = os.environ.get('OZON_API_KEY')
-OZON_CLIENT_ID = os.environ.get('OZON_CLIENT_ID')
 
 # Кэш товаров
-products_cache = {}
 current_product_index = {}
 
-class OzonSellerAPI:
-    def __init__(self):
-        self.headers = {
-            "Client-Id": OZON_CLIENT_ID,
-            "Api-Key": OZON_API_KEY,
-            "Content-Type": "application/json"
-        }
-    
-    def get_products_with_prices(self, limit=50):
-        """Получает реальные товары с реальными ценами из Ozon"""
-        logger.info("🔄 Получение реальных товаров из Ozon API...")
-        
-        try:
-            # 1. Получаем список товаров через v3/product/list
-            logger.info("🔍 Получаем список товаров через v3/product/list...")
-            list_response = requests.post(
-                "https://api-seller.ozon.ru/v3/product/list",
-                headers=self.headers,
-                json={
-                    "filter": {"visibility": "ALL"},
-                    "limit": limit
-                },
-                timeout=10
-            )
-        
-            if list_response.status_code != 200:
-                logger.error(f"❌ Ошибка v3/product/list: {list_response.status_code}")
-                logger.error(f"Текст ошибки: {list_response.text}")
-                return None
-        
-            list_data = list_response.json()
-            items = list_data.get('result', {}).get('items', [])
-            logger.info(f"✅ Получено товаров: {len(items)}")
-        
-            if not items:
-                logger.error("❌ Нет товаров в ответе")
-                return None
-            
-            # Получаем product_id для запроса описаний
-            product_ids = [item['product_id'] for item in items if 'product_id' in item]
-            logger.info(f"🔍 Получено {len(product_ids)} product_id")
-        
-            # 2. Получаем описания товаров через v1/product/info/description
-            logger.info("🔍 Получаем описания товаров через v1/product/info/description...")
-            descriptions_data = self._get_products_descriptions(product_ids)
-        
-            # 3. Получаем цены через v5/product/info/prices
-            logger.info("🔍 Получаем цены через v5/product/info/prices...")
-            prices_data = self._get_products_prices_v5(product_ids)
-        
-            # 4. Получаем остатки через v4/product/info/prices (альтернативный метод)
-            logger.info("🔍 Получаем остатки через альтернативный метод...")
-            s_data = self._get_products_stocks_alternative(product_ids)
-        
-            # Формируем итоговый список товаров
-            products = []
-            for item in items:
-                try:
-                    product_id = item.get('product_id')
-                    offer_id = item.get('offer_id')
-                
-                    if not product_id:
-                        continue
-                
-                    # Получаем описание из v1/product/info/description
-                    description_info = descriptions_data.get(product_id, {})
-                    name = description_info.get('name', offer_id or f"Товар {product_id}")
-                    description = description_info.get('description', '')
-                
-                    # Если нет описания из v1, используем базовое
-                    if not description:
-                        description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-                
-                    # Получаем цену из v5
-                    price = self._extract_price_from_v5(prices_data.get(product_id, {}))
-                    if price == 0:
-                        logger.warning(f"⚠️ Пропускаем товар без цены: {name}")
-                        continue
-                
-                    # Получаем количество
-                    quantity = self._extract_quantity(stocks_data.get(product_id, {}))
-                    logger.info(f"📦 Итоговое количество для {name}: {quantity}")
-                
-                    # Очищаем описание от HTML тегов и обрезаем
-                    description = self._clean_description(description)
-                    if len(description) > 150:
-                        description = description[:150] + "..."
-                
-                    products.append({
-                        'product_id': product_id,
-                        'offer_id': offer_id,
-                        'name': name,
-                        'price': price,
-                        'description': description,
-                        'quantity': quantity
-                    })
-                    
-                    logger.info(f"📦 {name} - {price} ₽ (Остаток: {quantity})")
-                
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки товара: {e}")
-                    continue
-        
-            logger.info(f"✅ Обработано {len(products)} товаров с реальными ценами")
-            return products
-            
-        except requests.exceptions.Timeout:
-            logger.error("❌ Таймаут подключения к Ozon API")
-            return None
-        except requests.exceptions.ConnectionError:
-            logger.error("❌ Ошибка подключения к Ozon API")
-            return None
-        except Exception as e:
-            logger.error(f"❌ Ошибка запроса к Ozon API: {e}")
-            return None
-    
-    def _get_products_descriptions(self, product_ids):
-        """Получает описания товаров через v1/product/info/description"""
-        descriptions_data = {}
-        
-        if not product_ids:
-            return descriptions_data
-            
-        try:
-            # Обрабатываем каждый product_id отдельно
-            for product_id in product_ids:
-                description_response = requests.post(
-                    "https://api-seller.ozon.ru/v1/product/info/description",
-                    headers=self.headers,
-                    json={"product_id": product_id},
-                    timeout=10
-                )
-                
-                if description_response.status_code == 200:
-                    description_result = description_response.json().get('result', {})
-                    if description_result:
-                        descriptions_data[product_id] = {
-                            'name': description_result.get('name', ''),
-                            'description': description_result.get('description', '')
-                        }
-                        logger.info(f"📝 Получено описание для товара {product_id}")
-                else:
-                    logger.warning(f"⚠️ Ошибка получения описания для {product_id}: {description_response.status_code}")
-            
-            logger.info(f"📝 Всего получено описаний: {len(descriptions_data)}")
-            return descriptions_data
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения описаний: {e}")
-            return {}
-    
-    def _get_products_prices_v5(self, product_ids):
-        """Получает цены товаров через v5/product/info/prices"""
-        prices_data = {}
-        
-        if not product_ids:
-            return prices_data
-            
-        try:
-            # Разбиваем на группы по 50 product_id
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-            
-                prices_response = requests.post(
-                    "https://api-seller.ozon.ru/v5/product/info/prices",
-                    headers=self.headers,
-                    json={
-                        "filter": {
-                            "product_id": batch_ids,
-                            "visibility": "ALL"
-                        },
-                        "last_id": "",
-                        "limit": 1000
-                    },
-                    timeout=10
-                )
-            
-                if prices_response.status_code == 200:
-                    prices_result = prices_response.json()
-                    # В v5 items находится в корне ответа
-                    price_items = prices_result.get('items', [])
-                    logger.info(f"💰 Получены цены для {len(price_items)} товаров")
-                
-                    for price_item in price_items:
-                        product_id = price_item.get('product_id')
-                        prices_data[product_id] = price_item
-                        
-                else:
-                    logger.error(f"❌ Ошибка получения цен v5: {prices_response.status_code}")
-                    logger.error(f"Текст ошибки: {prices_response.text}")
-        
-            return prices_data
-        
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения цен v5: {e}")
-            return {}
-    
-    def _extract_price_from_v5(self, price_item):
-        """Извлекает цену из структуры Ozon v5"""
-        if not price_item or not isinstance(price_item, dict):
-            return 0
-    
-        try:
-            # Прямой доступ к цене по структуре из вашего примера
-            price_info = price_item.get('price', {})
-            
-            if not isinstance(price_info, dict):
-                return 0
-        
-            # Основная цена
-            main_price = price_info.get('price')
-            if main_price:
-                price_int = int(float(main_price))
-                if price_int > 0:
-                    logger.info(f"✅ Найдена цена: {price_int} ₽")
-                    return price_int
-        
-            # Старая цена как запасной вариант
-            old_price = price_info.get('old_price')
-            if old_price:
-                price_int = int(float(old_price))
-                if price_int > 0:
-                    logger.info(f"✅ Найдена старая цена: {price_int} ₽")
-                    return price_int
-        
-            return 0
-        
-        except Exception as e:
-            logger.error(f"❌ Ошибка извлечения цены: {e}")
-            return 0
-
-    def _get_products_stocks_alternative(self, product_ids):
-        """Альтернативный метод получения остатков через v2/product/info/list"""
-        stocks_data = {}
-        
-        if not product_ids:
-            return stocks_data
-            
-        try:
-            # Используем v2/product/info/list который обычно работает
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-                
-                info_response = requests.post(
-                    "https://api-seller.ozon.ru/v2/products/stocks",
-                    headers=self.headers,
-                    json={"product_id": batch_ids},
-                    timeout=10
-                )
-                
-                if info_response.status_code == 200:
-                    info_result = info_response.json()
-                    items = info_result.get('result', {}).get('items', [])
-                    logger.info(f"📦 Получена информация для {len(items)} товаров через v2")
-                    
-                    for item in items:
-                        product_id = item.get('product_id')
-                        if product_id:
-                            # Получаем все возможные поля с остатками
-                            stock = item.get('stock', 0)
-                            fbo_stock = item.get('fbo_stock', 0)
-                            fbs_stock = item.get('fbs_stock', 0)
-                            
-                            # Логируем все значения
-                            logger.info(f"📊 Товар {product_id}: stock={stock}, fbo_stock={fbo_stock}, fbs_stock={fbs_stock}")
-                            
-                            # Выбираем наибольшее доступное количество
-                            available_stock = max(
-                                int(stock) if stock else 0,
-                                int(fbo_stock) if fbo_stock else 0, 
-                                int(fbs_stock) if fbs_stock else 0
-                            )
-                            
-                            stocks_data[product_id] = {
-                                'total_stock': available_stock,
-                                'stock': stock,
-                                'fbo_stock': fbo_stock,
-                                'fbs_stock': fbs_stock
-                            }
-                            
-                            logger.info(f"✅ Доступный остаток для {product_id}: {available_stock}")
-                else:
-                    logger.warning(f"⚠️ Ошибка получения информации v2: {info_response.status_code}")
-                    # Если v2 не работает, используем фиксированное значение
-                    for product_id in batch_ids:
-                        stocks_data[product_id] = {'total_stock': 10}
-            
-            return stocks_data
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения остатков v2: {e}")
-            # Возвращаем фиксированные значения при ошибке
-            for product_id in product_ids:
-                stocks_data[product_id] = {'total_stock': 10}
-            return stocks_data
-
-    def _extract_quantity(self, stock_item):
-        """Извлекает количество из структуры остатков"""
-        try:
-            if not stock_item:
-                logger.warning("⚠️ Нет данных об остатках, используем значение по умолчанию: 10")
-                return 10
-        
-            # Просто берем total_stock
-            total_stock = stock_item.get('total_stock', 10)
-            logger.info(f"📊 Извлекаем количество: {total_stock}")
-            
-            return max(1, total_stock)  # Минимум 1 товар
-        
-        except Exception as e:
-            logger.error(f"❌ Ошибка извлечения количества: {e}")
-            return 10
-
-    def _clean_description(self, description):
-        """Очищает описание от HTML тегов"""
-        if not description:
-            return ""
-        
-        # Удаляем основные HTML теги
-        clean_text = re.sub(r'<br\s*/?>', '\n', description)  # Заменяем <br> на переносы
-        clean_text = re.sub(r'<[^>]+>', '', clean_text)  # Удаляем все остальные теги
-        clean_text = re.sub(r'\n\s*\n', '\n', clean_text)  # Удаляем лишние переносы
-        clean_text = clean_text.strip()
-        
-        return clean_text
+# История заказов
+order_store = OrderStore(orders_db_path('bot4'))
 
-# Инициализация API
-ozon_api = OzonSellerAPI()
+# Каталог товаров Ozon
+catalog = ShopCatalog('stocks-v2')
 
 async def checkout(query, context):
     """Оформляет заказ и очищает корзину"""
@@ -361,20 +40,30 @@ async def checkout(query, context):
         await query.answer("❌ Корзина пуста", show_alert=True)
         return
     
+    # Списываем резервы корзины; если резерв истек и товар уже купили - сообщаем
+    missing = stock_ledger.commit(query.from_user.id, cart)
+    if missing:
+        names = "".join(
+            f"• {product['name']}\n"
+            for product, _ in catalog.cart_items(dict.fromkeys(missing, 0), context.user_data.get('cart_version')) if product
+        )
+        keyboard = [[InlineKeyboardButton("🛒 Корзина", callback_data="view_cart"),
+                     InlineKeyboardButton("🗑️ Очистить корзину", callback_data="clear_cart")]]
+        await query.edit_message_text(
+            f"❌ Пока вы оформляли заказ, часть товаров закончилась:\n\n{names}\nИзмените корзину и попробуйте снова.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
     # Считаем общую сумму и количество товаров
     total = 0
     items_count = 0
     
-    for product_index, quantity in cart.items():
-        product = products_cache.get(int(product_index))
+    for product, quantity in catalog.cart_items(cart, context.user_data.get('cart_version')):
         if product:
             total += product['price'] * quantity
             items_count += quantity
     
-    # Сохраняем заказ в историю
-    if 'orders' not in context.user_data:
-        context.user_data['orders'] = []
-    
     # Создаем новый заказ
     new_order = {
         'total': total,
@@ -384,10 +73,14 @@ async def checkout(query, context):
         'status': 'оформлен'
     }
     
-    context.user_data['orders'].append(new_order)
+    # Сохраняем заказ в историю
+    order_store.add(query.from_user.id, new_order)
+    # Заказ не уходит в Ozon: продажа вычитается из его остатков SOLD_MEMORY
+    stock_ledger.mark_local(query.from_user.id, cart)
     
     # ВАЖНО: Очищаем корзину
     context.user_data['cart'] = {}
+    context.user_data.pop('cart_version', None)
     
     # Показываем подтверждение заказа
     success_text = f"""
@@ -411,8 +104,10 @@ async def checkout(query, context):
 
 async def clear_cart(query, context):
     """Очищает корзину полностью"""
-    # Очищаем корзину в user_data
+    # Снимаем резервы и очищаем корзину в user_data
+    stock_ledger.release_all(query.from_user.id, context.user_data.get('cart', {}))
     context.user_data['cart'] = {}
+    context.user_data.pop('cart_version', None)
     
     # Показываем подтверждение очистки
     keyboard = [
@@ -427,9 +122,9 @@ async def refresh_products_callback(query, context):
     await query.edit_message_text("🔄 Обновляем список товаров...")
     
     # Загружаем актуальные товары
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         success_text = f"""
@@ -468,76 +163,16 @@ async def refresh_products_callback(query, context):
         
         await query.edit_message_text(error_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def handle_cart_action(query, context, callback_data):
-    """Обрабатывает действия с корзиной"""
-    if callback_data == "checkout":
-        await checkout(query, context)
-    elif callback_data == "clear_cart":
-        await clear_cart(query, context)
-
 async def load_real_products():
-    """Загружает только реальные товары из Ozon API"""
-    global products_cache
-    
-    logger.info("🔄 Загрузка реальных товаров из Ozon...")
-    
-    # Проверяем наличие API ключей
-    if not OZON_CLIENT_ID or not OZON_API_KEY:
-        logger.error("❌ API ключи не настроены!")
-        products_cache = {}
-        return {}
-    
-    # Получаем реальные товары с реальными ценами
-    products_data = ozon_api.get_products_with_prices(limit=50)
-    
-    if not products_data:
-        logger.error("❌ Не удалось получить реальные товары через Ozon API")
-        products_cache = {}
-        return {}
-    
-    products = {}
-    product_counter = 1
-    
-    # Обрабатываем только реальные товары
-    for item in products_data:
-        try:
-            product_id = item.get('product_id', '')
-            offer_id = item.get('offer_id', '')
-            name = item.get('name', '')
-            price = item.get('price', 0)
-            description = item.get('description', '')
-            quantity = item.get('quantity', 0)
-            
-            # Пропускаем товары без цены
-            if price == 0:
-                continue
-            
-            # Формируем описание
-            if not description:
-                description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-            
-            product_key = product_counter
-            
-            products[product_key] = {
-                'ozon_id': product_id,
-                'offer_id': offer_id,
-                'name': name,
-                'price': price,
-                'image': "📦",
-                'description': description,
-                'quantity': quantity
-            }
-            
-            logger.info(f"✅ Товар {product_counter}: {name} - {price} ₽ (Остаток: {quantity})")
-            product_counter += 1
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки товара: {e}")
-            continue
-    
-    logger.info(f"🎯 Загружено {len(products)} реальных товаров с реальными ценами из Ozon")
-    products_cache = products
-    return products
+    """Перезагружает каталог из Ozon, сверяет резервы и заранее рендерит карточки новой версии"""
+    previous = catalog.current
+    snapshot = await catalog.refresh()
+    if snapshot is not previous:
+        # Каждая новая версия каталога - свежие остатки Ozon с учетом резервов корзин
+        stock_ledger.reconcile_catalog(snapshot)
+    if snapshot.version != product_cards.version:
+        product_cards.prerender(snapshot.version, snapshot.products.keys(), lambda key: render_product_card(snapshot, key))
+    return snapshot.products
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -549,7 +184,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Добро пожаловать в Ozon Client Bot! 🛍️
 
 📊 Реальные товары из вашего Ozon магазина
-📦 Доступно товаров: {len(products_cache)}
+📦 Доступно товаров: {len(catalog.products)}
 
 Здесь вы можете:
 • 📦 Просматривать реальные товары
@@ -574,9 +209,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def refresh_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /refresh"""
     await update.message.reply_text("🔄 Обновляем список реальных товаров...")
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         await update.message.reply_text(
@@ -594,28 +229,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    callback_data = query.data
-    
-    if callback_data == "view_products":
-        await show_products(query, context)
-    elif callback_data == "view_cart":
-        await show_cart(query, context)
-    elif callback_data == "view_orders":
-        await show_orders(query, context)
-    elif callback_data == "refresh_products":
-        await refresh_products_callback(query, context)
-    elif callback_data == "checkout":
-        await checkout(query, context)
-    elif callback_data == "clear_cart":
-        await clear_cart(query, context)    
-    elif callback_data.startswith("product_"):
-        await handle_product_action(query, context, callback_data)
-    elif callback_data.startswith("cart_"):
-        await handle_cart_action(query, context, callback_data)
+    # Маршрут выбирается по таблице callback_router (см. конец модуля)
+    await callback_router.dispatch(query.data, query, context)
 
 async def show_products(query, context):
     """Показывает список реальных товаров"""
-    if not products_cache:
+    if not catalog.products:
         await query.edit_message_text(
             "❌ Нет доступных товаров.\n"
             "Используйте /refresh для загрузки товаров из Ozon."
@@ -625,12 +244,10 @@ async def show_products(query, context):
     # Показываем первый товар
     await show_product_detail(query, context, 1)
 
-async def show_product_detail(query, context, product_index):
-    """Показывает детали реального товара"""
-    product = products_cache.get(product_index)
-    if not product:
-        await query.edit_message_text("❌ Товар не найден")
-        return
+def render_product_card(snapshot, product_index):
+    """Формирует текст и клавиатуру карточки товара из одного снимка каталога"""
+    product = snapshot.products[product_index]
+    payload = (product_index, product['ozon_id'])
     
     product_text = f"""
 📦 *{product['name']}*
@@ -644,39 +261,51 @@ async def show_product_detail(query, context, product_index):
     """
     
     keyboard = [
-        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"product_add_{product_index}")],
-        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=f"product_prev_{product_index}"),
-         InlineKeyboardButton("Следующий ➡️", callback_data=f"product_next_{product_index}")],
+        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=callback_payloads.encode("pa", payload, snapshot.version))],
+        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=callback_payloads.encode("pp", payload, snapshot.version)),
+         InlineKeyboardButton("Следующий ➡️", callback_data=callback_payloads.encode("pn", payload, snapshot.version))],
         [InlineKeyboardButton("📋 К списку товаров", callback_data="view_products"),
          InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")]       
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return product_text, InlineKeyboardMarkup(keyboard)
+
+async def show_product_detail(query, context, product_index):
+    """Показывает детали реального товара"""
+    # Товар и версия карточки берутся из одного снимка, даже если каталог сейчас обновляется
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
+    if not product:
+        await query.edit_message_text("❌ Товар не найден")
+        return
     
-    try:
-        await query.edit_message_text(product_text, reply_markup=reply_markup, parse_mode='Markdown')
-    except Exception as e:
-        # Игнорируем ошибку "Message is not modified"
-        if "Message is not modified" not in str(e):
-            raise e
-
-async def handle_product_action(query, context, callback_data):
-    """Обрабатывает действия с товарами"""
-    parts = callback_data.split('_')
-    action = parts[1]
-    product_index = int(parts[2])
-    
-    if action == "add":
-        await add_to_cart(query, context, product_index)
-    elif action == "next":
-        next_index = product_index + 1
-        if next_index > len(products_cache):
-            next_index = 1
-        await show_product_detail(query, context, next_index)
-    elif action == "prev":
-        prev_index = product_index - 1
-        if prev_index < 1:
-            prev_index = len(products_cache)
-        await show_product_detail(query, context, prev_index)
+    # Карточка зависит только от товара и версии каталога - берем готовую
+    product_text, reply_markup = product_cards.get(
+        snapshot.version, product_index, lambda: render_product_card(snapshot, product_index)
+    )
+    
+    # Быстрые клики сводятся к последней правке, "Message is not modified" игнорируется
+    await message_governor.edit(query, product_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def show_next_product(query, context, product_index):
+    """Показывает следующий товар (по кругу)"""
+    if product_index is None:
+        # Кнопка устарела и товара больше нет - начинаем с первого
+        await show_products(query, context)
+        return
+    next_index = product_index + 1
+    if next_index > len(catalog.products):
+        next_index = 1
+    await show_product_detail(query, context, next_index)
+
+async def show_prev_product(query, context, product_index):
+    """Показывает предыдущий товар (по кругу)"""
+    if product_index is None:
+        await show_products(query, context)
+        return
+    prev_index = product_index - 1
+    if prev_index < 1:
+        prev_index = len(catalog.products)
+    await show_product_detail(query, context, prev_index)
 
 async def add_to_cart(query, context, product_index):
     """Добавляет товар в корзину"""
@@ -685,16 +314,23 @@ async def add_to_cart(query, context, product_index):
         context.user_data['cart'] = {}
     
     cart = context.user_data['cart']
-    product = products_cache.get(product_index)
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
     
     if not product:
         await query.answer("❌ Товар не найден", show_alert=True)
         return
     
-    if str(product_index) in cart:
-        cart[str(product_index)] += 1
-    else:
-        cart[str(product_index)] = 1
+    # Единица товара держится за покупателем, чтобы ее не купил другой
+    sku = snapshot.sku(product_index)
+    if not stock_ledger.reserve(sku, query.from_user.id):
+        await query.answer("❌ Товар закончился", show_alert=True)
+        return
+    
+    # Корзина хранит SKU и считается по версии каталога, в которой ее начали
+    if not cart:
+        context.user_data['cart_version'] = snapshot.version
+    cart[sku] = cart.get(sku, 0) + 1
     
     product_name = product['name']
     if len(product_name) > 100:
@@ -721,8 +357,7 @@ async def show_cart(query, context):
     total = 0
     cart_text = "🛒 *Ваша корзина:*\n\n"
     
-    for product_index, quantity in cart.items():
-        product = products_cache.get(int(product_index))
+    for product, quantity in catalog.cart_items(cart, context.user_data.get('cart_version')):
         if product:
             item_total = product['price'] * quantity
             total += item_total
@@ -742,10 +377,9 @@ async def show_cart(query, context):
     
     await query.edit_message_text(cart_text, reply_markup=reply_markup, parse_mode='Markdown')      
 
-async def show_orders(query, context):
-    """Показывает заказы пользователя"""
-    # Получаем заказы из user_data
-    orders = context.user_data.get('orders', [])
+async def show_orders(query, context, before=None):
+    """Показывает страницу истории заказов пользователя (от новых к старым)"""
+    orders, next_cursor = order_store.page(query.from_user.id, before)
     
     if not orders:
         orders_text = "📦 *У вас пока нет заказов*"
@@ -760,8 +394,8 @@ async def show_orders(query, context):
     
     orders_text = "📦 *История ваших заказов:*\n\n"
     
-    for i, order in enumerate(orders, 1):
-        orders_text += f"*Заказ #{i}:*\n"
+    for order in orders:
+        orders_text += f"*Заказ #{order['number']}:*\n"
         orders_text += f"💰 Сумма: {order['total']} ₽\n"
         orders_text += f"📅 Дата: {order['created_at']}\n"
         orders_text += f"📦 Товаров: {order['items_count']} шт.\n"
@@ -777,6 +411,10 @@ async def show_orders(query, context):
         [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")],
         [InlineKeyboardButton("🛍️ К товарам", callback_data="view_products")]
     ]
+    if next_cursor:
+        keyboard.insert(0, [InlineKeyboardButton("⬅️ Более ранние заказы", callback_data=f"orders_before_{next_cursor}")])
+    if before is not None:
+        keyboard.insert(0, [InlineKeyboardButton("⏮ Последние заказы", callback_data="view_orders")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(orders_text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -785,11 +423,29 @@ async def preload_products():
     """Предзагрузка товаров при запуске"""
     logger.info("🔄 Предзагрузка реальных товаров...")
     await load_real_products()
-    if products_cache:
-        logger.info(f"✅ Загружено {len(products_cache)} реальных товаров")
+    if catalog.products:
+        logger.info(f"✅ Загружено {len(catalog.products)} реальных товаров")
     else:
         logger.error("❌ Не удалось загрузить реальные товары")
 
+# Таблица маршрутов callback-кнопок
+callback_router = CallbackRouter()
+decode_product_token = product_token_decoder(catalog)
+callback_router.route("view_products", show_products)
+callback_router.route("view_cart", show_cart)
+callback_router.route("view_orders", show_orders)
+callback_router.prefix("orders_before_", show_orders, int)
+callback_router.route("refresh_products", refresh_products_callback)
+callback_router.route("checkout", checkout)
+callback_router.route("clear_cart", clear_cart)
+callback_router.prefix("pa:", add_to_cart, decode_product_token)
+callback_router.prefix("pn:", show_next_product, decode_product_token)
+callback_router.prefix("pp:", show_prev_product, decode_product_token)
+# Кнопки в сообщениях, отправленных до перехода на токены
+callback_router.prefix("product_add_", add_to_cart, expired_product_index)
+callback_router.prefix("product_next_", show_next_product, expired_product_index)
+callback_router.prefix("product_prev_", show_prev_product, expired_product_index)
+
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
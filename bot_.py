@@ -1,236 +1,22 @@
 import os
-import requests
+from telegram_sender import message_governor
+from product_cards import product_cards
+from callback_router import CallbackRouter
+from callback_codec import callback_payloads, product_token_decoder, expired_product_index
+from shop_core import ShopCatalog
+from order_store import OrderStore, orders_db_path
+from stock_ledger import stock_ledger
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 
 # Токены
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
-OZON_API_KEY = os.environ.get('OZON_API_KEY')
-OZON_CLIENT_ID = os.environ.get('OZON_CLIENT_ID')
 
-# Кэш товаров
-products_cache = {}
+# Корзины: user_id -> {sku: количество} и версия каталога, в которой корзину начали
 user_carts = {}
-user_orders = {}
+cart_versions = {}
 current_product_index = {}
 
-class OzonSellerAPI:
-    def __init__(self):
-        self.headers = {
-            "Client-Id": OZON_CLIENT_ID,
-            "Api-Key": OZON_API_KEY,
-            "Content-Type": "application/json"
-        }
-    
-    def get_products_with_prices(self, limit=20):
-        """Получает товары с реальными ценами и названиями"""
-        print("🔄 Получение товаров через v3/product/list...")
-        
-        try:
-            # Получаем список товаров через v3/product/list
-            products_response = requests.post(
-                "https://api-seller.ozon.ru/v3/product/list",
-                headers=self.headers,
-                json={"filter": {}, "limit": limit, "sort_dir": "ASC"},
-                timeout=10
-            )
-            
-            if products_response.status_code != 200:
-                print(f"❌ Ошибка v3/product/list: {products_response.status_code}")
-                print(f"Текст ошибки: {products_response.text}")
-                return None
-            
-            products_data = products_response.json()
-            items = products_data.get('result', {}).get('items', [])
-            print(f"✅ Получено товаров: {len(items)}")
-            
-            if not items:
-                print("❌ Нет товаров в ответе")
-                return None
-            
-            # Получаем ID товаров для запроса полной информации
-            product_ids = []
-            for item in items:
-                product_id = item.get('product_id')
-                if product_id:
-                    product_ids.append(product_id)
-            
-            print(f"🔍 Запрашиваем полную информацию для {len(product_ids)} товаров через v3/product/info/list...")
-            
-            # Получаем полную информацию о товарах через v3 endpoint
-            products_info = self.get_products_info_v3(product_ids)
-            
-            print(f"🔍 Запрашиваем цены для {len(product_ids)} товаров через v5/product/info/prices...")
-            
-            # Получаем цены товаров через v5 endpoint
-            prices_map = self.get_prices_v5(product_ids)
-            
-            # Объединяем данные товаров и цен
-            enhanced_products = []
-            for product_info in products_info:
-                product_id = product_info.get('id')
-                offer_id = product_info.get('offer_id')
-                name = product_info.get('name')
-                
-                # Проверяем наличие названия и offer_id
-                if not name:
-                    print(f"⚠️ Пропускаем товар без названия: ID={product_id}, Offer={offer_id}")
-                    continue
-                
-                if not offer_id:
-                    print(f"⚠️ Пропускаем товар без offer_id: ID={product_id}, Name='{name}'")
-                    continue
-                
-                price_value = prices_map.get(str(product_id), 0)
-                
-                # Пропускаем товары без цены
-                if price_value == 0:
-                    print(f"⚠️ Пропускаем товар без цены: {name} (ID: {product_id})")
-                    continue
-                
-                description = product_info.get('description', f'Артикул: {offer_id}')
-                if description and len(description) > 150:
-                    description = description[:150] + "..."
-                
-                # Получаем количество из stocks
-                quantity = 0
-                stocks = product_info.get('stocks', {}).get('stocks', [])
-                if stocks:
-                    quantity = sum(stock.get('present', 0) for stock in stocks)
-                
-                enhanced_product = {
-                    'product_id': product_id,
-                    'offer_id': offer_id,
-                    'name': name,
-                    'price': price_value,
-                    'description': description,
-                    'quantity': quantity
-                }
-                enhanced_products.append(enhanced_product)
-                print(f"📦 Товар с ценой: {name} - {price_value} ₽ (В наличии: {quantity} шт.)")
-            
-            print(f"✅ Обработано {len(enhanced_products)} товаров с ценами")
-            return enhanced_products
-                
-        except Exception as e:
-            print(f"❌ Ошибка запроса к Ozon API: {e}")
-            return None
-    
-    def get_products_info_v3(self, product_ids):
-        """Получает полную информацию о товарах через v3/product/info/list"""
-        print("🔍 Используем v3/product/info/list...")
-        try:
-            info_response = requests.post(
-                "https://api-seller.ozon.ru/v3/product/info/list",
-                headers=self.headers,
-                json={
-                    "product_id": product_ids
-                },
-                timeout=10
-            )
-            
-            if info_response.status_code == 200:
-                info_data = info_response.json()
-                info_items = info_data.get('result', {}).get('items', [])
-                print(f"📊 v3/info: Получена информация для {len(info_items)} товаров")
-                
-                # Детальная информация о каждом товаре
-                print("🔍 Детальная информация о товарах из v3:")
-                for i, item in enumerate(info_items):
-                    product_id = item.get('id')
-                    offer_id = item.get('offer_id')
-                    name = item.get('name')
-                    print(f"  Товар {i+1}: ID={product_id}, Offer={offer_id}, Name='{name}'")
-                
-                return info_items
-            else:
-                print(f"❌ v3/info endpoint ошибка: {info_response.status_code}")
-                print(f"Текст ошибки: {info_response.text}")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Ошибка v3/info endpoint: {e}")
-            return []
-    
-    def get_prices_v5(self, product_ids):
-        """Получает цены через v5/product/info/prices"""
-        print("🔍 Используем v5/product/info/prices...")
-        try:
-            prices_response = requests.post(
-                "https://api-seller.ozon.ru/v5/product/info/prices",
-                headers=self.headers,
-                json={
-                    "filter": {
-                        "product_id": product_ids,
-                        "visibility": "ALL"
-                    },
-                    "last_id": "",
-                    "limit": 1000
-                },
-                timeout=10
-            )
-            
-            if prices_response.status_code == 200:
-                prices_data = prices_response.json()
-                price_items = prices_data.get('items', [])
-                print(f"📊 v5: Получены цены для {len(price_items)} товаров")
-                
-                prices_map = {}
-                for price_item in price_items:
-                    product_id = price_item.get('product_id')
-                    price_info = price_item.get('price', {})
-                    
-                    # Извлекаем цену из структуры
-                    price_value = self.extract_price_from_structure(price_info)
-                    
-                    if product_id and price_value > 0:
-                        prices_map[str(product_id)] = price_value
-                        print(f"💰 Цена для {product_id}: {price_value} ₽")
-                    else:
-                        print(f"⚠️ Некорректная цена для товара {product_id}: {price_value}")
-                
-                return prices_map
-            else:
-                print(f"❌ v5 endpoint ошибка: {prices_response.status_code}")
-                print(f"Текст ошибки: {prices_response.text}")
-                return {}
-                
-        except Exception as e:
-            print(f"❌ Ошибка v5 endpoint: {e}")
-            return {}
-    
-    def extract_price_from_structure(self, price_info):
-        """Извлечение цены из структуры Ozon v5"""
-        if not price_info:
-            return 0
-        
-        # Приоритеты извлечения цены из структуры v5:
-        # 1. Основная цена (price)
-        # 2. Старая цена (old_price) 
-        # 3. Маркетинговая цена (marketing_price)
-        # 4. Минимальная цена (min_price)
-        
-        price = price_info.get('price')
-        if price and price > 0:
-            return price
-        
-        old_price = price_info.get('old_price')
-        if old_price and old_price > 0:
-            return old_price
-        
-        marketing_price = price_info.get('marketing_price')
-        if marketing_price and marketing_price > 0:
-            return marketing_price
-        
-        min_price = price_info.get('min_price')
-        if min_price and min_price > 0:
-            return min_price
-        
-        return 0
-
-# Инициализация API
-ozon_api = OzonSellerAPI()
-
 def create_demo_products():
     """Создает демо-товары для тестирования"""
     return {
@@ -240,78 +26,22 @@ def create_demo_products():
         4: {"name": "Кроссовки Nike", "price": 8999, "image": "👟", "description": "Спортивные кроссовки", "quantity": 8},
     }
 
+# История заказов
+order_store = OrderStore(orders_db_path('bot'))
+
+# Каталог товаров Ozon; если Ozon недоступен - демо-товары
+catalog = ShopCatalog('info-v3', limit=20, fallback=create_demo_products)
+
 async def load_real_products():
-    """Загружает реальные товары с ценами и названиями из Ozon API"""
-    global products_cache
-    
-    print("🔄 Загрузка товаров из Ozon...")
-    
-    # Проверяем наличие API ключей
-    if not OZON_CLIENT_ID or not OZON_API_KEY:
-        print("❌ API ключи не настроены!")
-        products_cache = {}
-        return {}
-    
-    # Получаем товары с реальными ценами и названиями
-    products_data = ozon_api.get_products_with_prices(limit=20)
-    
-    if not products_data:
-        print("❌ Не удалось получить товары через Ozon API")
-        
-        # Создаем демо-товары для тестирования бота
-        print("⚠️ Создаем демо-товары для тестирования...")
-        demo_products = create_demo_products()
-        products_cache = demo_products
-        return demo_products
-    
-    products = {}
-    product_counter = 1
-    
-    # Обрабатываем товары
-    for item in products_data:
-        try:
-            product_id = item.get('product_id', '')
-            offer_id = item.get('offer_id', '')
-            name = item.get('name', f'Товар {offer_id}')
-            price = item.get('price', 0)
-            description = item.get('description', '')
-            quantity = item.get('quantity', 0)
-            
-            # Пропускаем товары без цены или названия
-            if price == 0 or not name:
-                print(f"⚠️ Пропускаем товар без цены или названия: {name}")
-                continue
-            
-            # Формируем описание
-            if description:
-                # Обрезаем длинное описание
-                if len(description) > 150:
-                    description = description[:150] + "..."
-            else:
-                description = f"Артикул: {offer_id}"
-            
-            product_key = product_counter
-            
-            products[product_key] = {
-                'ozon_id': product_id,
-                'offer_id': offer_id,
-                'name': name,
-                'price': price,
-                'image': "📦",
-                'description': description,
-                'quantity': quantity
-            }
-            
-            print(f"📦 Товар {product_counter}: {name} - {price} ₽")
-            product_counter += 1
-            
-        except Exception as e:
-            print(f"❌ Ошибка обработки товара: {e}")
-            continue
-    
-    print(f"✅ Загружено {len(products)} товаров с реальными ценами и названиями из Ozon")
-    products_cache = products
-    return products
+    """Перезагружает каталог из Ozon, сверяет резервы и заранее рендерит карточки новой версии"""
+    previous = catalog.current
+    snapshot = await catalog.refresh()
+    if snapshot is not previous:
+        # Каждая новая версия каталога - свежие остатки Ozon с учетом резервов корзин
+        stock_ledger.reconcile_catalog(snapshot)
+    if snapshot.version != product_cards.version:
+        product_cards.prerender(snapshot.version, range(len(snapshot)), lambda index: render_product_card(snapshot, index))
+    return snapshot.products
 
 # ... остальные функции бота остаются без изменений ...
 
@@ -329,11 +59,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Загружаем товары при старте
-    if not products_cache:
+    if not catalog.products:
         await load_real_products()
     
     # Проверяем есть ли товары
-    if not products_cache:
+    if not catalog.products:
         keyboard = [
             [InlineKeyboardButton("🔄 Попробовать снова", callback_data="refresh_products")],
             [InlineKeyboardButton("📞 Поддержка", callback_data="support")]
@@ -370,7 +100,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = (
         f"👋 Привет, {user.first_name}!\n\n"
         "🏪 *Добро пожаловать в наш Ozon магазин!*\n\n"
-        f"📦 *Доступно товаров:* {len(products_cache)}\n"
+        f"📦 *Доступно товаров:* {len(catalog.products)}\n"
         "🛒 Делайте заказы прямо в Telegram!\n\n"
         "Нажмите 'Смотреть товары' чтобы начать покупки:"
     )
@@ -389,11 +119,11 @@ async def view_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer()
     
     # Если товаров нет - загружаем
-    if not products_cache:
+    if not catalog.products:
         await load_real_products()
     
     # Проверяем есть ли товары после загрузки
-    if not products_cache:
+    if not catalog.products:
         if query:
             await query.edit_message_text(
                 "❌ Товары временно недоступны\nПопробуйте обновить позже.",
@@ -412,36 +142,11 @@ async def view_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     current_product_index[user_id] = 0
     await show_product(update, context, user_id)
 
-async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int = None, force_update: bool = False):
-    """Показывает текущий товар с реальными данными"""
-    if not user_id:
-        if update.callback_query:
-            user_id = update.callback_query.from_user.id
-        else:
-            user_id = update.message.from_user.id
-    
-    if user_id not in current_product_index:
-        current_product_index[user_id] = 0
-    
-    product_ids = list(products_cache.keys())
-    
-    if not product_ids:
-        # Используем reply_text вместо edit_message_text для нового сообщения
-        if update.callback_query:
-            await update.callback_query.message.reply_text(
-                "❌ Товары временно недоступны",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Обновить", callback_data="refresh_products")]])
-            )
-        else:
-            await update.message.reply_text(
-                "❌ Товары временно недоступны",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Обновить", callback_data="refresh_products")]])
-            )
-        return
-    
-    current_index = current_product_index[user_id]
+def render_product_card(snapshot, current_index):
+    """Формирует текст и клавиатуру карточки товара по его позиции в снимке каталога"""
+    product_ids = list(snapshot.products.keys())
     product_id = product_ids[current_index]
-    product = products_cache[product_id]
+    product = snapshot.products[product_id]
     
     # Кнопки навигации
     keyboard = []
@@ -461,14 +166,12 @@ async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, user_
     
     # Основные кнопки
     keyboard.extend([
-        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"add_{product_id}")],
+        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=callback_payloads.encode("a", (product_id, snapshot.sku(product_id)), snapshot.version))],
         [InlineKeyboardButton("🛒 Перейти в корзину", callback_data="cart")],
         [InlineKeyboardButton("🛍️ К списку товаров", callback_data="view_products")],
         [InlineKeyboardButton("↩️ Главное меню", callback_data="back_main")]
     ])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     # Формируем сообщение с реальными данными
     message_text = (
         f"{product['image']} *{product['name']}*\n\n"
@@ -480,25 +183,54 @@ async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, user_
         f"🛒 Нажмите 'Добавить в корзину' чтобы заказать!"
     )
     
-    if update.callback_query:
-        try:
-            # Пытаемся изменить сообщение
-            await update.callback_query.edit_message_text(
-                message_text, 
-                reply_markup=reply_markup, 
-                parse_mode='Markdown'
+    return message_text, InlineKeyboardMarkup(keyboard)
+
+async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int = None, force_update: bool = False):
+    """Показывает текущий товар с реальными данными"""
+    if not user_id:
+        if update.callback_query:
+            user_id = update.callback_query.from_user.id
+        else:
+            user_id = update.message.from_user.id
+    
+    if user_id not in current_product_index:
+        current_product_index[user_id] = 0
+    
+    # Позиция, версия и карточка берутся из одного снимка каталога
+    snapshot = catalog.current
+    
+    if not snapshot.products:
+        # Используем reply_text вместо edit_message_text для нового сообщения
+        if update.callback_query:
+            await update.callback_query.message.reply_text(
+                "❌ Товары временно недоступны",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Обновить", callback_data="refresh_products")]])
             )
-        except Exception as e:
-            # Если ошибка "сообщение не изменено", просто отвечаем на callback
-            if "message is not modified" in str(e):
-                await update.callback_query.answer()
-            else:
-                # Другие ошибки - создаем новое сообщение
-                await update.callback_query.message.reply_text(
-                    message_text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
+        else:
+            await update.message.reply_text(
+                "❌ Товары временно недоступны",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Обновить", callback_data="refresh_products")]])
+            )
+        return
+    
+    # После обновления каталог мог стать короче, чем позиция пользователя
+    current_index = min(current_product_index[user_id], len(snapshot) - 1)
+    current_product_index[user_id] = current_index
+    # Карточка зависит только от позиции товара и версии каталога - берем готовую
+    message_text, reply_markup = product_cards.get(
+        snapshot.version, current_index, lambda: render_product_card(snapshot, current_index)
+    )
+    
+    if update.callback_query:
+        # Быстрые клики сводятся к последней правке с учетом лимитов Telegram;
+        # "сообщение не изменено" игнорируется, при других ошибках отправляется новое сообщение
+        await message_governor.edit(
+            update.callback_query,
+            message_text,
+            fallback_reply=True,
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
     else:
         await update.message.reply_text(
             message_text,
@@ -514,7 +246,7 @@ async def handle_product_navigation(update: Update, context: ContextTypes.DEFAUL
     user_id = query.from_user.id
     action = query.data
     
-    product_ids = list(products_cache.keys())
+    product_ids = list(catalog.products.keys())
     
     if action == "product_prev" and current_product_index[user_id] > 0:
         current_product_index[user_id] -= 1
@@ -523,23 +255,34 @@ async def handle_product_navigation(update: Update, context: ContextTypes.DEFAUL
     
     await show_product(update, context, user_id, force_update=True)
 
-async def add_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
     """Добавляет товар в корзину"""
     query = update.callback_query
     await query.answer()
     
-    product_id = int(query.data.split("_")[1])
     user_id = query.from_user.id
     
-    if user_id not in user_carts:
+    # Кнопка могла остаться от старого каталога, где товара уже нет
+    snapshot = catalog.current
+    product = snapshot.products.get(product_id)
+    if not product:
+        await query.answer("❌ Товар больше недоступен, обновите каталог")
+        return
+    
+    # Единица товара держится за покупателем, чтобы ее не купил другой
+    sku = snapshot.sku(product_id)
+    if not stock_ledger.reserve(sku, user_id):
+        await query.answer("❌ Товар закончился")
+        return
+    
+    if not user_carts.get(user_id):
         user_carts[user_id] = {}
+        cart_versions[user_id] = snapshot.version
     
-    if product_id in user_carts[user_id]:
-        user_carts[user_id][product_id] += 1
-    else:
-        user_carts[user_id][product_id] = 1
+    # Корзина хранит SKU: позиция товара меняется при обновлении каталога
+    cart = user_carts[user_id]
+    cart[sku] = cart.get(sku, 0) + 1
     
-    product = products_cache[product_id]
     await query.answer(f"✅ {product['name']} добавлен в корзину!")
 
 async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -566,8 +309,10 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cart_text = "🛒 *Ваша корзина:*\n\n"
     total = 0
     
-    for product_id, quantity in user_carts[user_id].items():
-        product = products_cache[product_id]
+    for product, quantity in catalog.cart_items(user_carts[user_id], cart_versions.get(user_id)):
+        if not product:
+            cart_text += f"❔ Товар больше не продается - {quantity} шт.\n\n"
+            continue
         item_total = product['price'] * quantity
         total += item_total
         cart_text += f"{product['image']} *{product['name']}*\n"
@@ -597,23 +342,43 @@ async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("❌ Корзина пуста!")
         return
     
-    # Подсчет итоговой суммы
-    total = sum(products_cache[pid]['price'] * qty for pid, qty in user_carts[user_id].items())
+    # Списываем резервы корзины; если резерв истек и товар уже купили - сообщаем
+    missing = stock_ledger.commit(user_id, user_carts[user_id])
+    if missing:
+        names = "".join(
+            f"• {product['name']}\n"
+            for product, _ in catalog.cart_items(dict.fromkeys(missing, 0), cart_versions.get(user_id)) if product
+        )
+        keyboard = [
+            [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")],
+            [InlineKeyboardButton("🗑️ Очистить корзину", callback_data="clear_cart")]
+        ]
+        await query.edit_message_text(
+            f"❌ Пока вы оформляли заказ, часть товаров закончилась:\n\n{names}\nИзмените корзину и попробуйте снова.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
     
-    # Сохраняем заказ
-    if user_id not in user_orders:
-        user_orders[user_id] = []
+    # Подсчет итоговой суммы
+    total = sum(
+        product['price'] * quantity
+        for product, quantity in catalog.cart_items(user_carts[user_id], cart_versions.get(user_id))
+        if product
+    )
     
-    order_id = len(user_orders[user_id]) + 1
-    user_orders[user_id].append({
-        "order_id": order_id,
+    # Сохраняем заказ; номер заказа - его номер в базе
+    order_id = order_store.add(user_id, {
         "items": user_carts[user_id].copy(),
         "total": total,
         "status": "Обрабатывается"
     })
     
+    # Заказ не уходит в Ozon: продажа вычитается из его остатков SOLD_MEMORY
+    stock_ledger.mark_local(user_id, user_carts[user_id])
+    
     # Очищаем корзину
     user_carts[user_id] = {}
+    cart_versions.pop(user_id, None)
     
     # Формируем сообщение о заказе
     order_text = (
@@ -639,14 +404,14 @@ async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
-async def show_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает заказы пользователя"""
+async def show_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE, before=None):
+    """Показывает страницу заказов пользователя (от новых к старым)"""
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
+    orders, next_cursor = order_store.page(query.from_user.id, before)
     
-    if user_id not in user_orders or not user_orders[user_id]:
+    if not orders:
         keyboard = [
             [InlineKeyboardButton("🛍️ Сделать заказ", callback_data="view_products")],
             [InlineKeyboardButton("↩️ Главное меню", callback_data="back_main")]
@@ -661,8 +426,8 @@ async def show_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     orders_text = "📦 *Ваши заказы:*\n\n"
     
-    for order in user_orders[user_id][-5:]:
-        orders_text += f"🆔 *Заказ #{order['order_id']}*\n"
+    for order in orders:
+        orders_text += f"🆔 *Заказ #{order['number']}*\n"
         orders_text += f"💵 Сумма: {order['total']} ₽\n"
         orders_text += f"📊 Статус: {order['status']}\n"
         orders_text += f"📦 Товаров: {len(order['items'])}\n\n"
@@ -672,6 +437,10 @@ async def show_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("📞 Поддержка", callback_data="support")],
         [InlineKeyboardButton("↩️ Главное меню", callback_data="back_main")]
     ]
+    if next_cursor:
+        keyboard.insert(0, [InlineKeyboardButton("⬅️ Более ранние заказы", callback_data=f"orders_before_{next_cursor}")])
+    if before is not None:
+        keyboard.insert(0, [InlineKeyboardButton("⏮ Последние заказы", callback_data="my_orders")])
     
     await query.edit_message_text(
         orders_text,
@@ -687,7 +456,7 @@ async def refresh_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await load_real_products()
     
-    if not products_cache:
+    if not catalog.products:
         keyboard = [[InlineKeyboardButton("📞 Поддержка", callback_data="support")]]
         if query:
             await query.edit_message_text(
@@ -708,13 +477,13 @@ async def refresh_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query:
         await query.edit_message_text(
             f"✅ Товары обновлены!\n"
-            f"📦 Загружено товаров: {len(products_cache)}",
+            f"📦 Загружено товаров: {len(catalog.products)}",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     else:
         await update.message.reply_text(
             f"✅ Товары обновлены!\n"
-            f"📦 Загружено товаров: {len(products_cache)}",
+            f"📦 Загружено товаров: {len(catalog.products)}",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
@@ -741,6 +510,18 @@ async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+async def answer_none(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка-счетчик: просто отвечаем на callback без изменений"""
+    await update.callback_query.answer()
+
+async def clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Очищает корзину и показывает ее"""
+    user_id = update.callback_query.from_user.id
+    stock_ledger.release_all(user_id, user_carts.get(user_id, {}))
+    user_carts[user_id] = {}
+    cart_versions.pop(user_id, None)
+    await show_cart(update, context)
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback-ов"""
     query = update.callback_query
@@ -751,35 +532,31 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     
     try:
-        if data == "view_products":
-            await view_products(update, context)
-        elif data in ["product_prev", "product_next"]:
-            await handle_product_navigation(update, context)
-        elif data == "none":
-            # Просто отвечаем на callback без изменений
-            await query.answer()
-        elif data.startswith("add_"):
-            await add_to_cart(update, context)
-        elif data == "cart":
-            await show_cart(update, context)
-        elif data == "checkout":
-            await checkout(update, context)
-        elif data == "clear_cart":
-            user_id = query.from_user.id
-            user_carts[user_id] = {}
-            await show_cart(update, context)
-        elif data == "my_orders":
-            await show_my_orders(update, context)
-        elif data == "refresh_products":
-            await refresh_products(update, context)
-        elif data == "support":
-            await support(update, context)
-        elif data == "back_main":
-            await start(update, context)
+        # Маршрут выбирается по таблице callback_router (см. конец модуля)
+        await callback_router.dispatch(data, update, context)
     except Exception as e:
         print(f"❌ Ошибка в обработчике callback: {e}")
         await query.answer("❌ Произошла ошибка, попробуйте снова")
 
+# Таблица маршрутов callback-кнопок
+callback_router = CallbackRouter()
+decode_product_token = product_token_decoder(catalog)
+callback_router.route("view_products", view_products)
+callback_router.route("product_prev", handle_product_navigation)
+callback_router.route("product_next", handle_product_navigation)
+callback_router.route("none", answer_none)
+callback_router.route("cart", show_cart)
+callback_router.route("checkout", checkout)
+callback_router.route("clear_cart", clear_cart)
+callback_router.route("my_orders", show_my_orders)
+callback_router.prefix("orders_before_", show_my_orders, int)
+callback_router.route("refresh_products", refresh_products)
+callback_router.route("support", support)
+callback_router.route("back_main", start)
+callback_router.prefix("a:", add_to_cart, decode_product_token)
+# Кнопки в сообщениях, отправленных до перехода на токены
+callback_router.prefix("add_", add_to_cart, expired_product_index)
+
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
@@ -1,551 +1,224 @@
 import os
-import requests
+from telegram_sender import message_governor
+from product_cards import product_cards
+from callback_router import CallbackRouter
+from callback_codec import callback_payloads, product_token_decoder, expired_product_index
+from shop_core import ShopCatalog
+from order_store import OrderStore, orders_db_path
+from stock_ledger import stock_ledger, HOLD_TTL
+from checkout_quotes import QuoteBatcher
+from order_status import OrderStatusPoller
+from message_templates import MessageCatalog, user_language
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, ContextTypes,
+    ConversationHandler, MessageHandler, TypeHandler, filters
+)
 import asyncio
 import datetime
+import secrets
 
 # Токены
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
-OZON_API_KEY = os.environ.get('OZON_API_KEY')
-OZON_CLIENT_ID = os.environ.get('OZON_CLIENT_ID')
 
 # Кэш товаров
-products_cache = {}
 
 current_product_index = {}
 
-class OzonSellerAPI:
-    def __init__(self):
-        self.headers = {
-            "Client-Id": OZON_CLIENT_ID,
-            "Api-Key": OZON_API_KEY,
-            "Content-Type": "application/json"
-        }
-    
-    def get_products_with_prices(self, limit=50):
-        """Получает реальные товары с реальными ценами из Ozon"""
-        print("🔄 Получение реальных товаров из Ozon API...")
-        
-        try:
-            # 1. Получаем список товаров через v3/product/list
-            print("🔍 Получаем список товаров через v3/product/list...")
-            list_response = requests.post(
-                "https://api-seller.ozon.ru/v3/product/list",
-                headers=self.headers,
-                json={
-                    "filter": {"visibility": "ALL"},
-                    "limit": limit
-                },
-                timeout=10
-            )
-        
-            if list_response.status_code != 200:
-                print(f"❌ Ошибка v3/product/list: {list_response.status_code}")
-                print(f"Текст ошибки: {list_response.text}")
-                return None
-        
-            list_data = list_response.json()
-            items = list_data.get('result', {}).get('items', [])
-            print(f"✅ Получено товаров: {len(items)}")
-        
-            if not items:
-                print("❌ Нет товаров в ответе")
-                return None
-            
-            # Получаем product_id для запроса описаний
-            product_ids = [item['product_id'] for item in items if 'product_id' in item]
-            print(f"🔍 Получено {len(product_ids)} product_id")
-        
-            # 2. Получаем описания товаров через v1/product/info/description
-            print("🔍 Получаем описания товаров через v1/product/info/description...")
-            descriptions_data = self._get_products_descriptions(product_ids)
-        
-            # 3. Получаем цены через v5/product/info/prices
-            print("🔍 Получаем цены через v5/product/info/prices...")
-            prices_data = self._get_products_prices_v5(product_ids)
-        
-            # 4. Получаем остатки через v2/product/info/list
-            print("🔍 Получаем остатки через v2/product/info/list...")
-            stocks_data = self._get_products_stocks_simple(product_ids)
-        
-            # Формируем итоговый список товаров
-            products = []
-            for item in items:
-                try:
-                    product_id = item.get('product_id')
-                    offer_id = item.get('offer_id')
-                
-                    if not product_id:
-                        continue
-                
-                    # Получаем описание из v1/product/info/description
-                    description_info = descriptions_data.get(product_id, {})
-                    name = description_info.get('name', offer_id or f"Товар {product_id}")
-                    description = description_info.get('description', '')
-                
-                    # Если нет описания из v1, используем базовое
-                    if not description:
-                        description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-                
-                    # Получаем цену из v5
-                    price = self._extract_price_from_v5(prices_data.get(product_id, {}))
-                    if price == 0:
-                        print(f"⚠️ Пропускаем товар без цены: {name}")
-                        continue
-                
-                    # Получаем количество
-                    quantity = self._extract_quantity(stocks_data.get(product_id, {}))
-                    print(f"📦 Итоговое количество для {name}: {quantity}")
-                
-                    # Очищаем описание от HTML тегов и обрезаем
-                    description = self._clean_description(description)
-                    if len(description) > 150:
-                        description = description[:150] + "..."
-                
-                    products.append({
-                        'product_id': product_id,
-                        'offer_id': offer_id,
-                        'name': name,
-                        'price': price,
-                        'description': description,
-                        'quantity': quantity
-                    })
-                    
-                    print(f"📦 {name} - {price} ₽ (Остаток: {quantity})")
-                
-                except Exception as e:
-                    print(f"❌ Ошибка обработки товара: {e}")
-                    continue
-        
-            print(f"✅ Обработано {len(products)} товаров с реальными ценами")
-            return products
-            
-        except Exception as e:
-            print(f"❌ Ошибка запроса к Ozon API: {e}")
-            return None
-    
-    def _get_products_descriptions(self, product_ids):
-        """Получает описания товаров через v1/product/info/description"""
-        descriptions_data = {}
-        try:
-            # Обрабатываем каждый product_id отдельно
-            for product_id in product_ids:
-                description_response = requests.post(
-                    "https://api-seller.ozon.ru/v1/product/info/description",
-                    headers=self.headers,
-                    json={"product_id": product_id},
-                    timeout=10
-                )
-                
-                if description_response.status_code == 200:
-                    description_result = description_response.json().get('result', {})
-                    if description_result:
-                        descriptions_data[product_id] = {
-                            'name': description_result.get('name', ''),
-                            'description': description_result.get('description', '')
-                        }
-                        print(f"📝 Получено описание для товара {product_id}")
-                else:
-                    print(f"⚠️ Ошибка получения описания для {product_id}: {description_response.status_code}")
-            
-            print(f"📝 Всего получено описаний: {len(descriptions_data)}")
-            return descriptions_data
-            
-        except Exception as e:
-            print(f"❌ Ошибка получения описаний: {e}")
-            return {}
-    
-    def _get_products_prices_v5(self, product_ids):
-        """Получает цены товаров через v5/product/info/prices"""
-        prices_data = {}
-        try:
-            # Разбиваем на группы по 50 product_id
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-            
-                prices_response = requests.post(
-                    "https://api-seller.ozon.ru/v5/product/info/prices",
-                    headers=self.headers,
-                    json={
-                        "filter": {
-                            "product_id": batch_ids,
-                            "visibility": "ALL"
-                        },
-                        "last_id": "",
-                        "limit": 1000
-                    },
-                    timeout=10
-                )
-            
-                if prices_response.status_code == 200:
-                    prices_result = prices_response.json()
-                    # В v5 items находится в корне ответа
-                    price_items = prices_result.get('items', [])
-                    print(f"💰 Получены цены для {len(price_items)} товаров")
-                
-                    for price_item in price_items:
-                        product_id = price_item.get('product_id')
-                        prices_data[product_id] = price_item
-                        
-                else:
-                    print(f"❌ Ошибка получения цен v5: {prices_response.status_code}")
-                    print(f"Текст ошибки: {prices_response.text}")
-        
-            return prices_data
-        
-        except Exception as e:
-            print(f"❌ Ошибка получения цен v5: {e}")
-            return {}
-    
-    def _extract_price_from_v5(self, price_item):
-        """Извлекает цену из структуры Ozon v5"""
-        if not price_item:
-            return 0
-    
-        try:
-            # Прямой доступ к цене по структуре из вашего примера
-            price_info = price_item.get('price', {})
-        
-            # Основная цена
-            main_price = price_info.get('price')
-            if main_price:
-                price_int = int(float(main_price))
-                if price_int > 0:
-                    print(f"✅ Найдена цена: {price_int} ₽")
-                    return price_int
-        
-            # Старая цена как запасной вариант
-            old_price = price_info.get('old_price')
-            if old_price:
-                price_int = int(float(old_price))
-                if price_int > 0:
-                    print(f"✅ Найдена старая цена: {price_int} ₽")
-                    return price_int
-        
-            return 0
-        
-        except Exception as e:
-            print(f"❌ Ошибка извлечения цены: {e}")
-            return 0
+# Шаги оформления заказа
+CHECKOUT_NAME, CHECKOUT_PHONE, CHECKOUT_CITY, CHECKOUT_ADDRESS = range(4)
+# Брошенное оформление завершается вместе с резервом корзины
+CHECKOUT_TIMEOUT = HOLD_TTL
+# Допустимый ввод на каждом шаге
+NAME_PATTERN = r'^\s*[^\d\s][^\d\n]{1,99}$'
+PHONE_PATTERN = r'^\s*\+?[\d\s()-]{10,20}$'
+CITY_PATTERN = r'^\s*[^\d\s][^\d\n]{1,59}$'
+ADDRESS_PATTERN = r'^\s*\S[^\n]{4,199}$'
 
-    def _get_products_stocks_simple(self, product_ids):
-        """Упрощенный метод получения остатков через v2/product/info/list"""
-        stocks_data = {}
-        try:
-            # Разбиваем на группы по 50 product_id
-            for i in range(0, len(product_ids), 50):
-                batch_ids = product_ids[i:i+50]
-            
-                # Используем v2/product/info/list который возвращает основную информацию включая stock
-                info_response = requests.post(
-                    "https://api-seller.ozon.ru/v2/product/info/list",
-                    headers=self.headers,
-                    json={
-                        "product_id": batch_ids
-                    },
-                    timeout=10
-                )
-            
-                if info_response.status_code == 200:
-                    info_result = info_response.json()
-                    print(f"📦 Получен ответ от v2/product/info/list")
-                
-                    items = info_result.get('result', {}).get('items', [])
-                    print(f"📦 Получена информация для {len(items)} товаров")
-                
-                    for item in items:
-                        product_id = item.get('product_id')
-                        if product_id:
-                            # Получаем все возможные поля с остатками
-                            stock = item.get('stock', 0)
-                            fbo_stock = item.get('fbo_stock', 0)
-                            fbs_stock = item.get('fbs_stock', 0)
-                            
-                            # Логируем все значения
-                            print(f"📊 Товар {product_id}: stock={stock}, fbo_stock={fbo_stock}, fbs_stock={fbs_stock}")
-                            
-                            # Выбираем наибольшее доступное количество
-                            available_stock = max(stock, fbo_stock, fbs_stock)
-                            
-                            stocks_data[product_id] = {
-                                'stock': stock,
-                                'fbo_stock': fbo_stock,
-                                'fbs_stock': fbs_stock,
-                                'available_stock': available_stock
-                            }
-                            
-                            print(f"✅ Доступный остаток для {product_id}: {available_stock}")
-                        
-                else:
-                    print(f"⚠️ Ошибка получения информации v2: {info_response.status_code}")
-                    print(f"Текст ошибки: {info_response.text}")
-        
-            return stocks_data
-        
-        except Exception as e:
-            print(f"❌ Ошибка получения простых остатков: {e}")
-            return {}
+# Тексты подтверждения заказа; компилируются один раз при запуске
+ORDER_MESSAGES = MessageCatalog({
+    'ru': {
+        'order_created': (
+            "✅ *Заказ создан в Ozon!*\n\n"
+            "{summary}{posting}"
+            "\n📅 Дата: {date}\n\n"
+            "Состав заказа:\n{items}"
+            "\n📱 Вы можете отслеживать статус заказа в личном кабинете Ozon"
+        ),
+        'order_saved': (
+            "✅ *Заказ сохранен!*\n\n"
+            "{summary}"
+            "\n📅 Дата: {date}\n\n"
+            "Состав заказа:\n{items}"
+            "\n⚠️ *Внимание:* Заказ не был создан в системе Ozon автоматически. "
+            "Пожалуйста, создайте заказ вручную через личный кабинет Ozon."
+        ),
+        'order_summary': (
+            "💰 Сумма: {total} ₽\n"
+            "📦 Товаров: {items_count} шт.\n"
+            "👤 Получатель: {customer_name}\n"
+            "📞 Телефон: {customer_phone}\n"
+            "🏠 Адрес: {customer_city}, {customer_address}\n"
+        ),
+        'order_posting': "🔗 Номер заказа в Ozon: {posting_number}\n",
+        'order_item': "• {name} - {quantity} шт. × {price} ₽\n",
+        'button_cabinet': "📱 Открыть личный кабинет",
+        'button_create_in_ozon': "📱 Создать заказ в Ozon",
+        'button_continue': "🛍️ Продолжить покупки",
+        'button_orders': "📦 Мои заказы",
+        'price_changed': (
+            "⚠️ *Цены изменились*\n\n"
+            "Пока вы оформляли заказ, цены в Ozon обновились:\n{changes}"
+            "\n💰 Новая сумма: {total} ₽\n\n"
+            "Подтвердите заказ по новым ценам или измените корзину."
+        ),
+        'price_change_item': "• {name}: {old} ₽ → {new} ₽\n",
+        'sold_out': (
+            "❌ Пока вы оформляли заказ, часть товаров закончилась:\n\n{items}"
+            "\nИзмените корзину и попробуйте снова."
+        ),
+        'sold_out_item': "• {name}\n",
+        'cart_gone': "❌ Товаров из вашей корзины больше нет в продаже. Корзина очищена - выберите товары заново.",
+        'button_confirm': "✅ Подтвердить заказ",
+        'button_cart': "🛒 Изменить корзину",
+        'ozon_unavailable': "⚠️ Не удалось проверить цены и наличие в Ozon. Заказ не оформлен - попробуйте через несколько минут.",
+        'order_repeat': "ℹ️ Этот заказ уже оформлен, повторно он не отправлялся.\n\n",
+        'order_in_progress': "⏳ Этот заказ уже отправляется в Ozon - дождитесь подтверждения.",
+        'checkout_name': (
+            "📋 *Оформление заказа*\n\n"
+            "Шаг 1 из 4. Введите имя и фамилию получателя.\n\n"
+            "Отменить оформление: /cancel"
+        ),
+        'checkout_phone': "Шаг 2 из 4. Введите номер телефона, например +79123456789",
+        'checkout_city': "Шаг 3 из 4. Введите город доставки",
+        'checkout_address': "Шаг 4 из 4. Введите адрес доставки, например ул. Примерная, д. 1, кв. 1",
+        'checkout_invalid': "⚠️ Не получилось разобрать ответ.\n",
+        'checkout_cancelled': "❌ Оформление заказа отменено. Корзина сохранена.",
+        'checkout_expired': "⌛ Оформление заказа прервано из-за бездействия. Корзина сохранена - начните заново, когда будете готовы.",
+        'status_changed': (
+            "📬 *Статус заказа #{number} изменился*\n\n"
+            "🔗 Номер в Ozon: {posting_number}\n"
+            "📊 Новый статус: {status}"
+        ),
+    },
+    'en': {
+        'order_created': (
+            "✅ *Order created in Ozon!*\n\n"
+            "{summary}{posting}"
+            "\n📅 Date: {date}\n\n"
+            "Items:\n{items}"
+            "\n📱 You can track the order status in your Ozon account"
+        ),
+        'order_saved': (
+            "✅ *Order saved!*\n\n"
+            "{summary}"
+            "\n📅 Date: {date}\n\n"
+            "Items:\n{items}"
+            "\n⚠️ *Note:* the order was not created in Ozon automatically. "
+            "Please create it manually in your Ozon account."
+        ),
+        'order_summary': (
+            "💰 Total: {total} ₽\n"
+            "📦 Items: {items_count} pcs\n"
+            "👤 Recipient: {customer_name}\n"
+            "📞 Phone: {customer_phone}\n"
+            "🏠 Address: {customer_city}, {customer_address}\n"
+        ),
+        'order_posting': "🔗 Ozon order number: {posting_number}\n",
+        'order_item': "• {name} - {quantity} pcs × {price} ₽\n",
+        'button_cabinet': "📱 Open Ozon account",
+        'button_create_in_ozon': "📱 Create order in Ozon",
+        'button_continue': "🛍️ Continue shopping",
+        'button_orders': "📦 My orders",
+        'price_changed': (
+            "⚠️ *Prices have changed*\n\n"
+            "Ozon updated prices while you were checking out:\n{changes}"
+            "\n💰 New total: {total} ₽\n\n"
+            "Confirm the order at the new prices or change your cart."
+        ),
+        'price_change_item': "• {name}: {old} ₽ → {new} ₽\n",
+        'sold_out': (
+            "❌ Some items sold out while you were checking out:\n\n{items}"
+            "\nPlease change your cart and try again."
+        ),
+        'sold_out_item': "• {name}\n",
+        'cart_gone': "❌ The items in your cart are no longer on sale. The cart has been cleared - please choose items again.",
+        'button_confirm': "✅ Confirm order",
+        'button_cart': "🛒 Change cart",
+        'ozon_unavailable': "⚠️ Could not check prices and stock in Ozon. The order was not placed - please try again in a few minutes.",
+        'order_repeat': "ℹ️ This order has already been placed and was not sent again.\n\n",
+        'order_in_progress': "⏳ This order is already being sent to Ozon - please wait for the confirmation.",
+        'checkout_name': (
+            "📋 *Checkout*\n\n"
+            "Step 1 of 4. Enter the recipient's full name.\n\n"
+            "Cancel checkout: /cancel"
+        ),
+        'checkout_phone': "Step 2 of 4. Enter a phone number, e.g. +79123456789",
+        'checkout_city': "Step 3 of 4. Enter the delivery city",
+        'checkout_address': "Step 4 of 4. Enter the delivery address, e.g. 1 Example St, apt 1",
+        'checkout_invalid': "⚠️ Could not read that answer.\n",
+        'checkout_cancelled': "❌ Checkout cancelled. Your cart is kept.",
+        'checkout_expired': "⌛ Checkout stopped due to inactivity. Your cart is kept - start again when you are ready.",
+        'status_changed': (
+            "📬 *Order #{number} status changed*\n\n"
+            "🔗 Ozon number: {posting_number}\n"
+            "📊 New status: {status}"
+        ),
+    },
+})
 
-    def _extract_quantity(self, stock_item):
-        """Извлекает количество из структуры остатков"""
-        try:
-            if not stock_item:
-                print("⚠️ Нет данных об остатках, используем значение по умолчанию: 10")
-                return 10  # По умолчанию
-        
-            print(f"🔍 Анализируем структуру остатков: {stock_item}")
-        
-            # Способ 1: available_stock - наш расчетный показатель
-            if 'available_stock' in stock_item:
-                available_stock = stock_item['available_stock']
-                if available_stock is not None:
-                    try:
-                        available_int = int(available_stock)
-                        print(f"📊 available_stock: {available_int}")
-                        if available_int >= 0:
-                            print(f"✅ Количество из поля 'available_stock': {available_int}")
-                            return available_int
-                    except (ValueError, TypeError) as e:
-                        print(f"⚠️ Ошибка преобразования available_stock: {e}")
-        
-            # Способ 2: stock
-            if 'stock' in stock_item:
-                stock = stock_item['stock']
-                if stock is not None:
-                    try:
-                        stock_int = int(stock)
-                        print(f"📊 stock: {stock_int}")
-                        if stock_int >= 0:
-                            print(f"✅ Количество из поля 'stock': {stock_int}")
-                            return stock_int
-                    except (ValueError, TypeError) as e:
-                        print(f"⚠️ Ошибка преобразования stock: {e}")
-        
-            # Способ 3: fbo_stock
-            if 'fbo_stock' in stock_item:
-                fbo_stock = stock_item['fbo_stock']
-                if fbo_stock is not None:
-                    try:
-                        fbo_int = int(fbo_stock)
-                        print(f"📊 fbo_stock: {fbo_int}")
-                        if fbo_int >= 0:
-                            print(f"✅ Количество из поля 'fbo_stock': {fbo_int}")
-                            return fbo_int
-                    except (ValueError, TypeError) as e:
-                        print(f"⚠️ Ошибка преобразования fbo_stock: {e}")
-        
-            # Способ 4: fbs_stock
-            if 'fbs_stock' in stock_item:
-                fbs_stock = stock_item['fbs_stock']
-                if fbs_stock is not None:
-                    try:
-                        fbs_int = int(fbs_stock)
-                        print(f"📊 fbs_stock: {fbs_int}")
-                        if fbs_int >= 0:
-                            print(f"✅ Количество из поля 'fbs_stock': {fbs_int}")
-                            return fbs_int
-                    except (ValueError, TypeError) as e:
-                        print(f"⚠️ Ошибка преобразования fbs_stock: {e}")
-        
-            print("⚠️ Не удалось определить количество, используем значение по умолчанию: 10")
-            return 10  # По умолчанию
-        
-        except Exception as e:
-            print(f"❌ Ошибка извлечения количества: {e}")
-            print(f"📋 Структура stock_item: {stock_item}")
-            return 10
-    
-    def _clean_description(self, description):
-        """Очищает описание от HTML тегов"""
-        if not description:
-            return ""
-        
-        # Удаляем основные HTML теги
-        import re
-        clean_text = re.sub(r'<br\s*/?>', '\n', description)  # Заменяем <br> на переносы
-        clean_text = re.sub(r'<[^>]+>', '', clean_text)  # Удаляем все остальные теги
-        clean_text = re.sub(r'\n\s*\n', '\n', clean_text)  # Удаляем лишние переносы
-        clean_text = clean_text.strip()
-        
-        return clean_text
-def create_ozon_order(self, order_data):
-    """Создает реальный заказ в Ozon"""
-    try:
-        # Подготавливаем данные для создания заказа в Ozon
-        # Правильная структура для API Ozon
-        ozon_order_data = {
-            "posting_number": f"TG{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
-            "products": [],
-            "address": {
-                "address": order_data.get('customer_address', 'Адрес не указан'),
-                "city": order_data.get('customer_city', 'Город не указан'),
-                "name": order_data.get('customer_name', 'Покупатель'),
-                "phone": order_data.get('customer_phone', '+79999999999'),
-                "zip_code": "101000"  # Обязательное поле
-            },
-            "delivery_method": {
-                "id": 1,  # ID способа доставки, нужно получить из API Ozon
-                "name": "Стандартная доставка"
-            },
-            "recipient": {
-                "name": order_data.get('customer_name', 'Покупатель'),
-                "phone": order_data.get('customer_phone', '+79999999999')
-            }
-        }
-        
-        # Добавляем товары в заказ
-        for item in order_data['items']:
-            ozon_order_data["products"].append({
-                "product_id": int(item['product_id']),
-                "quantity": int(item['quantity']),
-                "price": str(float(item['price']))
-            })
-        
-        print(f"📦 Создаем заказ в Ozon: {ozon_order_data}")
-        
-        # Пробуем разные endpoints для создания заказа
-        endpoints = [
-            "https://api-seller.ozon.ru/v3/posting/fbs/create",
-            "https://api-seller.ozon.ru/v2/posting/fbs/create",
-            "https://api-seller.ozon.ru/v1/posting/fbs/create"
-        ]
-        
-        for endpoint in endpoints:
-            try:
-                print(f"🔧 Пробуем endpoint: {endpoint}")
-                order_response = requests.post(
-                    endpoint,
-                    headers=self.headers,
-                    json=ozon_order_data,
-                    timeout=10
-                )
-                
-                print(f"📡 Ответ от Ozon API: {order_response.status_code}")
-                
-                if order_response.status_code == 200:
-                    result = order_response.json()
-                    print(f"✅ Заказ создан в Ozon: {result}")
-                    
-                    # Сохраняем ID заказа Ozon
-                    if 'result' in result:
-                        posting_number = result['result'].get('posting_number')
-                        order_id = result['result'].get('order_id')
-                        
-                        if posting_number:
-                            order_data['ozon_posting_number'] = posting_number
-                        if order_id:
-                            order_data['ozon_order_id'] = order_id
-                    
-                    return result
-                else:
-                    print(f"⚠️ Ошибка {endpoint}: {order_response.status_code}")
-                    print(f"Текст ошибки: {order_response.text}")
-                    
-            except Exception as e:
-                print(f"❌ Ошибка при вызове {endpoint}: {e}")
-                continue
-                
-        # Если все endpoints не сработали, пробуем упрощенный вариант
-        print("🔄 Пробуем упрощенный метод создания заказа...")
-        
-        simplified_data = {
-            "products": [
-                {
-                    "product_id": int(order_data['items'][0]['product_id']),
-                    "quantity": 1
-                }
-            ],
-            "address": order_data.get('customer_address', 'Адрес не указан'),
-            "phone": order_data.get('customer_phone', '+79999999999'),
-            "customer_name": order_data.get('customer_name', 'Покупатель')
-        }
-        
-        simplified_response = requests.post(
-            "https://api-seller.ozon.ru/v2/posting/fbs/create",
-            headers=self.headers,
-            json=simplified_data,
-            timeout=10
-        )
-        
-        if simplified_response.status_code == 200:
-            result = simplified_response.json()
-            print(f"✅ Заказ создан (упрощенный метод): {result}")
-            return result
-            
-        print("❌ Все методы создания заказа не сработали")
-        return None
-                
-    except Exception as e:
-        print(f"❌ Критическая ошибка создания заказа в Ozon: {e}")
-        return None
+# Названия статусов отправлений Ozon для уведомлений
+STATUS_LABELS = {
+    'ru': {
+        'awaiting_registration': "ожидает регистрации",
+        'acceptance_in_progress': "идет приемка",
+        'awaiting_approve': "ожидает подтверждения",
+        'awaiting_packaging': "ожидает упаковки",
+        'awaiting_deliver': "ожидает отгрузки",
+        'sent_by_seller': "отправлен продавцом",
+        'driver_pickup': "у водителя",
+        'delivering': "доставляется",
+        'arbitration': "арбитраж",
+        'client_arbitration': "арбитраж с покупателем",
+        'not_accepted': "не принят на сортировке",
+        'delivered': "доставлен",
+        'cancelled': "отменен",
+    },
+    'en': {
+        'awaiting_registration': "awaiting registration",
+        'acceptance_in_progress': "acceptance in progress",
+        'awaiting_approve': "awaiting approval",
+        'awaiting_packaging': "awaiting packaging",
+        'awaiting_deliver': "awaiting shipment",
+        'sent_by_seller': "sent by seller",
+        'driver_pickup': "picked up by driver",
+        'delivering': "in delivery",
+        'arbitration': "arbitration",
+        'client_arbitration': "customer arbitration",
+        'not_accepted': "not accepted at sorting",
+        'delivered': "delivered",
+        'cancelled': "cancelled",
+    },
+}
+
+# История заказов
+order_store = OrderStore(orders_db_path('ozon_order'))
 
-# Инициализация API
-ozon_api = OzonSellerAPI()
+# Каталог товаров Ozon
+catalog = ShopCatalog('descriptions')
+# Проверка цен и остатков при оформлении заказа
+quote_batcher = QuoteBatcher(catalog)
 
 async def load_real_products():
-    """Загружает только реальные товары из Ozon API"""
-    global products_cache
-    
-    print("🔄 Загрузка реальных товаров из Ozon...")
-    
-    # Проверяем наличие API ключей
-    if not OZON_CLIENT_ID or not OZON_API_KEY:
-        print("❌ API ключи не настроены!")
-        products_cache = {}
-        return {}
-    
-    # Получаем реальные товары с реальными ценами
-    products_data = ozon_api.get_products_with_prices(limit=50)
-    
-    if not products_data:
-        print("❌ Не удалось получить реальные товары через Ozon API")
-        products_cache = {}
-        return {}
-    
-    products = {}
-    product_counter = 1
-    
-    # Обрабатываем только реальные товары
-    for item in products_data:
-        try:
-            product_id = item.get('product_id', '')
-            offer_id = item.get('offer_id', '')
-            name = item.get('name', '')
-            price = item.get('price', 0)
-            description = item.get('description', '')
-            quantity = item.get('quantity', 0)
-            
-            # Пропускаем товары без цены
-            if price == 0:
-                continue
-            
-            # Формируем описание
-            if not description:
-                description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
-            
-            product_key = product_counter
-            
-            products[product_key] = {
-                'ozon_id': product_id,
-                'offer_id': offer_id,
-                'name': name,
-                'price': price,
-                'image': "📦",
-                'description': description,
-                'quantity': quantity
-            }
-            
-            print(f"✅ Товар {product_counter}: {name} - {price} ₽ (Остаток: {quantity})")
-            product_counter += 1
-            
-        except Exception as e:
-            print(f"❌ Ошибка обработки товара: {e}")
-            continue
-    
-    print(f"🎯 Загружено {len(products)} реальных товаров с реальными ценами из Ozon")
-    products_cache = products
-    return products
+    """Перезагружает каталог из Ozon, сверяет резервы и заранее рендерит карточки новой версии"""
+    previous = catalog.current
+    snapshot = await catalog.refresh()
+    if snapshot is not previous:
+        # Каждая новая версия каталога - свежие остатки Ozon с учетом резервов корзин
+        stock_ledger.reconcile_catalog(snapshot)
+    if snapshot.version != product_cards.version:
+        product_cards.prerender(snapshot.version, snapshot.products.keys(), lambda key: render_product_card(snapshot, key))
+    return snapshot.products
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -557,7 +230,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Добро пожаловать в Ozon Client Bot! 🛍️
 
 📊 Реальные товары из вашего Ozon магазина
-📦 Доступно товаров: {len(products_cache)}
+📦 Доступно товаров: {len(catalog.products)}
 
 Здесь вы можете:
 • 📦 Просматривать реальные товары
@@ -582,9 +255,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def refresh_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /refresh"""
     await update.message.reply_text("🔄 Обновляем список реальных товаров...")
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         await update.message.reply_text(
@@ -602,26 +275,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    callback_data = query.data
-    
-    if callback_data == "view_products":
-        await show_products(query, context)
-    elif callback_data == "view_cart":
-        await show_cart(query, context)
-    elif callback_data == "view_orders":
-        await show_orders(query, context)
-    elif callback_data == "refresh_products":
-        await refresh_products_callback(query, context)
-    elif callback_data == "checkout":
-        await checkout(query, context)
-    elif callback_data == "clear_cart":
-        await clear_cart(query, context)
-    elif callback_data == "ozon_cabinet":
-        await open_ozon_cabinet(query, context)
-    elif callback_data.startswith("product_"):
-        await handle_product_action(query, context, callback_data)
-    elif callback_data.startswith("cart_"):
-        await handle_cart_action(query, context, callback_data)
+    # Маршрут выбирается по таблице callback_router (см. конец модуля)
+    await callback_router.dispatch(query.data, query, context)
 
 async def open_ozon_cabinet(query, context):
     """Открывает личный кабинет Ozon"""
@@ -643,7 +298,7 @@ async def open_ozon_cabinet(query, context):
 
 async def show_products(query, context):
     """Показывает список реальных товаров"""
-    if not products_cache:
+    if not catalog.products:
         await query.edit_message_text(
             "❌ Нет доступных товаров.\n"
             "Используйте /refresh для загрузки товаров из Ozon."
@@ -653,12 +308,10 @@ async def show_products(query, context):
     # Показываем первый товар
     await show_product_detail(query, context, 1)
 
-async def show_product_detail(query, context, product_index):
-    """Показывает детали реального товара"""
-    product = products_cache.get(product_index)
-    if not product:
-        await query.edit_message_text("❌ Товар не найден")
-        return
+def render_product_card(snapshot, product_index):
+    """Формирует текст и клавиатуру карточки товара из одного снимка каталога"""
+    product = snapshot.products[product_index]
+    payload = (product_index, product['ozon_id'])
     
     product_text = f"""
 📦 *{product['name']}*
@@ -672,40 +325,52 @@ async def show_product_detail(query, context, product_index):
     """
     
     keyboard = [
-        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"product_add_{product_index}")],
-        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=f"product_prev_{product_index}"),
-         InlineKeyboardButton("Следующий ➡️", callback_data=f"product_next_{product_index}")],
+        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=callback_payloads.encode("pa", payload, snapshot.version))],
+        [InlineKeyboardButton("⬅️ Предыдущий", callback_data=callback_payloads.encode("pp", payload, snapshot.version)),
+         InlineKeyboardButton("Следующий ➡️", callback_data=callback_payloads.encode("pn", payload, snapshot.version))],
         [InlineKeyboardButton("📋 К списку товаров", callback_data="view_products"),
          InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")],
         [InlineKeyboardButton("📱 Личный кабинет Ozon", callback_data="ozon_cabinet")]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    try:
-        await query.edit_message_text(product_text, reply_markup=reply_markup, parse_mode='Markdown')
-    except Exception as e:
-        # Игнорируем ошибку "Message is not modified"
-        if "Message is not modified" not in str(e):
-            raise e
+    return product_text, InlineKeyboardMarkup(keyboard)
 
-async def handle_product_action(query, context, callback_data):
-    """Обрабатывает действия с товарами"""
-    parts = callback_data.split('_')
-    action = parts[1]
-    product_index = int(parts[2])
+async def show_product_detail(query, context, product_index):
+    """Показывает детали реального товара"""
+    # Товар и версия карточки берутся из одного снимка, даже если каталог сейчас обновляется
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
+    if not product:
+        await query.edit_message_text("❌ Товар не найден")
+        return
+    
+    # Карточка зависит только от товара и версии каталога - берем готовую
+    product_text, reply_markup = product_cards.get(
+        snapshot.version, product_index, lambda: render_product_card(snapshot, product_index)
+    )
     
-    if action == "add":
-        await add_to_cart(query, context, product_index)
-    elif action == "next":
-        next_index = product_index + 1
-        if next_index > len(products_cache):
-            next_index = 1
-        await show_product_detail(query, context, next_index)
-    elif action == "prev":
-        prev_index = product_index - 1
-        if prev_index < 1:
-            prev_index = len(products_cache)
-        await show_product_detail(query, context, prev_index)
+    # Быстрые клики сводятся к последней правке, "Message is not modified" игнорируется
+    await message_governor.edit(query, product_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def show_next_product(query, context, product_index):
+    """Показывает следующий товар (по кругу)"""
+    if product_index is None:
+        # Кнопка устарела и товара больше нет - начинаем с первого
+        await show_products(query, context)
+        return
+    next_index = product_index + 1
+    if next_index > len(catalog.products):
+        next_index = 1
+    await show_product_detail(query, context, next_index)
+
+async def show_prev_product(query, context, product_index):
+    """Показывает предыдущий товар (по кругу)"""
+    if product_index is None:
+        await show_products(query, context)
+        return
+    prev_index = product_index - 1
+    if prev_index < 1:
+        prev_index = len(catalog.products)
+    await show_product_detail(query, context, prev_index)
 
 async def add_to_cart(query, context, product_index):
     """Добавляет товар в корзину"""
@@ -714,16 +379,22 @@ async def add_to_cart(query, context, product_index):
         context.user_data['cart'] = {}
     
     cart = context.user_data['cart']
-    product = products_cache.get(product_index)
+    snapshot = catalog.current
+    product = snapshot.products.get(product_index)
     
     if not product:
         await query.answer("❌ Товар не найден", show_alert=True)
         return
     
-    if str(product_index) in cart:
-        cart[str(product_index)] += 1
-    else:
-        cart[str(product_index)] = 1
+    # Корзина хранит SKU и считается по версии каталога, в которой ее начали
+    if not cart:
+        context.user_data['cart_version'] = snapshot.version
+    sku = product['ozon_id']
+    # Единица товара держится за покупателем HOLD_TTL, чтобы ее не купил другой
+    if not stock_ledger.reserve(sku, query.from_user.id):
+        await query.answer("❌ Товар закончился", show_alert=True)
+        return
+    cart[sku] = cart.get(sku, 0) + 1
     
     product_name = product['name']
     if len(product_name) > 100:
@@ -731,6 +402,22 @@ async def add_to_cart(query, context, product_index):
     
     await query.answer(f"✅ {product_name} добавлен в корзину!", show_alert=True)
 
+def cart_products(context, cart):
+    """Товары корзины с количеством по версии каталога, в которой начали корзину"""
+    return catalog.cart_items(cart, context.user_data.get('cart_version'))
+
+def remove_from_cart(context, items):
+    """Вычитает оформленные товары {sku: количество} из корзины"""
+    cart = context.user_data.get('cart', {})
+    for sku, quantity in items.items():
+        left = cart.get(sku, 0) - quantity
+        if left > 0:
+            cart[sku] = left
+        else:
+            cart.pop(sku, None)
+    if not cart:
+        context.user_data.pop('cart_version', None)
+
 async def show_cart(query, context):
     """Показывает корзину пользователя"""
     # Получаем корзину из user_data
@@ -751,8 +438,7 @@ async def show_cart(query, context):
     total = 0
     cart_text = "🛒 *Ваша корзина:*\n\n"
     
-    for product_index, quantity in cart.items():
-        product = products_cache.get(int(product_index))
+    for product, quantity in cart_products(context, cart):
         if product:
             item_total = product['price'] * quantity
             total += item_total
@@ -773,84 +459,204 @@ async def show_cart(query, context):
     
     await query.edit_message_text(cart_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def checkout(query, context):
-    """Оформляет заказ с созданием в Ozon"""
-    # Получаем корзину из user_data
+async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начинает оформление заказа: запрашивает имя получателя"""
+    query = update.callback_query
     cart = context.user_data.get('cart', {})
-    
+
     if not cart:
         await query.answer("❌ Корзина пуста", show_alert=True)
-        return
-    
-    # Запрашиваем контактные данные
-    await query.edit_message_text(
-        "📋 *Оформление заказа*\n\n"
-        "Пожалуйста, введите ваши контактные данные в формате:\n"
-        "• Имя и фамилия\n"
-        "• Номер телефона\n"
-        "• Город\n"
-        "• Адрес доставки\n\n"
-        "Пример:\n"
-        "Иван Иванов\n"
-        "+79123456789\n"
-        "Москва\n"
-        "ул. Примерная, д. 1, кв. 1",
-        parse_mode='Markdown'
+        return ConversationHandler.END
+
+    await query.answer()
+    # Оформляется снимок корзины на момент нажатия кнопки
+    # attempt - ключ идемпотентности: повторы этой отправки не создадут второй заказ
+    context.user_data['checkout'] = {'cart': cart.copy(), 'attempt': secrets.token_hex(8)}
+    lang = user_language(query.from_user, context.user_data)
+    await query.edit_message_text(ORDER_MESSAGES.render('checkout_name', lang), parse_mode='Markdown')
+    return CHECKOUT_NAME
+
+async def checkout_answer(update, context, field, next_prompt):
+    """Запоминает ответ шага и задает следующий вопрос"""
+    context.user_data['checkout'][field] = update.message.text.strip()
+    lang = user_language(update.effective_user, context.user_data)
+    await update.message.reply_text(ORDER_MESSAGES.render(next_prompt, lang))
+
+async def checkout_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await checkout_answer(update, context, 'name', 'checkout_phone')
+    return CHECKOUT_PHONE
+
+async def checkout_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await checkout_answer(update, context, 'phone', 'checkout_city')
+    return CHECKOUT_CITY
+
+async def checkout_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await checkout_answer(update, context, 'city', 'checkout_address')
+    return CHECKOUT_ADDRESS
+
+async def checkout_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Последний шаг: контакты собраны, оформляем заказ"""
+    contacts = context.user_data.pop('checkout')
+    await process_order(
+        update.message, update.effective_user, context, contacts['attempt'], contacts['cart'],
+        contacts['name'], contacts['phone'], contacts['city'], update.message.text.strip()
     )
-    
-    # Переходим в состояние ожидания контактных данных
-    context.user_data['waiting_for_contacts'] = True
-    context.user_data['checkout_cart'] = cart.copy()
+    return ConversationHandler.END
 
-async def handle_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает ввод контактных данных"""
-    if context.user_data.get('waiting_for_contacts'):
-        contacts = update.message.text
-        cart = context.user_data.get('checkout_cart', {})
-        
-        # Парсим контактные данные
-        contact_lines = contacts.split('\n')
-        customer_name = contact_lines[0] if len(contact_lines) > 0 else "Не указано"
-        customer_phone = contact_lines[1] if len(contact_lines) > 1 else "Не указано"
-        customer_city = contact_lines[2] if len(contact_lines) > 2 else "Не указано"
-        customer_address = contact_lines[3] if len(contact_lines) > 3 else "Не указано"
-        
-        # Создаем заказ
-        await process_order(update, context, cart, customer_name, customer_phone, customer_city, customer_address)
-        
-        # Очищаем временные данные
-        context.user_data['waiting_for_contacts'] = False
-        context.user_data['checkout_cart'] = {}
+def checkout_retry(prompt):
+    """Обработчик неподходящего ввода: повторяет вопрос, шаг не меняется"""
+    async def retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        lang = user_language(update.effective_user, context.user_data)
+        await update.message.reply_text(
+            ORDER_MESSAGES.render('checkout_invalid', lang) + ORDER_MESSAGES.render(prompt, lang)
+        )
+    return retry
+
+def checkout_step(pattern, handler, prompt):
+    """Обработчики шага: текст по шаблону ведет дальше, остальной текст - повтор вопроса"""
+    text = filters.TEXT & ~filters.COMMAND
+    return [
+        MessageHandler(text & filters.Regex(pattern), handler),
+        MessageHandler(text, checkout_retry(prompt)),
+    ]
+
+async def cancel_checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена оформления командой /cancel"""
+    context.user_data.pop('checkout', None)
+    lang = user_language(update.effective_user, context.user_data)
+    await update.message.reply_text(ORDER_MESSAGES.render('checkout_cancelled', lang))
+    return ConversationHandler.END
+
+async def checkout_expired(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Покупатель не закончил оформление за CHECKOUT_TIMEOUT"""
+    context.user_data.pop('checkout', None)
+    lang = user_language(update.effective_user, context.user_data)
+    await message_governor.send(context.bot, update.effective_chat.id, ORDER_MESSAGES.render('checkout_expired', lang))
 
-async def process_order(update, context, cart, customer_name, customer_phone, customer_city, customer_address):
-    """Обрабатывает создание заказа"""
-    user_id = update.effective_user.id
+def render_order_text(name, lang, order_data):
+    """Собирает подтверждение заказа из скомпилированных шаблонов"""
+    posting_number = order_data.get('ozon_posting_number')
+    return ORDER_MESSAGES.render(
+        name, lang,
+        summary=ORDER_MESSAGES.get('order_summary', lang).render(order_data),
+        posting=ORDER_MESSAGES.render('order_posting', lang, posting_number=posting_number) if posting_number else "",
+        date=datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+        items=ORDER_MESSAGES.get('order_item', lang).render_many(order_data['items']),
+    )
+
+async def process_order(message, user, context, attempt, cart, customer_name, customer_phone, customer_city, customer_address, accepted_prices=None):
+    """Обрабатывает создание заказа.
+    
+    Перед отправкой в Ozon цены и остатки корзины проверяются вживую; если цена
+    изменилась, покупатель сначала подтверждает заказ по новым ценам.
+    """
+    user_id = user.id
+    lang = user_language(user, context.user_data)
+    submission = None
+    committed = stored = False
     
     try:
-        # Расчет итогов
+        products = [(product, quantity) for product, quantity in cart_products(context, cart) if product]
+        if not products:
+            # Ни одного SKU корзины нет ни в одной версии каталога - продавать нечего
+            stock_ledger.release_all(user_id, cart)
+            remove_from_cart(context, cart)
+            keyboard = [[InlineKeyboardButton(ORDER_MESSAGES.render('button_continue', lang), callback_data="view_products")]]
+            await message.reply_text(ORDER_MESSAGES.render('cart_gone', lang), reply_markup=InlineKeyboardMarkup(keyboard))
+            return
+        try:
+            quotes = await quote_batcher.quote([product['ozon_id'] for product, _ in products])
+        except Exception as e:
+            # Без живых цен и остатков заказ не оформляем
+            print(f"⚠️ Не удалось проверить цены и остатки в Ozon: {e}")
+            await message.reply_text(ORDER_MESSAGES.render('ozon_unavailable', lang))
+            return
+        
+        # Расчет итогов по живым ценам
         total = 0
         items_count = 0
         order_items = []
+        changes = []
+        sold_out = []
+        
+        for product, quantity in products:
+            sku = product['ozon_id']
+            quote = quotes.get(sku)
+            # Товара нет в ответе Ozon - купить его сейчас нельзя
+            price = quote.price if quote else product['price']
+            if quote is None or quote.quantity < quantity:
+                sold_out.append({'name': product['name']})
+            shown_price = (accepted_prices or {}).get(sku, product['price'])
+            if price != shown_price:
+                changes.append({'name': product['name'], 'old': shown_price, 'new': price})
+            total += price * quantity
+            items_count += quantity
+            order_items.append({
+                'product_id': sku,
+                'offer_id': product['offer_id'],
+                'name': product['name'],
+                'quantity': quantity,
+                'price': price
+            })
         
-        for product_index, quantity in cart.items():
-            product = products_cache.get(int(product_index))
-            if product:
-                item_total = product['price'] * quantity
-                total += item_total
-                items_count += quantity
-                order_items.append({
-                    'product_id': product['product_id'],
-                    'offer_id': product['offer_id'],
-                    'name': product['name'],
-                    'quantity': quantity,
-                    'price': product['price']
-                })
-        
-        # Создаем данные заказа
-        order_id = f"order_{user_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
+        if sold_out:
+            await message.reply_text(ORDER_MESSAGES.render(
+                'sold_out', lang, items=ORDER_MESSAGES.get('sold_out_item', lang).render_many(sold_out)
+            ))
+            return
+        
+        if changes:
+            # Заказ ждет подтверждения по новым ценам
+            context.user_data['pending_order'] = {
+                'attempt': attempt,
+                'cart': cart,
+                'customer_name': customer_name,
+                'customer_phone': customer_phone,
+                'customer_city': customer_city,
+                'customer_address': customer_address,
+                'accepted_prices': {item['product_id']: item['price'] for item in order_items},
+            }
+            keyboard = [
+                [InlineKeyboardButton(ORDER_MESSAGES.render('button_confirm', lang), callback_data="confirm_order")],
+                [InlineKeyboardButton(ORDER_MESSAGES.render('button_cart', lang), callback_data="view_cart")]
+            ]
+            await message.reply_text(
+                ORDER_MESSAGES.render(
+                    'price_changed', lang, total=total,
+                    changes=ORDER_MESSAGES.get('price_change_item', lang).render_many(changes)
+                ),
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode='Markdown'
+            )
+            return
+        
+        # Попытка оформления отправляется в Ozon один раз: повторное нажатие или
+        # повтор после таймаута получает результат первой отправки
+        submission, first, previous_order = order_store.claim_submission(user_id, attempt)
+        if not first:
+            print(f"🔁 Повторная отправка заказа {submission[:12]}, Ozon не вызываем")
+            if previous_order is None:
+                await message.reply_text(ORDER_MESSAGES.render('order_in_progress', lang))
+            else:
+                created = bool(previous_order.get('ozon_posting_number') or previous_order.get('ozon_order_id'))
+                await reply_order(message, lang, previous_order, created, repeat=True)
+            return
+        
+        # Списываем резервы корзины; если резерв истек и товар уже купили - сообщаем
+        missing = stock_ledger.commit(user_id, cart)
+        if missing:
+            order_store.abandon_submission(submission)
+            names = [{'name': product['name']} for product, _ in cart_products(context, dict.fromkeys(missing, 0)) if product]
+            await message.reply_text(ORDER_MESSAGES.render(
+                'sold_out', lang, items=ORDER_MESSAGES.get('sold_out_item', lang).render_many(names)
+            ))
+            return
+        committed = True
+        
+        # Создаем данные заказа; номера выводятся из ключа попытки, а не из времени
         order_data = {
-            'order_id': order_id,
+            'order_id': f"order_{user_id}_{submission[:16]}",
+            'posting_number': f"TG{submission[:20].upper()}",
             'total': total,
             'items_count': items_count,
             'customer_name': customer_name,
@@ -859,12 +665,13 @@ async def process_order(update, context, cart, customer_name, customer_phone, cu
             'customer_address': customer_address,
             'items': order_items,
             'status': 'created',
+            'lang': lang,
             'created_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
         # Создаем заказ в Ozon
         print("🔄 Пытаемся создать заказ в Ozon...")
-        ozon_result = ozon_api.create_ozon_order(order_data)
+        ozon_result = await asyncio.to_thread(catalog.client.create_order, order_data)
         
         if ozon_result:
             # Сохраняем ID заказа Ozon
@@ -872,93 +679,74 @@ async def process_order(update, context, cart, customer_name, customer_phone, cu
                 order_data['ozon_posting_number'] = ozon_result['result'].get('posting_number')
                 order_data['ozon_order_id'] = ozon_result['result'].get('order_id')
                 order_data['status'] = 'created_in_ozon'
-            
-            # Сохраняем заказ
-            if 'orders' not in context.user_data:
-                context.user_data['orders'] = []
-            context.user_data['orders'].append(order_data)
-            
-            # Очищаем корзину
-            context.user_data['cart'] = {}
-            
-            # Формируем сообщение об успехе
-            order_text = f"✅ *Заказ создан в Ozon!*\n\n"
-            order_text += f"💰 Сумма: {total} ₽\n"
-            order_text += f"📦 Товаров: {items_count} шт.\n"
-            order_text += f"👤 Получатель: {customer_name}\n"
-            order_text += f"📞 Телефон: {customer_phone}\n"
-            order_text += f"🏠 Адрес: {customer_city}, {customer_address}\n"
-            
-            if order_data.get('ozon_posting_number'):
-                order_text += f"🔗 Номер заказа в Ozon: {order_data['ozon_posting_number']}\n"
-            
-            order_text += f"\n📅 Дата: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-            order_text += "Состав заказа:\n"
-            for item in order_items:
-                order_text += f"• {item['name']} - {item['quantity']} шт. × {item['price']} ₽\n"
-            
-            order_text += "\n📱 Вы можете отслеживать статус заказа в личном кабинете Ozon"
-            
-            keyboard = [
-                [InlineKeyboardButton("📱 Открыть личный кабинет", url="https://seller.ozon.ru/app/orders")],
-                [InlineKeyboardButton("🛍️ Продолжить покупки", callback_data="view_products")],
-                [InlineKeyboardButton("📦 Мои заказы", callback_data="view_orders")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await update.message.reply_text(order_text, reply_markup=reply_markup, parse_mode='Markdown')
-            
         else:
             # Если не удалось создать заказ в Ozon, сохраняем локально
             print("⚠️ Не удалось создать заказ в Ozon, сохраняем локально")
-            
-            # Сохраняем заказ локально
-            if 'orders' not in context.user_data:
-                context.user_data['orders'] = []
-            context.user_data['orders'].append(order_data)
-            
-            # Очищаем корзину
-            context.user_data['cart'] = {}
-            
-            order_text = f"✅ *Заказ сохранен!*\n\n"
-            order_text += f"💰 Сумма: {total} ₽\n"
-            order_text += f"📦 Товаров: {items_count} шт.\n"
-            order_text += f"👤 Получатель: {customer_name}\n"
-            order_text += f"📞 Телефон: {customer_phone}\n"
-            order_text += f"🏠 Адрес: {customer_city}, {customer_address}\n"
-            order_text += f"\n📅 Дата: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n"
-            order_text += "Состав заказа:\n"
-            for item in order_items:
-                order_text += f"• {item['name']} - {item['quantity']} шт. × {item['price']} ₽\n"
-            
-            order_text += "\n⚠️ *Внимание:* Заказ не был создан в системе Ozon автоматически. "
-            order_text += "Пожалуйста, создайте заказ вручную через личный кабинет Ozon."
-            
-            keyboard = [
-                [InlineKeyboardButton("📱 Создать заказ в Ozon", url="https://seller.ozon.ru/app/orders/create")],
-                [InlineKeyboardButton("🛍️ Продолжить покупки", callback_data="view_products")],
-                [InlineKeyboardButton("📦 Мои заказы", callback_data="view_orders")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await update.message.reply_text(order_text, reply_markup=reply_markup, parse_mode='Markdown')
-            
+            # Ozon не узнает об этой продаже из своих остатков
+            stock_ledger.mark_local(user_id, cart)
+        
+        # Сохраняем заказ и результат попытки
+        order_data['number'] = order_store.add(user_id, order_data)
+        stored = True
+        order_store.complete_submission(submission, order_data['number'])
+        
+        # Убираем из корзины только оформленное: добавленное во время оформления остается
+        remove_from_cart(context, cart)
+        
+        await reply_order(message, lang, order_data, bool(ozon_result))
+    
     except Exception as e:
         print(f"❌ Ошибка обработки заказа: {e}")
         import traceback
         traceback.print_exc()
+        # Незаписанный заказ отменяем целиком, чтобы покупатель мог повторить
+        if committed and not stored:
+            stock_ledger.rollback(user_id, cart)
+        if submission:
+            order_store.abandon_submission(submission)
         
-        await update.message.reply_text(
+        await message.reply_text(
             f"❌ Произошла ошибка при оформлении заказа:\n\n"
             f"`{str(e)}`\n\n"
             f"Попробуйте позже или обратитесь в поддержку.",
             parse_mode='Markdown'
         )
 
+async def reply_order(message, lang, order_data, created, repeat=False):
+    """Подтверждение заказа: создан в Ozon или сохранен только локально"""
+    if created:
+        order_text = render_order_text('order_created', lang, order_data)
+        first_button = InlineKeyboardButton(ORDER_MESSAGES.render('button_cabinet', lang), url="https://seller.ozon.ru/app/orders")
+    else:
+        order_text = render_order_text('order_saved', lang, order_data)
+        first_button = InlineKeyboardButton(ORDER_MESSAGES.render('button_create_in_ozon', lang), url="https://seller.ozon.ru/app/orders/create")
+    if repeat:
+        order_text = ORDER_MESSAGES.render('order_repeat', lang) + order_text
+
+    keyboard = [
+        [first_button],
+        [InlineKeyboardButton(ORDER_MESSAGES.render('button_continue', lang), callback_data="view_products")],
+        [InlineKeyboardButton(ORDER_MESSAGES.render('button_orders', lang), callback_data="view_orders")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await message.reply_text(order_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def confirm_order(query, context):
+    """Покупатель согласился с новыми ценами - оформляем заказ еще раз"""
+    pending = context.user_data.pop('pending_order', None)
+    if not pending:
+        await query.edit_message_text("❌ Заказ уже оформлен или отменен")
+        return
+    await query.edit_message_reply_markup(reply_markup=None)
+    await process_order(query.message, query.from_user, context, **pending)
+
 async def clear_cart(query, context):
     """Очищает корзину"""
-    # Очищаем корзину в user_data
+    # Возвращаем зарезервированные товары и очищаем корзину в user_data
+    stock_ledger.release_all(query.from_user.id, context.user_data.get('cart', {}))
     context.user_data['cart'] = {}
+    context.user_data.pop('cart_version', None)
     
     keyboard = [
         [InlineKeyboardButton("🛍️ Начать покупки", callback_data="view_products")],
@@ -968,10 +756,9 @@ async def clear_cart(query, context):
     
     await query.edit_message_text("🗑️ *Корзина очищена*", reply_markup=reply_markup, parse_mode='Markdown')
     
-async def show_orders(query, context):
-    """Показывает заказы пользователя"""
-    # Получаем заказы из user_data
-    orders = context.user_data.get('orders', [])
+async def show_orders(query, context, before=None):
+    """Показывает страницу истории заказов пользователя (от новых к старым)"""
+    orders, next_cursor = order_store.page(query.from_user.id, before)
     
     if not orders:
         orders_text = "📦 *У вас пока нет заказов*"
@@ -987,8 +774,8 @@ async def show_orders(query, context):
     
     orders_text = "📦 *История ваших заказов:*\n\n"
     
-    for i, order in enumerate(orders, 1):
-        orders_text += f"*Заказ #{i}:*\n"
+    for order in orders:
+        orders_text += f"*Заказ #{order['number']}:*\n"
         orders_text += f"💰 Сумма: {order['total']} ₽\n"
         orders_text += f"📅 Дата: {order['created_at']}\n"
         orders_text += f"📦 Товаров: {order['items_count']} шт.\n"
@@ -1005,6 +792,10 @@ async def show_orders(query, context):
         [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")],
         [InlineKeyboardButton("🛍️ К товарам", callback_data="view_products")]
     ]
+    if next_cursor:
+        keyboard.insert(0, [InlineKeyboardButton("⬅️ Более ранние заказы", callback_data=f"orders_before_{next_cursor}")])
+    if before is not None:
+        keyboard.insert(0, [InlineKeyboardButton("⏮ Последние заказы", callback_data="view_orders")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(orders_text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -1012,9 +803,9 @@ async def show_orders(query, context):
 async def refresh_products_callback(query, context):
     """Обновляет товары через callback"""
     await query.edit_message_text("🔄 Обновляем список реальных товаров...")
-    products_count_before = len(products_cache)
+    products_count_before = len(catalog.products)
     await load_real_products()
-    products_count_after = len(products_cache)
+    products_count_after = len(catalog.products)
     
     if products_count_after > 0:
         keyboard = [
@@ -1043,32 +834,85 @@ async def refresh_products_callback(query, context):
             parse_mode='Markdown'
         )
 
+async def notify_status_change(bot, order, status):
+    """Сообщает владельцу заказа о новом статусе отправления"""
+    lang = order.get('lang', 'ru')
+    text = ORDER_MESSAGES.render(
+        'status_changed', lang,
+        number=order['number'],
+        posting_number=order['ozon_posting_number'],
+        status=STATUS_LABELS.get(lang, STATUS_LABELS['ru']).get(status, status.replace('_', ' '))
+    )
+    await message_governor.send(bot, order['user_id'], text, parse_mode='Markdown')
+
+async def post_init(application):
+    """Запускает фоновые задачи после старта бота"""
+    poller = OrderStatusPoller(
+        lambda: catalog.client, order_store,
+        lambda order, status: notify_status_change(application.bot, order, status)
+    )
+    # Храним ссылку на задачу, чтобы ее не собрал сборщик мусора
+    application.bot_data['status_task'] = asyncio.create_task(poller.run())
+
 async def preload_products():
     """Предзагрузка товаров при запуске"""
     print("🔄 Предзагрузка реальных товаров...")
     await load_real_products()
-    if products_cache:
-        print(f"✅ Загружено {len(products_cache)} реальных товаров")
+    if catalog.products:
+        print(f"✅ Загружено {len(catalog.products)} реальных товаров")
     else:
         print("❌ Не удалось загрузить реальные товары")
 
+# Таблица маршрутов callback-кнопок
+callback_router = CallbackRouter()
+decode_product_token = product_token_decoder(catalog)
+callback_router.route("view_products", show_products)
+callback_router.route("view_cart", show_cart)
+callback_router.route("view_orders", show_orders)
+callback_router.prefix("orders_before_", show_orders, int)
+callback_router.route("refresh_products", refresh_products_callback)
+callback_router.route("clear_cart", clear_cart)
+callback_router.route("confirm_order", confirm_order)
+callback_router.route("ozon_cabinet", open_ozon_cabinet)
+callback_router.prefix("pa:", add_to_cart, decode_product_token)
+callback_router.prefix("pn:", show_next_product, decode_product_token)
+callback_router.prefix("pp:", show_prev_product, decode_product_token)
+# Кнопки в сообщениях, отправленных до перехода на токены
+callback_router.prefix("product_add_", add_to_cart, expired_product_index)
+callback_router.prefix("product_next_", show_next_product, expired_product_index)
+callback_router.prefix("product_prev_", show_prev_product, expired_product_index)
+
+# Оформление заказа по шагам. Пока у пользователя нет активного оформления,
+# его текстовые сообщения отсекаются одной проверкой словаря разговоров
+checkout_conversation = ConversationHandler(
+    entry_points=[CallbackQueryHandler(checkout, pattern=r'^checkout$')],
+    states={
+        CHECKOUT_NAME: checkout_step(NAME_PATTERN, checkout_name, 'checkout_name'),
+        CHECKOUT_PHONE: checkout_step(PHONE_PATTERN, checkout_phone, 'checkout_phone'),
+        CHECKOUT_CITY: checkout_step(CITY_PATTERN, checkout_city, 'checkout_city'),
+        CHECKOUT_ADDRESS: checkout_step(ADDRESS_PATTERN, checkout_address, 'checkout_address'),
+        ConversationHandler.TIMEOUT: [TypeHandler(Update, checkout_expired)],
+    },
+    fallbacks=[CommandHandler("cancel", cancel_checkout)],
+    conversation_timeout=CHECKOUT_TIMEOUT,
+    allow_reentry=True,
+)
+
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN не найден!")
         return
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
     
     # Обработчики
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("refresh", refresh_products))
+    # Оформление заказа - раньше общего обработчика кнопок, чтобы получить "checkout"
+    application.add_handler(checkout_conversation)
     application.add_handler(CallbackQueryHandler(handle_callback))
     
-    # Добавляем обработчик текстовых сообщений для контактов
-    from telegram.ext import MessageHandler, filters
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_contacts))
-    
     # Предзагрузка реальных товаров
     print("🔄 Загрузка реальных товаров из Ozon...")
     
@@ -0,0 +1,104 @@
+import secrets
+from collections import OrderedDict
+
+# URL-safe алфавит: 6 бит на символ
+TOKEN_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ-_"
+
+# Ограничение Telegram на размер callback_data
+CALLBACK_DATA_LIMIT = 64
+# Длина случайного префикса токенов процесса: 24 бита
+PROCESS_TAG_LENGTH = 4
+
+
+def encode_token(number):
+    """Кодирует неотрицательное число коротким токеном"""
+    chars = []
+    while True:
+        number, digit = divmod(number, 64)
+        chars.append(TOKEN_ALPHABET[digit])
+        if not number:
+            return "".join(reversed(chars))
+
+
+class CallbackPayloadStore:
+    """LRU-хранилище данных callback-кнопок.
+
+    В кнопку попадает только действие и короткий токен ("pa:1x"), а сам
+    payload и версия каталога, для которой кнопка создана, хранятся на
+    сервере. Так callback_data укладывается в 64 байта при любых SKU.
+
+    Токены начинаются со случайного префикса процесса: кнопки, выданные до
+    перезапуска бота, не совпадут с новыми токенами и просто устареют.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.items = OrderedDict()  # token -> (action, version, payload)
+        self.tokens = {}  # (action, version, payload) -> token
+        self.counter = 0
+        self.tag = "".join(secrets.choice(TOKEN_ALPHABET) for _ in range(PROCESS_TAG_LENGTH))
+
+    def encode(self, action, payload, version):
+        """Возвращает callback_data вида "<action>:<token>" для payload"""
+        key = (action, version, payload)
+        token = self.tokens.get(key)
+        if token is not None and token in self.items:
+            self.items.move_to_end(token)
+        else:
+            token = self.tag + encode_token(self.counter)
+            self.counter += 1
+            self.items[token] = key
+            self.tokens[key] = token
+            if len(self.items) > self.capacity:
+                self._evict()
+
+        data = f"{action}:{token}"
+        if len(data.encode()) > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data}")
+        return data
+
+    def _evict(self):
+        """Удаляет самый давно использованный токен"""
+        token, key = self.items.popitem(last=False)
+        if self.tokens.get(key) == token:
+            del self.tokens[key]
+
+    def resolve(self, token):
+        """Возвращает (version, payload) по токену или None, если он устарел"""
+        entry = self.items.get(token)
+        if entry is None:
+            return None
+        self.items.move_to_end(token)
+        action, version, payload = entry
+        return version, payload
+
+
+# Общий экземпляр для кнопок бота
+callback_payloads = CallbackPayloadStore()
+
+
+def product_token_decoder(catalog, store=callback_payloads):
+    """Декодер токенов кнопок товаров для CallbackRouter.
+
+    Payload кнопки - (ключ товара, SKU). Ключ годится, только если под ним в
+    текущем каталоге тот же SKU; иначе товар ищется по SKU. None - товара
+    больше нет или токен устарел.
+    """
+    def decode(token):
+        entry = store.resolve(token)
+        if entry is None:
+            return None
+        _, (key, sku) = entry
+        # Товар и индекс SKU читаются из одного снимка каталога
+        snapshot = catalog.current
+        product = snapshot.products.get(key)
+        if product is not None and product.get('ozon_id', key) == sku:
+            return key
+        return snapshot.index_by_sku.get(sku)
+    return decode
+
+
+def expired_product_index(data):
+    """Кнопки до перехода на токены несут только позицию товара без SKU:
+    проверить, что это тот же товар, нельзя - считаем их устаревшими"""
+    return None
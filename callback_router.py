@@ -0,0 +1,62 @@
+class CallbackRouter:
+    """Таблица маршрутов callback_data вместо цепочки if/elif.
+
+    Точные значения ищутся одним обращением к словарю. Для префиксных
+    маршрутов (например "product_next_" + индекс) перебираются только
+    различные длины зарегистрированных префиксов, поэтому время разбора
+    не зависит от количества действий.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+        self.prefix_lengths = []
+
+    def route(self, data, handler):
+        """Регистрирует обработчик для точного значения callback_data"""
+        self.exact[data] = handler
+        return handler
+
+    def prefix(self, prefix, handler, decode=None):
+        """Регистрирует обработчик для префикса; остаток строки
+        передается обработчику, при необходимости через decode (например int)"""
+        self.prefixes[prefix] = (handler, decode)
+        if len(prefix) not in self.prefix_lengths:
+            self.prefix_lengths.append(len(prefix))
+            # Сначала проверяем самые длинные префиксы
+            self.prefix_lengths.sort(reverse=True)
+        return handler
+
+    def resolve(self, data):
+        """Находит обработчик и аргументы для callback_data.
+
+        Возвращает (handler, args) или (None, ()) если маршрут не найден
+        или аргумент не удалось декодировать.
+        """
+        handler = self.exact.get(data)
+        if handler is not None:
+            return handler, ()
+
+        for length in self.prefix_lengths:
+            entry = self.prefixes.get(data[:length])
+            if entry is None:
+                continue
+            handler, decode = entry
+            payload = data[length:]
+            if decode is not None:
+                try:
+                    payload = decode(payload)
+                except (ValueError, TypeError, KeyError):
+                    print(f"⚠️ Некорректные данные callback: {data}")
+                    return None, ()
+            return handler, (payload,)
+
+        return None, ()
+
+    async def dispatch(self, data, *args):
+        """Вызывает обработчик для callback_data; возвращает False если маршрута нет"""
+        handler, payload = self.resolve(data or "")
+        if handler is None:
+            return False
+        await handler(*args, *payload)
+        return True
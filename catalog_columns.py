@@ -0,0 +1,140 @@
+import numpy as np
+
+# Поля остатка в ответах Ozon; берется наибольшее
+STOCK_FIELDS = ('stock', 'fbo_stock', 'fbs_stock')
+
+
+def number_column(values):
+    """Колонка чисел из строк и чисел Ozon ("1990.00", 15, None); пустые - 0"""
+    try:
+        return np.array([value or 0 for value in values], dtype=str).astype(np.float64)
+    except ValueError:
+        # В ответе попалось нечисловое значение - разбираем поштучно
+        return np.fromiter((_to_float(value) for value in values), np.float64, len(values))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def id_column(ids):
+    """Колонка product_id; отсутствующий id - -1"""
+    return np.array([-1 if product_id is None else product_id for product_id in ids], dtype=np.int64)
+
+
+def select_price(base, marketing, old, minimum):
+    """Цена для покупателя: меньшая из базовой и маркетинговой,
+    если их нет - старая, затем минимальная"""
+    price = np.where((marketing > 0) & ((marketing < base) | (base <= 0)), marketing, base)
+    price = np.where(price > 0, price, old)
+    return np.where(price > 0, price, minimum).astype(np.int64)
+
+
+def max_stock(columns):
+    """Наибольший из остатков stock / fbo_stock / fbs_stock"""
+    return np.max(np.vstack(columns), axis=0).astype(np.int64)
+
+
+def warehouse_totals(counts, present, reserved=None):
+    """Суммы по складам каждого товара: counts - число складов у товара,
+    present/reserved - значения всех складов подряд"""
+    free = number_column(present)
+    if reserved is not None:
+        free = np.maximum(free - number_column(reserved), 0)
+    counts = np.array(counts, dtype=np.intp)
+    totals = np.zeros(len(counts), dtype=np.int64)
+    filled = counts > 0
+    if filled.any():
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        totals[filled] = np.add.reduceat(free, starts).astype(np.int64)
+    return totals
+
+
+class PriceBatch:
+    """Сырые поля цен из потока v5/product/info/prices, разобранные по колонкам"""
+
+    def __init__(self):
+        self.ids = []
+        self.base = []
+        self.marketing = []
+        self.old = []
+        self.minimum = []
+
+    def add(self, item):
+        price = item.get('price')
+        if not isinstance(price, dict):
+            price = item  # плоская структура
+        self.ids.append(item.get('product_id'))
+        self.base.append(price.get('price'))
+        self.marketing.append(price.get('marketing_price'))
+        self.old.append(price.get('old_price'))
+        self.minimum.append(price.get('min_price'))
+
+    def columns(self):
+        """(product_id, цена) для всей пачки"""
+        return id_column(self.ids), select_price(
+            number_column(self.base), number_column(self.marketing),
+            number_column(self.old), number_column(self.minimum)
+        )
+
+
+class StockBatch:
+    """Сырые поля остатков: общие stock-поля и, если есть, остатки по складам"""
+
+    def __init__(self):
+        self.ids = []
+        self.fields = {field: [] for field in STOCK_FIELDS}
+        self.counts = []
+        self.present = []
+        self.reserved = []
+
+    def add(self, item, warehouses=()):
+        self.ids.append(item.get('product_id'))
+        for field, values in self.fields.items():
+            values.append(item.get(field))
+        self.counts.append(len(warehouses))
+        for stock in warehouses:
+            self.present.append(stock.get('present'))
+            self.reserved.append(stock.get('reserved'))
+
+    def max_fields(self):
+        return max_stock([number_column(values) for values in self.fields.values()])
+
+    def free(self):
+        """Свободный остаток по складам (present - reserved)"""
+        return warehouse_totals(self.counts, self.present, self.reserved)
+
+
+class CatalogColumns:
+    """Цены и остатки товаров каталога в NumPy-колонках.
+
+    Позиция в колонке совпадает с позицией товара в списке product_ids,
+    ответы Ozon раскладываются по позициям векторно через searchsorted.
+    """
+
+    def __init__(self, product_ids, default_quantity):
+        self.product_ids = id_column(product_ids)
+        self._order = np.argsort(self.product_ids, kind='stable')
+        self._sorted = self.product_ids[self._order]
+        self.price = np.zeros(len(self.product_ids), dtype=np.int64)
+        self.quantity = np.full(len(self.product_ids), default_quantity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def positions(self, ids):
+        """Позиции товаров ids в каталоге; -1 для неизвестных"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self._sorted):
+            return np.full(len(ids), -1, dtype=np.intp)
+        found = np.minimum(np.searchsorted(self._sorted, ids), len(self._sorted) - 1)
+        return np.where(self._sorted[found] == ids, self._order[found], -1)
+
+    def assign(self, column, ids, values):
+        """Записывает значения из ответа Ozon в колонку по product_id"""
+        positions = self.positions(ids)
+        known = positions >= 0
+        column[positions[known]] = np.asarray(values)[known]
@@ -0,0 +1,50 @@
+import asyncio
+
+# Сколько собирать SKU от одновременных оформлений перед общим запросом к Ozon
+QUOTE_WINDOW = 0.25
+
+
+class QuoteBatcher:
+    """Живые цены и остатки для оформления заказа.
+
+    Запросы, пришедшие в течение QUOTE_WINDOW, склеиваются: SKU всех корзин
+    объединяются без повторов и проверяются одним пакетным запросом цен и
+    одним запросом остатков.
+    """
+
+    def __init__(self, catalog, window=QUOTE_WINDOW):
+        self.catalog = catalog
+        self.window = window
+        self.pending = None
+        self.batches = 0
+        self.requests = 0
+
+    async def quote(self, skus):
+        """{sku: Quote} для запрошенных SKU; исключение, если Ozon недоступен"""
+        self.requests += 1
+        pending = self.pending
+        if pending is None:
+            pending = self.pending = {
+                'skus': set(),
+                'future': asyncio.get_running_loop().create_future()
+            }
+            asyncio.create_task(self._flush(pending))
+        pending['skus'].update(skus)
+        # shield: отмена одного оформления не должна отменять общий запрос
+        quotes = await asyncio.shield(pending['future'])
+        return {sku: quotes[sku] for sku in skus if sku in quotes}
+
+    async def _flush(self, pending):
+        await asyncio.sleep(self.window)
+        # Новые запросы с этого момента собираются в следующую пачку
+        if self.pending is pending:
+            self.pending = None
+        self.batches += 1
+        try:
+            quotes = await asyncio.to_thread(self.catalog.quote, sorted(pending['skus']))
+        except Exception as e:
+            pending['future'].set_exception(e)
+            # Помечаем исключение полученным: если ждать уже некому, asyncio не станет о нем писать
+            pending['future'].exception()
+        else:
+            pending['future'].set_result(quotes)
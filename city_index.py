@@ -0,0 +1,126 @@
+import bisect
+import difflib
+import mmap
+import os
+import re
+from collections import namedtuple
+
+# Встроенный справочник городов: ключ, названия, страна, координаты, синонимы
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.tsv')
+
+# Насколько похожей должна быть строка с опечаткой на известное название
+FUZZY_CUTOFF = 0.8
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+
+class City(namedtuple('City', ['key', 'name_ru', 'name_en', 'country', 'lat', 'lon'])):
+    """Город из справочника"""
+    __slots__ = ()
+
+    @property
+    def query(self):
+        """Запрос к погодному API по координатам"""
+        return f"{self.lat},{self.lon}"
+
+
+def normalize_city(text):
+    """Приводит название к виду для поиска: нижний регистр, без пунктуации"""
+    text = text.lower().replace('ё', 'е')
+    text = re.sub(r"[\s\-_.,'’`]+", ' ', text)
+    return text.strip()
+
+
+def transliterate(text):
+    """Транслитерация кириллицы латиницей"""
+    return ''.join(TRANSLIT.get(char, char) for char in text)
+
+
+class CityIndex:
+    """Индекс городов поверх memory-mapped файла справочника.
+
+    В памяти хранится только словарь "нормализованное название -> смещение
+    строки в файле"; сама строка разбирается при первом обращении.
+    """
+
+    def __init__(self, path=CITIES_PATH):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = {}
+        self.records = {}
+        self._build()
+        self.names = list(self.offsets)
+        # Отсортированные названия для поиска по префиксу (подсказки при наборе)
+        self.sorted_names = sorted(self.offsets)
+        print(f"🗺️ Справочник городов: {len(self.records)} городов, {len(self.offsets)} вариантов названий")
+
+    def _build(self):
+        offset = 0
+        size = len(self.data)
+        while offset < size:
+            end = self.data.find(b'\n', offset)
+            if end == -1:
+                end = size
+            line = self.data[offset:end].decode('utf-8')
+            if line.strip() and not line.startswith('#'):
+                fields = line.split('\t')
+                aliases = [alias for alias in fields[6].split('|') if alias]
+                for name in [fields[0], fields[1], fields[2]] + aliases:
+                    normalized = normalize_city(name)
+                    self.offsets.setdefault(normalized, offset)
+                    self.offsets.setdefault(transliterate(normalized), offset)
+                self.records[offset] = None
+            offset = end + 1
+
+    def _record(self, offset):
+        city = self.records.get(offset)
+        if city is None:
+            end = self.data.find(b'\n', offset)
+            fields = self.data[offset:end if end != -1 else len(self.data)].decode('utf-8').split('\t')
+            city = City(fields[0], fields[1], fields[2], fields[3], float(fields[4]), float(fields[5]))
+            self.records[offset] = city
+        return city
+
+    def resolve(self, text):
+        """Находит город по свободному вводу (синонимы, транслит, опечатки).
+
+        Возвращает City или None, если город неизвестен.
+        """
+        normalized = normalize_city(text)
+        if not normalized:
+            return None
+
+        offset = self.offsets.get(normalized)
+        if offset is None:
+            offset = self.offsets.get(transliterate(normalized))
+        if offset is None:
+            matches = difflib.get_close_matches(normalized, self.names, n=1, cutoff=FUZZY_CUTOFF)
+            if not matches:
+                return None
+            offset = self.offsets[matches[0]]
+        return self._record(offset)
+
+    def suggest(self, text, limit=5):
+        """Города, одно из названий которых начинается с введенного текста"""
+        prefix = normalize_city(text)
+        if not prefix:
+            return []
+
+        cities = []
+        seen = set()
+        for candidate in dict.fromkeys([prefix, transliterate(prefix)]):
+            position = bisect.bisect_left(self.sorted_names, candidate)
+            while position < len(self.sorted_names) and self.sorted_names[position].startswith(candidate):
+                offset = self.offsets[self.sorted_names[position]]
+                if offset not in seen:
+                    seen.add(offset)
+                    cities.append(self._record(offset))
+                    if len(cities) == limit:
+                        return cities
+                position += 1
+        return cities
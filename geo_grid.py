@@ -0,0 +1,70 @@
+from city_index import City
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Точность 5 символов - ячейка примерно 4.9 x 4.9 км
+GRID_PRECISION = 5
+
+
+def geohash_encode(lat, lon, precision=GRID_PRECISION):
+    """Кодирует координаты в geohash заданной длины"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            bounds[0] = middle
+        else:
+            bits <<= 1
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_center(geohash):
+    """Центр ячейки geohash: (lat, lon)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if (value >> shift) & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def grid_place(lat, lon, precision=GRID_PRECISION):
+    """Место для запроса погоды по координатам, привязанное к ячейке сетки.
+
+    Все точки одной ячейки получают один ключ кэша и один запрос к API
+    (по центру ячейки). Название берется из ответа API.
+    """
+    return place_for_cell(geohash_encode(lat, lon, precision))
+
+
+def place_for_cell(geohash):
+    """Место по geohash ячейки"""
+    center_lat, center_lon = geohash_center(geohash)
+    key = f"gh:{geohash}"
+    return City(key, '', key, '', round(center_lat, 4), round(center_lon, 4))
+
+
+def is_cell_key(key):
+    return key.startswith("gh:")
@@ -0,0 +1,143 @@
+import codecs
+import json
+
+# Размер куска, который читается из ответа за раз
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = " \t\r\n"
+
+_decoder = json.JSONDecoder()
+
+
+class _Chunks:
+    """Буфер текста поверх потока байтовых кусков"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ""
+        self.pos = 0
+        self.finished = False
+
+    def more(self):
+        """Дочитывает следующий кусок; False, если поток закончился"""
+        if self.finished:
+            return False
+        chunk = next(self.chunks, None)
+        # Уже разобранное начало буфера выбрасываем, чтобы он не рос
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        if chunk is None:
+            self.finished = True
+            self.text += self.utf8.decode(b"", final=True)
+        else:
+            self.text += self.utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def peek(self):
+        """Следующий значимый символ (пробелы пропускаются) или "" в конце потока"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ""
+
+    def take(self):
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def string(self):
+        """Читает строку JSON, начиная с открывающей кавычки"""
+        while True:
+            try:
+                value, end = json.decoder.scanstring(self.text, self.pos + 1)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def value(self):
+        """Разбирает одно значение JSON целиком (C-парсером json)"""
+        while True:
+            self.peek()
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # Число в самом конце буфера могло оборваться на границе куска
+            if end == len(self.text) and not self.finished:
+                self.more()
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """Пропускает значение, не собирая вложенные объекты"""
+        char = self.peek()
+        if char not in "{[":
+            if char == '"':
+                self.string()
+            else:
+                self.value()
+            return
+        depth = 0
+        while True:
+            char = self.take()
+            if char == "":
+                raise json.JSONDecodeError("Unexpected end of stream", self.text, self.pos)
+            if char == '"':
+                self.pos -= 1
+                self.string()
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def _find(stream, path):
+    """Спускается по ключам path до нужного значения; False, если ключа нет"""
+    for key in path:
+        if stream.take() != "{":
+            return False
+        while True:
+            char = stream.peek()
+            if char != '"':
+                return False
+            name = stream.string()
+            if stream.take() != ":":
+                raise json.JSONDecodeError("Expected ':'", stream.text, stream.pos)
+            if name == key:
+                break
+            stream.skip()
+            if stream.take() != ",":
+                return False
+    return True
+
+
+def iter_items(chunks, path=('result', 'items')):
+    """Отдает элементы массива по пути path из потока JSON по одному.
+
+    Целиком в память попадает только текущий элемент: все, что лежит после
+    массива, не читается, а соседние ключи перед ним пропускаются без разбора.
+    """
+    stream = _Chunks(chunks)
+    if not _find(stream, path) or stream.take() != "[":
+        return
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.value()
+        char = stream.take()
+        if char == "]":
+            return
+        if char != ",":
+            raise json.JSONDecodeError("Expected ',' or ']'", stream.text, stream.pos)
@@ -0,0 +1,61 @@
+from string import Formatter
+
+# Язык по умолчанию и языки, для которых есть переводы
+DEFAULT_LANGUAGE = 'ru'
+# Пользователи с этими языками интерфейса получают русские тексты
+RUSSIAN_SPEAKING = ('ru', 'uk', 'be', 'kk')
+
+
+class Template:
+    """Шаблон сообщения, разобранный один раз при загрузке.
+
+    Рендер - одна сборка строки через str.format_map без цепочек "+=";
+    список полей проверяется при загрузке, а не при первой отправке.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.fields = []
+        for _, field, _, _ in Formatter().parse(source):
+            if field is not None and field not in self.fields:
+                self.fields.append(field)
+
+    def render(self, values):
+        return self.source.format_map(values)
+
+    def render_many(self, rows, separator=""):
+        """Рендерит шаблон для каждой строки и склеивает результат одним join"""
+        format_map = self.source.format_map
+        return separator.join([format_map(row) for row in rows])
+
+
+class MessageCatalog:
+    """Набор скомпилированных шаблонов по языкам.
+
+    Если перевода нет, используется шаблон языка по умолчанию.
+    """
+
+    def __init__(self, templates, default=DEFAULT_LANGUAGE):
+        self.default = default
+        self.templates = {
+            language: {name: Template(source) for name, source in sources.items()}
+            for language, sources in templates.items()
+        }
+
+    def get(self, name, language=None):
+        templates = self.templates.get(language) or self.templates[self.default]
+        template = templates.get(name)
+        if template is None:
+            template = self.templates[self.default][name]
+        return template
+
+    def render(self, name, language=None, **values):
+        return self.get(name, language).render(values)
+
+
+def user_language(user, user_data=None):
+    """Язык пользователя: явно выбранный через настройки или язык его Telegram"""
+    if user_data and user_data.get('lang'):
+        return user_data['lang']
+    code = (getattr(user, 'language_code', None) or DEFAULT_LANGUAGE).split('-')[0].lower()
+    return 'ru' if code in RUSSIAN_SPEAKING else 'en'
@@ -0,0 +1,171 @@
+import asyncio
+import datetime
+import os
+
+# Как часто сверять статусы отправлений с Ozon
+STATUS_POLL_INTERVAL = int(os.environ.get('STATUS_POLL_INTERVAL', '300'))
+# Сколько открытых отправлений сверять за проход
+POSTINGS_PER_POLL = 300
+# Размер страницы v3/posting/fbs/list (максимум Ozon)
+POSTINGS_PAGE = 1000
+# Больше страниц списка за один проход не запрашиваем, чтобы не нагружать Ozon
+MAX_PAGES_PER_POLL = 20
+# Запас по времени: отправление в Ozon создается чуть раньше или позже заказа в базе
+DATE_MARGIN = datetime.timedelta(days=1)
+# Статусы отправлений Ozon: по ним можно фильтровать v3/posting/fbs/list
+# (у заказов бывают и свои статусы, например created_in_ozon)
+OZON_POSTING_STATUSES = frozenset({
+    'awaiting_registration', 'acceptance_in_progress', 'awaiting_approve',
+    'awaiting_packaging', 'awaiting_deliver', 'sent_by_seller', 'driver_pickup',
+    'delivering', 'arbitration', 'client_arbitration', 'not_accepted',
+})
+# После стольких проверок, в которых Ozon не знает отправление, перестаем его сверять
+MAX_MISSES = 5
+# Статус заказа, отправление которого Ozon так и не узнал
+LOST_STATUS = 'not_found'
+
+
+def ozon_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def list_filter(orders, status=None):
+    """Фильтр v3/posting/fbs/list: период создания заказов orders и статус"""
+    created = [order['created_ts'] for order in orders]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    since = datetime.datetime.fromtimestamp(min(created), datetime.timezone.utc) - DATE_MARGIN
+    to = min(datetime.datetime.fromtimestamp(max(created), datetime.timezone.utc) + DATE_MARGIN, now)
+    period = {"since": ozon_time(since), "to": ozon_time(to)}
+    if status:
+        period["status"] = status
+    return period
+
+
+class OrderStatusPoller:
+    """Фоновая сверка статусов отправлений Ozon с историей заказов.
+
+    За проход сверяется не больше POSTINGS_PER_POLL открытых отправлений из
+    базы; следующий проход продолжает с места, где остановился предыдущий.
+    Отправления проверяются общими страницами v3/posting/fbs/list, отфильтрованными
+    по периоду создания этих заказов и по их текущему статусу, - так список
+    не зависит от того, сколько всего отправлений у продавца. Отправления, которых
+    в списке нет (статус сменился или Ozon их не знает), проверяются по одному
+    через v3/posting/fbs/get. Все запросы идут через общий ограничитель Ozon.
+    Об изменившихся статусах сообщается через notify.
+    """
+
+    def __init__(self, client_factory, store, notify, interval=STATUS_POLL_INTERVAL, batch=POSTINGS_PER_POLL):
+        self.client_factory = client_factory
+        self.store = store
+        self.notify = notify  # async notify(order, status)
+        self.interval = interval
+        self.batch = batch
+        self.cursor = 0  # номер заказа, после которого продолжать
+
+    def list_statuses(self, client, orders):
+        """Статусы отправлений orders, найденных в v3/posting/fbs/list.
+
+        Заказы группируются по текущему статусу; для статусов Ozon список
+        фильтруется и по статусу. Возвращает ({posting_number: status}, ответил ли Ozon).
+        """
+        groups = {}
+        for order in orders:
+            status = order.get('status')
+            groups.setdefault(status if status in OZON_POSTING_STATUSES else None, []).append(order)
+        statuses = {}
+        pages = 0
+        for status, group in groups.items():
+            wanted = {order['ozon_posting_number'] for order in group}
+            found = 0
+            offset = 0
+            while pages < MAX_PAGES_PER_POLL:
+                pages += 1
+                postings = client.post_items("/v3/posting/fbs/list", {
+                    "dir": "ASC",
+                    "filter": list_filter(group, status),
+                    "limit": POSTINGS_PAGE,
+                    "offset": offset,
+                }, items_path=('result', 'postings'))
+                if postings is None:
+                    return statuses, False
+                seen = 0
+                for posting in postings:
+                    seen += 1
+                    number = posting.get('posting_number')
+                    if number in wanted and number not in statuses:
+                        statuses[number] = posting.get('status')
+                        found += 1
+                # Последняя страница или все отправления группы уже найдены
+                if seen < POSTINGS_PAGE or found == len(wanted):
+                    break
+                offset += POSTINGS_PAGE
+        return statuses, True
+
+    def fetch_statuses(self, orders):
+        """Статусы отправлений заказов (блокирующие запросы).
+
+        Возвращает {posting_number: status или None, если Ozon отправление не
+        знает}. Если Ozon недоступен, возвращает то, что успели проверить.
+        """
+        client = self.client_factory()
+        statuses, answered = self.list_statuses(client, orders)
+        if not answered:
+            print("⚠️ Сверка статусов прервана: Ozon не вернул список отправлений")
+            return statuses
+        for order in orders:
+            number = order['ozon_posting_number']
+            if number in statuses:
+                continue
+            try:
+                posting = client.get_posting(number)
+            except Exception as e:
+                print(f"⚠️ Сверка статусов прервана: {e}")
+                break
+            statuses[number] = None if posting is None else posting.get('status')
+        return statuses
+
+    async def poll_once(self):
+        """Один проход сверки; возвращает число изменившихся заказов"""
+        orders = self.store.open_postings(self.cursor, self.batch)
+        if not orders:
+            self.cursor = 0
+            return 0
+        statuses = await asyncio.to_thread(self.fetch_statuses, orders)
+        checked = [order for order in orders if order['ozon_posting_number'] in statuses]
+        if len(checked) == len(orders) and len(orders) < self.batch:
+            self.cursor = 0
+        elif checked:
+            self.cursor = checked[-1]['number']
+
+        changed = 0
+        for order in checked:
+            posting_number = order['ozon_posting_number']
+            status = statuses[posting_number]
+            if status is None:
+                # Промахи хранятся в базе, чтобы перезапуск бота не сбрасывал счет
+                if self.store.record_miss(order['number']) < MAX_MISSES:
+                    continue
+                print(f"⚠️ Ozon не знает отправление {posting_number} (заказ #{order['number']}), больше не сверяем")
+                self.store.update_status(order['number'], LOST_STATUS)
+                self.store.clear_miss(order['number'])
+                continue
+            self.store.clear_miss(order['number'])
+            if not status or status == order.get('status'):
+                continue
+            self.store.update_status(order['number'], status)
+            changed += 1
+            try:
+                await self.notify(order, status)
+            except Exception as e:
+                print(f"❌ Не удалось сообщить о статусе заказа #{order['number']}: {e}")
+        print(f"📮 Сверка статусов: проверено {len(checked)} из {len(orders)}, изменилось {changed}")
+        return changed
+
+    async def run(self):
+        """Фоновая задача: сверка раз в interval секунд"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"❌ Ошибка сверки статусов заказов: {e}")
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Сколько дней хранить заказы
+ORDER_RETENTION_DAYS = int(os.environ.get('ORDER_RETENTION_DAYS', '365'))
+# Заказов на одной странице истории
+ORDERS_PAGE_SIZE = 5
+# Через сколько новых заказов чистить старые
+COMPACT_EVERY = 1000
+# Сколько помнить попытки оформления
+SUBMISSION_TTL = 24 * 60 * 60
+
+def orders_db_path(bot_name):
+    """Путь к базе заказов бота: ORDERS_DB_PATH_<БОТ> или orders_<бот>.db.
+
+    Боты хранят заказы в разных форматах, поэтому база у каждого своя.
+    """
+    return os.environ.get(f'ORDERS_DB_PATH_{bot_name.upper()}', f'orders_{bot_name}.db')
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT,
+    posting_number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_user_id ON orders (user_id);
+CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at);
+-- Отправления, статус которых еще может измениться: их сверяет поллер статусов
+-- (not_found - Ozon так и не узнал отправление, см. order_status)
+DROP INDEX IF EXISTS orders_open_postings;
+CREATE INDEX IF NOT EXISTS orders_tracked_postings ON orders (id)
+    WHERE posting_number IS NOT NULL AND status NOT IN ('delivered', 'cancelled', 'not_found');
+-- Сколько раз подряд Ozon не нашел отправление заказа (см. order_status)
+CREATE TABLE IF NOT EXISTS posting_misses (
+    order_id INTEGER PRIMARY KEY,
+    misses INTEGER NOT NULL
+);
+-- Попытки оформления: ключ идемпотентности -> заказ (NULL, пока отправка идет)
+CREATE TABLE IF NOT EXISTS submissions (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    order_id INTEGER
+);
+"""
+
+
+def submission_key(user_id, attempt):
+    """Ключ идемпотентности: пользователь + попытка оформления"""
+    return hashlib.sha256(f"{user_id}:{attempt}".encode()).hexdigest()
+
+
+class OrderStore:
+    """История заказов в SQLite.
+
+    Заказы только добавляются (меняются лишь статус и номер отправления), страница
+    истории читается по индексу user_id от курсора, поэтому ее стоимость не
+    зависит от того, сколько заказов у пользователя всего. Заказы старше
+    ORDER_RETENTION_DAYS удаляются при запуске и каждые COMPACT_EVERY заказов.
+    """
+
+    def __init__(self, path, retention_days=ORDER_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            # auto_vacuum действует только для новой базы - до создания таблиц
+            self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.executescript(SCHEMA)
+        self.added = 0
+        self.compact()
+
+    def add(self, user_id, order, status=None, posting_number=None):
+        """Сохраняет заказ; возвращает его номер в базе"""
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                "INSERT INTO orders (user_id, created_at, status, posting_number, data) VALUES (?, ?, ?, ?, ?)",
+                (user_id, time.time(), status or order.get('status'),
+                 posting_number or order.get('ozon_posting_number'),
+                 json.dumps(order, ensure_ascii=False, default=str))
+            )
+        self.added += 1
+        if self.added % COMPACT_EVERY == 0:
+            self.compact()
+        return cursor.lastrowid
+
+    def page(self, user_id, before=None, size=ORDERS_PAGE_SIZE):
+        """Страница заказов пользователя от новых к старым.
+
+        Возвращает (заказы, курсор следующей страницы или None); курсор - номер
+        последнего показанного заказа.
+        """
+        query = "SELECT id, user_id, created_at, status, posting_number, data FROM orders WHERE user_id = ?"
+        params = [user_id]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(size + 1)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        orders = [self._order(row) for row in rows[:size]]
+        next_cursor = orders[-1]['number'] if len(rows) > size else None
+        return orders, next_cursor
+
+    def open_postings(self, after=0, limit=1000):
+        """Заказы с отправлением в Ozon, статус которых еще может измениться,
+        с номером больше after (частичный индекс orders_tracked_postings)"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, user_id, created_at, status, posting_number, data FROM orders"
+                " WHERE posting_number IS NOT NULL AND status NOT IN ('delivered', 'cancelled', 'not_found')"
+                " AND id > ? ORDER BY id LIMIT ?",
+                (after, limit)
+            ).fetchall()
+        return [self._order(row) for row in rows]
+
+    def claim_submission(self, user_id, attempt):
+        """Регистрирует отправку попытки оформления attempt (создается при входе в оформление).
+
+        Возвращает (ключ, новая ли отправка, заказ). Для повтора заказ - результат
+        первой отправки или None, пока она еще выполняется.
+        """
+        key = submission_key(user_id, attempt)
+        with self.lock, self.db:
+            inserted = self.db.execute(
+                "INSERT OR IGNORE INTO submissions (key, created_at) VALUES (?, ?)", (key, time.time())
+            ).rowcount
+            if inserted:
+                return key, True, None
+            order = self.db.execute(
+                "SELECT orders.id, orders.user_id, orders.created_at, orders.status, orders.posting_number, orders.data"
+                " FROM submissions JOIN orders ON orders.id = submissions.order_id WHERE submissions.key = ?",
+                (key,)
+            ).fetchone()
+        return key, False, order and self._order(order)
+
+    def complete_submission(self, key, number):
+        """Запоминает заказ, которым закончилась попытка"""
+        with self.lock, self.db:
+            self.db.execute("UPDATE submissions SET order_id = ? WHERE key = ?", (number, key))
+
+    def abandon_submission(self, key):
+        """Снимает незавершенную попытку, чтобы корзину можно было отправить снова"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM submissions WHERE key = ? AND order_id IS NULL", (key,))
+
+    def update_status(self, number, status, posting_number=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE orders SET status = ?, posting_number = COALESCE(?, posting_number) WHERE id = ?",
+                (status, posting_number, number)
+            )
+
+    def record_miss(self, number):
+        """Отмечает, что Ozon не нашел отправление заказа; возвращает число промахов подряд"""
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO posting_misses (order_id, misses) VALUES (?, 1)"
+                " ON CONFLICT (order_id) DO UPDATE SET misses = misses + 1",
+                (number,)
+            )
+            return self.db.execute("SELECT misses FROM posting_misses WHERE order_id = ?", (number,)).fetchone()[0]
+
+    def clear_miss(self, number):
+        """Сбрасывает счет промахов: Ozon нашел отправление или его перестали сверять"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM posting_misses WHERE order_id = ?", (number,))
+
+    def compact(self):
+        """Удаляет заказы старше срока хранения и возвращает место на диске"""
+        cutoff = time.time() - self.retention_days * 86400
+        with self.lock, self.db:
+            removed = self.db.execute("DELETE FROM orders WHERE created_at < ?", (cutoff,)).rowcount
+            self.db.execute("DELETE FROM submissions WHERE created_at < ?", (time.time() - SUBMISSION_TTL,))
+            self.db.execute("DELETE FROM posting_misses WHERE order_id NOT IN (SELECT id FROM orders)")
+        if removed:
+            with self.lock:
+                self.db.execute("PRAGMA incremental_vacuum").fetchall()
+            print(f"🧹 Удалено старых заказов: {removed}")
+        return removed
+
+    @staticmethod
+    def _order(row):
+        order = json.loads(row['data'])
+        order['number'] = row['id']
+        order['user_id'] = row['user_id']
+        order['created_ts'] = row['created_at']
+        if row['status']:
+            order['status'] = row['status']
+        if row['posting_number']:
+            order['ozon_posting_number'] = row['posting_number']
+        return order
@@ -0,0 +1,218 @@
+import random
+import threading
+import time
+
+import requests
+
+# Лимиты по группам методов Ozon Seller API: (запросов в секунду, размер пачки)
+METHOD_GROUP_LIMITS = {
+    'product': (10.0, 10),
+    'description': (5.0, 5),
+    'prices': (5.0, 5),
+    'stocks': (5.0, 5),
+    'posting': (5.0, 5),
+    'default': (5.0, 5),
+}
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def method_group(url):
+    """Определяет группу метода Ozon по URL"""
+    path = url.split("api-seller.ozon.ru", 1)[-1]
+    if "/posting/" in path:
+        return 'posting'
+    if "prices" in path:
+        return 'prices'
+    if "stocks" in path:
+        return 'stocks'
+    if "/description" in path:
+        return 'description'
+    if "/product/" in path:
+        return 'product'
+    return 'default'
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Группа методов временно отключена после серии ошибок"""
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket с адаптивной скоростью (AIMD)"""
+
+    def __init__(self, rate, capacity, min_rate=0.5):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Ждет, пока в ведре появится токен, и забирает его"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, pause=0.0):
+        """Сервер ответил 429: вдвое снижаем скорость и делаем паузу"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            if pause:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def relax(self):
+        """Успешный ответ: понемногу возвращаем скорость к максимуму"""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    """Размыкает цепь после серии ошибок и пропускает пробный запрос после паузы"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.probing:
+                return False
+            # Полуоткрытое состояние: пропускаем один пробный запрос
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class OzonRateLimiter:
+    """Общий ограничитель запросов к Ozon с повторами, backoff и circuit breaker"""
+
+    def __init__(self, limits=None, max_retries=4, base_delay=0.5, max_delay=30.0):
+        self.limits = limits or METHOD_GROUP_LIMITS
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def _group(self, group):
+        with self.lock:
+            if group not in self.buckets:
+                rate, capacity = self.limits.get(group, self.limits['default'])
+                self.buckets[group] = TokenBucket(rate, capacity)
+                self.breakers[group] = CircuitBreaker()
+            return self.buckets[group], self.breakers[group]
+
+    def _backoff(self, attempt):
+        """Экспоненциальная задержка с полным джиттером"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response):
+        """Читает заголовок Retry-After (в секундах)"""
+        value = response.headers.get('Retry-After')
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            return None
+
+    def post(self, url, idempotent=True, **kwargs):
+        """Выполняет POST к Ozon с учетом лимитов группы метода.
+
+        Неидемпотентные запросы (создание отправлений) повторяются только
+        после 429, когда Ozon гарантированно не принял запрос.
+        """
+        group = method_group(url)
+        bucket, breaker = self._group(group)
+        response = None
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Ozon API ({group}) временно недоступен")
+
+            bucket.acquire()
+            try:
+                response = requests.post(url, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                breaker.record_failure()
+                if not idempotent or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⚠️ {group}: {e.__class__.__name__}, повтор через {delay:.1f} с")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Любая другая ошибка тоже завершает пробный запрос, иначе цепь не замкнется
+                breaker.record_failure()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                bucket.relax()
+                return response
+
+            retry_after = self._retry_after(response)
+            if retry_after is not None:
+                # Слишком долгую паузу не ждем: повтор все равно ограничен max_retries
+                retry_after = min(retry_after, self.max_delay)
+            if response.status_code == 429:
+                # Сервер ответил - цепь исправна, только снижаем скорость
+                breaker.record_success()
+                bucket.throttle(retry_after or 0.0)
+            else:
+                breaker.record_failure()
+                if not idempotent:
+                    return response
+
+            if attempt == self.max_retries:
+                break
+
+            if response.status_code == 429 and retry_after is not None:
+                # Паузу Retry-After выдерживает ведро группы в acquire - второй раз не ждем
+                print(f"⚠️ {group}: статус 429, повтор через {retry_after:.1f} с")
+                continue
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            print(f"⚠️ {group}: статус {response.status_code}, повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+        return response
+
+
+# Общий экземпляр для всех модулей бота
+ozon_rate_limiter = OzonRateLimiter()
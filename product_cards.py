@@ -0,0 +1,34 @@
+class ProductCardCache:
+    """Кэш готовых карточек товаров (текст + клавиатура) для одной версии каталога"""
+
+    def __init__(self):
+        self.version = None
+        self.cards = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key, render):
+        """Возвращает карточку из кэша или рендерит ее через render()"""
+        if version != self.version:
+            # Каталог обновился - старые карточки больше не нужны
+            self.version = version
+            self.cards = {}
+
+        card = self.cards.get(key)
+        if card is None:
+            self.misses += 1
+            card = render()
+            self.cards[key] = card
+        else:
+            self.hits += 1
+        return card
+
+    def prerender(self, version, keys, render):
+        """Заранее рендерит карточки всех товаров новой версии каталога"""
+        self.version = version
+        self.cards = {key: render(key) for key in keys}
+        print(f"🃏 Подготовлено карточек товаров: {len(self.cards)} (версия каталога {version})")
+
+
+# Общий экземпляр для обработчиков бота
+product_cards = ProductCardCache()
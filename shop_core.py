@@ -0,0 +1,572 @@
+import asyncio
+import datetime
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+import requests
+
+from catalog_columns import CatalogColumns, PriceBatch, StockBatch, id_column, warehouse_totals
+from json_stream import CHUNK_SIZE, iter_items
+from ozon_limiter import ozon_rate_limiter
+
+OZON_API_URL = "https://api-seller.ozon.ru"
+
+# Сколько product_id Ozon принимает в одном пакетном запросе
+BATCH_SIZE = 1000
+# Длина описания в карточке товара
+DESCRIPTION_LIMIT = 150
+# Остаток, если Ozon его не вернул
+DEFAULT_QUANTITY = 10
+# Как каталог показывает нулевой остаток в стратегиях, где так было заведено
+# (при оформлении заказа проверяется настоящий остаток)
+EMPTY_STOCK_SHOWN = {'stocks-v3': DEFAULT_QUANTITY, 'stocks-v2': 1}
+# Сколько хранится замененная версия каталога: корзины, собранные по ней,
+# успевают досчитать цены по тем же товарам
+GENERATION_TTL = 30 * 60
+# Больше старых версий не храним, даже если каталог обновляют часто
+MAX_GENERATIONS = 8
+
+
+# Компактные записи, в которые сразу превращаются элементы ответов Ozon
+ProductRef = namedtuple('ProductRef', ['product_id', 'offer_id'])
+ProductInfo = namedtuple('ProductInfo', ['name', 'description'])
+# Живая цена и остаток товара на момент оформления заказа
+Quote = namedtuple('Quote', ['price', 'quantity'])
+
+
+class OzonUnavailableError(RuntimeError):
+    """Ozon не ответил на запрос, без которого нельзя продолжать"""
+
+
+def clean_description(description):
+    """Очищает описание от HTML тегов"""
+    if not description:
+        return ""
+    clean_text = re.sub(r'<br\s*/?>', '\n', description)  # Заменяем <br> на переносы
+    clean_text = re.sub(r'<[^>]+>', '', clean_text)  # Удаляем все остальные теги
+    clean_text = re.sub(r'\n\s*\n', '\n', clean_text)  # Удаляем лишние переносы
+    return clean_text.strip()
+
+
+def batches(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class OzonClient:
+    """Запросы к Ozon Seller API через общий ограничитель скорости.
+
+    Считает обращения к API - по ним сравниваются стратегии загрузки каталога.
+    """
+
+    def __init__(self, client_id, api_key, transport=None):
+        self.headers = {
+            "Client-Id": client_id,
+            "Api-Key": api_key,
+            "Content-Type": "application/json"
+        }
+        self.transport = transport or ozon_rate_limiter.post
+        self.calls = 0
+
+    def post(self, path, payload, idempotent=True):
+        """POST к методу Ozon; возвращает разобранный JSON или None при ошибке"""
+        self.calls += 1
+        response = self.transport(
+            f"{OZON_API_URL}{path}",
+            idempotent=idempotent,
+            headers=self.headers,
+            json=payload,
+            timeout=10
+        )
+        if response.status_code != 200:
+            print(f"⚠️ Ошибка {path}: {response.status_code}")
+            print(f"Текст ошибки: {response.text}")
+            return None
+        return response.json()
+
+    def post_items(self, path, payload, items_path=('result', 'items')):
+        """POST к списочному методу Ozon; элементы ответа отдаются по одному.
+
+        Ответ читается потоком и не собирается в один большой dict, поэтому
+        пиковая память не зависит от размера страницы. None при ошибке.
+        """
+        self.calls += 1
+        response = self.transport(
+            f"{OZON_API_URL}{path}",
+            headers=self.headers,
+            json=payload,
+            timeout=10,
+            stream=True
+        )
+        if response.status_code != 200:
+            print(f"⚠️ Ошибка {path}: {response.status_code}")
+            print(f"Текст ошибки: {response.text}")
+            response.close()
+            return None
+        return self._stream(response, items_path)
+
+    def get_posting(self, posting_number):
+        """Отправление FBS по номеру (v3/posting/fbs/get).
+
+        None - Ozon такого отправления не знает; при других ошибках -
+        OzonUnavailableError, чтобы сбой Ozon не выглядел как пропажа отправления.
+        """
+        self.calls += 1
+        response = self.transport(
+            f"{OZON_API_URL}/v3/posting/fbs/get",
+            headers=self.headers,
+            json={"posting_number": posting_number},
+            timeout=10
+        )
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise OzonUnavailableError(f"v3/posting/fbs/get: {response.status_code}")
+        return response.json().get('result') or {}
+
+    def require_items(self, path, payload, items_path=('result', 'items')):
+        """Как post_items, но при ошибке - OzonUnavailableError вместо None"""
+        items = self.post_items(path, payload, items_path)
+        if items is None:
+            raise OzonUnavailableError(f"Ozon не ответил на {path}")
+        return items
+
+    @staticmethod
+    def _stream(response, items_path):
+        with response:
+            yield from iter_items(response.iter_content(CHUNK_SIZE), items_path)
+
+    def list_products(self, limit):
+        """Список товаров: [(product_id, offer_id)]"""
+        items = self.post_items("/v3/product/list", {"filter": {"visibility": "ALL"}, "limit": limit})
+        if items is None:
+            return None
+        return [ProductRef(item['product_id'], item.get('offer_id')) for item in items if 'product_id' in item]
+
+    def create_order(self, order_data):
+        """Создает отправление FBS в Ozon; возвращает ответ Ozon или None"""
+        ozon_order_data = {
+            # Номер из ключа попытки: повтор той же отправки приходит в Ozon с тем же номером
+            "posting_number": order_data.get('posting_number') or f"TG{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+            "products": [
+                {
+                    "product_id": int(item['product_id']),
+                    "quantity": int(item['quantity']),
+                    "price": str(float(item['price']))
+                }
+                for item in order_data['items']
+            ],
+            "address": {
+                "address": order_data.get('customer_address', 'Адрес не указан'),
+                "city": order_data.get('customer_city', 'Город не указан'),
+                "name": order_data.get('customer_name', 'Покупатель'),
+                "phone": order_data.get('customer_phone', '+79999999999'),
+                "zip_code": "101000"  # Обязательное поле
+            },
+            "delivery_method": {
+                "id": 1,  # ID способа доставки, нужно получить из API Ozon
+                "name": "Стандартная доставка"
+            },
+            "recipient": {
+                "name": order_data.get('customer_name', 'Покупатель'),
+                "phone": order_data.get('customer_phone', '+79999999999')
+            }
+        }
+        print(f"📦 Создаем заказ в Ozon: {ozon_order_data}")
+
+        # Пробуем версии метода от новой к старой
+        for path in ("/v3/posting/fbs/create", "/v2/posting/fbs/create", "/v1/posting/fbs/create"):
+            try:
+                result = self.post(path, ozon_order_data, idempotent=False)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                # Запрос мог дойти до Ozon: другая версия метода создала бы второе отправление
+                print(f"❌ {path} не ответил ({e.__class__.__name__}), результат неизвестен - другие версии не пробуем")
+                return None
+            except Exception as e:
+                print(f"❌ Ошибка при вызове {path}: {e}")
+                continue
+            if result is not None:
+                print(f"✅ Заказ создан в Ozon: {result}")
+                return result
+
+        print("❌ Все методы создания заказа не сработали")
+        return None
+
+
+# Источники данных о товарах. Каждый принимает клиента, список product_id и
+# memo - общий для одной загрузки словарь, чтобы разные этапы могли
+# переиспользовать один и тот же ответ Ozon.
+
+def fetch_descriptions_v1(client, product_ids, memo):
+    """Названия и описания через v1/product/info/description (запрос на каждый товар)"""
+    details = {}
+    for product_id in product_ids:
+        data = client.post("/v1/product/info/description", {"product_id": product_id})
+        result = (data or {}).get('result')
+        if result:
+            details[product_id] = {
+                'name': result.get('name', ''),
+                'description': result.get('description', '')
+            }
+    print(f"📝 Получено описаний: {len(details)}")
+    return details
+
+
+def product_info_v3(client, product_ids, memo):
+    """Информация о товарах через v3/product/info/list (пакетами), один раз за загрузку.
+
+    Названия и описания сразу сохраняются компактными записями ProductInfo,
+    остатки по складам - колонками StockBatch.
+    """
+    if 'info_v3' not in memo:
+        infos = {}
+        stocks = StockBatch()
+        for batch in batches(product_ids):
+            for item in client.require_items("/v3/product/info/list", {"product_id": batch}):
+                infos[item.get('id')] = ProductInfo(item.get('name', ''), item.get('description', ''))
+                stocks.ids.append(item.get('id'))
+                warehouses = item.get('stocks', {}).get('stocks', [])
+                stocks.counts.append(len(warehouses))
+                stocks.present.extend(stock.get('present') for stock in warehouses)
+        print(f"📊 v3/product/info/list: информация для {len(infos)} товаров")
+        memo['info_v3'] = infos
+        memo['info_v3_stocks'] = stocks
+    return memo['info_v3']
+
+
+def fetch_details_info_v3(client, product_ids, memo):
+    """Названия и описания из v3/product/info/list"""
+    return {
+        product_id: {'name': info.name, 'description': info.description}
+        for product_id, info in product_info_v3(client, product_ids, memo).items()
+    }
+
+
+# Загрузчики цен и остатков возвращают пару колонок (product_id, значение)
+
+def fetch_prices_v5(client, product_ids, memo):
+    """Цены через v5/product/info/prices"""
+    prices = PriceBatch()
+    for batch in batches(product_ids):
+        # В v5 items находится в корне ответа
+        items = client.require_items("/v5/product/info/prices", {
+            "filter": {"product_id": batch, "visibility": "ALL"},
+            "last_id": "",
+            "limit": 1000
+        }, items_path=('items',))
+        for price_item in items:
+            prices.add(price_item)
+    print(f"💰 Получены цены для {len(prices.ids)} товаров")
+    return prices.columns()
+
+
+def fetch_stocks_v3(client, product_ids, memo):
+    """Остатки через v3/product/info/stocks: свободный остаток по складам,
+    если он нулевой - наибольшее из stock-полей"""
+    stocks = StockBatch()
+    for batch in batches(product_ids):
+        items = client.require_items("/v3/product/info/stocks", {
+            "filter": {"product_id": batch, "visibility": "ALL"},
+            "limit": 1000
+        })
+        for stock_item in items:
+            stocks.add(stock_item, stock_item.get('stocks', []))
+    total = stocks.free()
+    return id_column(stocks.ids), np.where(total > 0, total, stocks.max_fields())
+
+
+def fetch_stocks_info_list(client, product_ids, memo):
+    """Остатки из v2/product/info/list: наибольшее из stock / fbo_stock / fbs_stock"""
+    stocks = StockBatch()
+    for batch in batches(product_ids):
+        for item in client.require_items("/v2/product/info/list", {"product_id": batch}):
+            stocks.add(item)
+    return id_column(stocks.ids), stocks.max_fields()
+
+
+def fetch_stocks_v2(client, product_ids, memo):
+    """Остатки через v2/products/stocks"""
+    stocks = StockBatch()
+    for batch in batches(product_ids):
+        for item in client.require_items("/v2/products/stocks", {"product_id": batch}):
+            stocks.add(item)
+    return id_column(stocks.ids), stocks.max_fields()
+
+
+def fetch_stocks_info_v3(client, product_ids, memo):
+    """Остатки из v3/product/info/list (тот же ответ, что и для названий)"""
+    product_info_v3(client, product_ids, memo)
+    stocks = memo['info_v3_stocks']
+    return id_column(stocks.ids), warehouse_totals(stocks.counts, stocks.present)
+
+
+DETAILS_FETCHERS = {
+    'description-v1': fetch_descriptions_v1,
+    'info-v3': fetch_details_info_v3,
+}
+PRICE_FETCHERS = {
+    'prices-v5': fetch_prices_v5,
+}
+STOCK_FETCHERS = {
+    'stocks-v3': fetch_stocks_v3,
+    'info-list-v2': fetch_stocks_info_list,
+    'stocks-v2': fetch_stocks_v2,
+    'info-v3': fetch_stocks_info_v3,
+}
+
+CatalogStrategy = namedtuple('CatalogStrategy', ['details', 'prices', 'stocks'])
+
+# Готовые стратегии загрузки каталога (выбираются через OZON_CATALOG_STRATEGY)
+STRATEGIES = {
+    'descriptions': CatalogStrategy('description-v1', 'prices-v5', 'info-list-v2'),
+    'stocks-v3': CatalogStrategy('description-v1', 'prices-v5', 'stocks-v3'),
+    'stocks-v2': CatalogStrategy('description-v1', 'prices-v5', 'stocks-v2'),
+    'info-v3': CatalogStrategy('info-v3', 'prices-v5', 'info-v3'),
+}
+DEFAULT_STRATEGY = 'info-v3'
+
+
+def resolve_strategy(name):
+    """Стратегия по имени из настроек; неизвестное имя - стратегия по умолчанию"""
+    strategy = STRATEGIES.get(name)
+    if strategy is None:
+        print(f"⚠️ Неизвестная стратегия каталога: {name}, используем {DEFAULT_STRATEGY}")
+        strategy = STRATEGIES[DEFAULT_STRATEGY]
+    return strategy
+
+
+def build_products(refs, details, columns):
+    """Собирает карточки товаров {1..N: товар}; товары без цены пропускаются"""
+    products = {}
+    for (product_id, offer_id), price, quantity in zip(refs, columns.price.tolist(), columns.quantity.tolist()):
+        if not product_id:
+            continue
+
+        info = details.get(product_id, {})
+        name = info.get('name') or offer_id or f"Товар {product_id}"
+        if price == 0:
+            print(f"⚠️ Пропускаем товар без цены: {name}")
+            continue
+
+        # Очищаем описание от HTML тегов и обрезаем
+        description = clean_description(info.get('description', ''))
+        if not description:
+            description = f"Артикул: {offer_id}" if offer_id else f"ID: {product_id}"
+        if len(description) > DESCRIPTION_LIMIT:
+            description = description[:DESCRIPTION_LIMIT] + "..."
+
+        products[len(products) + 1] = {
+            'ozon_id': product_id,
+            'offer_id': offer_id,
+            'name': name,
+            'price': price,
+            'image': "📦",
+            'description': description,
+            'quantity': quantity
+        }
+    return products
+
+
+class CatalogSnapshot:
+    """Неизменяемая версия каталога.
+
+    Обработчик берет снимок один раз и читает из него все, что нужно, -
+    обновление каталога в это время подменяет только ссылку на текущий снимок.
+    """
+
+    __slots__ = ('version', 'products', 'index_by_sku', 'columns', 'loaded_at', 'stocks_at')
+
+    def __init__(self, version, products, columns=None, stocks_at=None):
+        self.version = version
+        self.products = MappingProxyType(products)
+        self.index_by_sku = MappingProxyType(
+            {product.get('ozon_id', key): key for key, product in products.items()}
+        )
+        self.columns = columns
+        self.loaded_at = time.time()
+        # Момент, на который Ozon отдал остатки (начало загрузки)
+        self.stocks_at = stocks_at or self.loaded_at
+
+    def __len__(self):
+        return len(self.products)
+
+    def by_sku(self, sku):
+        """Товар по SKU Ozon или None"""
+        key = self.index_by_sku.get(sku)
+        return None if key is None else self.products[key]
+
+    def sku(self, key):
+        """SKU товара по ключу каталога; у товаров не из Ozon SKU - сам ключ"""
+        return self.products[key].get('ozon_id', key)
+
+
+class ShopCatalog:
+    """Каталог магазина: загрузка товаров из Ozon по выбранной стратегии
+    и версии каталога.
+
+    Текущий снимок заменяется одним присваиванием только после успешной
+    загрузки; при ошибке остается прежний. Замененные снимки хранятся
+    GENERATION_TTL, чтобы начатые корзины досчитывались по своей версии.
+
+    Клиент Ozon создается при первой загрузке, поэтому импорт модуля ничего
+    не инициализирует.
+    """
+
+    def __init__(self, default_strategy=DEFAULT_STRATEGY, limit=50, fallback=None, client_factory=None):
+        # Переменная окружения важнее стратегии, заданной ботом
+        self.strategy_name = os.environ.get('OZON_CATALOG_STRATEGY') or default_strategy
+        self.strategy = resolve_strategy(self.strategy_name)
+        self.limit = limit
+        self.fallback = fallback  # товары на случай, если Ozon недоступен
+        self.client_factory = client_factory or (
+            lambda: OzonClient(os.environ.get('OZON_CLIENT_ID'), os.environ.get('OZON_API_KEY'))
+        )
+        self._client = None
+        self.current = CatalogSnapshot(0, {})
+        # version -> (снимок, когда его заменили); словарь не меняется, а подменяется целиком
+        self.generations = {}
+        self._swap_lock = threading.Lock()
+
+    # Чтение текущей версии для обработчиков, которым не нужен общий снимок
+
+    @property
+    def products(self):
+        return self.current.products
+
+    @property
+    def version(self):
+        return self.current.version
+
+    @property
+    def index_by_sku(self):
+        return self.current.index_by_sku
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    @property
+    def configured(self):
+        headers = self.client.headers
+        return bool(headers.get("Client-Id") and headers.get("Api-Key"))
+
+    def generation(self, version):
+        """Снимок каталога версии version, если он еще хранится"""
+        current = self.current
+        if version == current.version:
+            return current
+        entry = self.generations.get(version)
+        if entry is None or time.time() - entry[1] > GENERATION_TTL:
+            return None
+        return entry[0]
+
+    def pin(self, version=None):
+        """Снимок для обработки запроса: указанной версии, а если ее уже нет - текущий"""
+        return (version is not None and self.generation(version)) or self.current
+
+    def cart_items(self, cart, version=None):
+        """Товары корзины {sku: количество}: пары (товар или None, количество).
+
+        Цены берутся из версии каталога, в которой начали корзину, пока она
+        хранится; остальные товары - из текущей версии.
+        """
+        pinned = self.pin(version)
+        current = self.current
+        for sku, quantity in cart.items():
+            yield pinned.by_sku(sku) or current.by_sku(sku), quantity
+
+    def fetch(self):
+        """Загружает товары из Ozon (блокирующие запросы); (товары, колонки, время начала) или None"""
+        started_at = time.time()
+        client = self.client
+        print(f"🔄 Загрузка товаров из Ozon (стратегия {self.strategy_name})...")
+        refs = client.list_products(self.limit)
+        if not refs:
+            print("❌ Нет товаров в ответе")
+            return None
+
+        product_ids = [ref.product_id for ref in refs]
+        memo = {}
+        details = DETAILS_FETCHERS[self.strategy.details](client, product_ids, memo)
+        columns = CatalogColumns(product_ids, DEFAULT_QUANTITY)
+        columns.assign(columns.price, *PRICE_FETCHERS[self.strategy.prices](client, product_ids, memo))
+        stock_ids, quantities = STOCK_FETCHERS[self.strategy.stocks](client, product_ids, memo)
+        shown = EMPTY_STOCK_SHOWN.get(self.strategy.stocks)
+        if shown:
+            quantities = np.where(quantities > 0, quantities, shown)
+        columns.assign(columns.quantity, stock_ids, quantities)
+        products = build_products(refs, details, columns)
+        return (products, columns, started_at) if products else None
+
+    def quote(self, product_ids):
+        """Живые цены и остатки товаров (блокирующие запросы): {product_id: Quote}.
+
+        Берутся тем же загрузчиком, что и каталог, - пакетами, а не по товару,
+        но без значений по умолчанию: товара, для которого Ozon не вернул цену
+        или остаток, в ответе нет, нулевой остаток остается нулем. Если запрос
+        не удался - OzonUnavailableError.
+        """
+        client = self.client
+        memo = {}
+        price_ids, prices = PRICE_FETCHERS[self.strategy.prices](client, product_ids, memo)
+        prices = {product_id: price for product_id, price in zip(price_ids.tolist(), prices.tolist()) if price > 0}
+        stock_ids, quantities = STOCK_FETCHERS[self.strategy.stocks](client, product_ids, memo)
+        wanted = set(product_ids)
+        return {
+            product_id: Quote(prices[product_id], max(quantity, 0))
+            for product_id, quantity in zip(stock_ids.tolist(), quantities.tolist())
+            if product_id in wanted and product_id in prices
+        }
+
+    def swap(self, products, columns=None, stocks_at=None):
+        """Публикует новую версию каталога"""
+        with self._swap_lock:
+            previous = self.current
+            now = time.time()
+            generations = {
+                version: entry for version, entry in self.generations.items()
+                if now - entry[1] <= GENERATION_TTL
+            }
+            if previous.version:
+                generations[previous.version] = (previous, now)
+            while len(generations) > MAX_GENERATIONS:
+                del generations[min(generations)]
+            snapshot = CatalogSnapshot(previous.version + 1, products, columns, stocks_at)
+            self.generations = generations
+            self.current = snapshot
+        return snapshot
+
+    def load(self):
+        """Загружает каталог; возвращает новый снимок или прежний, если загрузка не удалась"""
+        loaded = None
+        if not self.configured:
+            print("❌ API ключи не настроены!")
+        else:
+            try:
+                loaded = self.fetch()
+            except Exception as e:
+                print(f"❌ Ошибка запроса к Ozon API: {e}")
+
+        if loaded:
+            snapshot = self.swap(*loaded)
+            print(f"🎯 Загружено {len(snapshot)} товаров из Ozon (версия каталога {snapshot.version})")
+            return snapshot
+
+        print("❌ Не удалось получить товары через Ozon API")
+        if self.current.products:
+            print(f"⚠️ Оставляем прежний каталог: {len(self.current)} товаров, версия {self.current.version}")
+            return self.current
+        if self.fallback:
+            return self.swap(self.fallback())
+        return self.current
+
+    async def refresh(self):
+        """Загрузка каталога в фоновом потоке, не блокируя обработку сообщений"""
+        return await asyncio.to_thread(self.load)
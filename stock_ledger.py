@@ -0,0 +1,217 @@
+import threading
+import time
+
+# Сколько держится резерв товара в корзине
+HOLD_TTL = 15 * 60
+# Число независимых блокировок; SKU распределяются между ними по хэшу
+STRIPES = 64
+# За сколько Ozon отражает продажу в остатках
+STOCK_LAG = 15 * 60
+# Сколько вычитать из остатков заказ, сохраненный только локально (в Ozon его создают вручную)
+SOLD_MEMORY = 60 * 60
+
+
+class SkuStock:
+    """Остаток одного SKU: свободные единицы, резервы корзин и недавние продажи"""
+
+    __slots__ = ('available', 'holds', 'sold')
+
+    def __init__(self, available):
+        self.available = available
+        self.holds = {}  # владелец -> [количество, истекает]
+        self.sold = []  # [время продажи, количество, владелец, когда продажа точно видна в Ozon]
+
+    def expire(self, now):
+        """Возвращает в остаток просроченные резервы"""
+        for owner, (quantity, expires_at) in list(self.holds.items()):
+            if expires_at <= now:
+                del self.holds[owner]
+                self.available += quantity
+
+    def held(self):
+        return sum(quantity for quantity, _ in self.holds.values())
+
+    def last_sale(self, owner):
+        for sale in reversed(self.sold):
+            if sale[2] == owner:
+                return sale
+        return None
+
+
+class StockLedger:
+    """Резервы товаров под корзины, чтобы два покупателя не купили последнюю единицу.
+
+    Остатки берутся из каталога и сверяются при каждом его обновлении.
+    Операции над SKU атомарны под блокировкой его полосы (STRIPES штук),
+    общей блокировки нет - корзины с разными товарами не мешают друг другу.
+    """
+
+    def __init__(self, hold_ttl=HOLD_TTL, stripes=STRIPES):
+        self.hold_ttl = hold_ttl
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stocks = [{} for _ in range(stripes)]
+
+    def _stripe(self, sku):
+        index = hash(sku) % len(self._locks)
+        return self._locks[index], self._stocks[index]
+
+    def available(self, sku):
+        """Свободный остаток SKU или None, если SKU нет в учете"""
+        lock, stocks = self._stripe(sku)
+        with lock:
+            stock = stocks.get(sku)
+            if stock is None:
+                return None
+            stock.expire(time.time())
+            return stock.available
+
+    def reserve(self, sku, owner, quantity=1):
+        """Резервирует quantity единиц за владельцем; False, если столько нет.
+
+        Повторный резерв того же владельца добавляет единицы и продлевает срок.
+        """
+        lock, stocks = self._stripe(sku)
+        with lock:
+            stock = stocks.get(sku)
+            if stock is None:
+                return False
+            now = time.time()
+            stock.expire(now)
+            if stock.available < quantity:
+                return False
+            stock.available -= quantity
+            hold = stock.holds.get(owner)
+            stock.holds[owner] = [(hold[0] if hold else 0) + quantity, now + self.hold_ttl]
+            return True
+
+    def release(self, sku, owner, quantity=None):
+        """Снимает резерв владельца (весь или quantity единиц)"""
+        lock, stocks = self._stripe(sku)
+        with lock:
+            stock = stocks.get(sku)
+            hold = stock and stock.holds.get(owner)
+            if not hold:
+                return
+            returned = hold[0] if quantity is None else min(quantity, hold[0])
+            hold[0] -= returned
+            stock.available += returned
+            if hold[0] <= 0:
+                del stock.holds[owner]
+
+    def release_all(self, owner, skus):
+        for sku in skus:
+            self.release(sku, owner)
+
+    def commit(self, owner, items):
+        """Превращает резервы корзины {sku: количество} в продажу.
+
+        Если резерв истек, единицы берутся из свободного остатка; резерв сверх
+        items остается за владельцем (товар, добавленный в корзину во время
+        оформления). Возвращает {sku: сколько не хватило}; при нехватке ничего
+        не списывается.
+        """
+        skus = sorted(items, key=lambda sku: hash(sku) % len(self._locks))
+        # Все нужные полосы берутся в одном порядке - без взаимных блокировок
+        locks = []
+        for sku in skus:
+            lock = self._stripe(sku)[0]
+            if lock not in locks:
+                locks.append(lock)
+        for lock in locks:
+            lock.acquire()
+        try:
+            now = time.time()
+            missing = {}
+            for sku in skus:
+                stock = self._stripe(sku)[1].get(sku)
+                if stock is None:
+                    continue  # товар не учитывается - продаем без проверки
+                stock.expire(now)
+                held = stock.holds.get(owner, (0, 0))[0]
+                shortage = items[sku] - held - stock.available
+                if shortage > 0:
+                    missing[sku] = shortage
+            if missing:
+                return missing
+            for sku in skus:
+                stock = self._stripe(sku)[1].get(sku)
+                if stock is None:
+                    continue
+                hold = stock.holds.get(owner)
+                used = min(hold[0], items[sku]) if hold else 0
+                if hold:
+                    hold[0] -= used
+                    if hold[0] <= 0:
+                        del stock.holds[owner]
+                # Недостающее берется из свободного остатка
+                stock.available -= items[sku] - used
+                stock.sold.append([now, items[sku], owner, now + STOCK_LAG])
+            return {}
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def rollback(self, owner, items):
+        """Отменяет продажу владельца {sku: количество}: заказ так и не был оформлен"""
+        for sku in items:
+            lock, stocks = self._stripe(sku)
+            with lock:
+                stock = stocks.get(sku)
+                sale = stock and stock.last_sale(owner)
+                if sale:
+                    stock.sold.remove(sale)
+                    stock.available += sale[1]
+
+    def mark_local(self, owner, items):
+        """Продажа не дошла до Ozon: ее единицы вычитаются из остатков Ozon SOLD_MEMORY"""
+        for sku in items:
+            lock, stocks = self._stripe(sku)
+            with lock:
+                stock = stocks.get(sku)
+                sale = stock and stock.last_sale(owner)
+                if sale:
+                    sale[3] = sale[0] + SOLD_MEMORY
+
+    def reconcile(self, stock_levels, taken_at):
+        """Сверка с остатками из свежего каталога {sku: количество}.
+
+        taken_at - момент начала запроса остатков. Свободный остаток = остаток
+        Ozon - активные резервы - продажи, которые Ozon мог еще не отразить к
+        taken_at (моложе STOCK_LAG, а локальные заказы - SOLD_MEMORY). SKU,
+        которых нет в каталоге, перестают учитываться.
+        """
+        now = time.time()
+        for lock, stocks in zip(self._locks, self._stocks):
+            with lock:
+                for sku in [sku for sku in stocks if sku not in stock_levels]:
+                    del stocks[sku]
+        for sku, level in stock_levels.items():
+            lock, stocks = self._stripe(sku)
+            with lock:
+                stock = stocks.get(sku)
+                if stock is None:
+                    stocks[sku] = SkuStock(level)
+                    continue
+                stock.expire(now)
+                stock.sold = [sale for sale in stock.sold if sale[3] > taken_at]
+                recent = sum(sale[1] for sale in stock.sold)
+                stock.available = max(0, level - stock.held() - recent)
+
+    def reconcile_catalog(self, snapshot):
+        """Сверка с новой версией каталога (shop_core.CatalogSnapshot)"""
+        self.reconcile(
+            {snapshot.sku(key): product['quantity'] for key, product in snapshot.products.items()},
+            snapshot.stocks_at
+        )
+
+    def sweep(self):
+        """Снимает все просроченные резервы (для периодической задачи)"""
+        now = time.time()
+        for lock, stocks in zip(self._locks, self._stocks):
+            with lock:
+                for stock in stocks.values():
+                    stock.expire(now)
+
+
+# Общий экземпляр для обработчиков бота
+stock_ledger = StockLedger()
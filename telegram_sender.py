@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат
+GLOBAL_RATE = 30.0
+PER_CHAT_INTERVAL = 1.0
+MAX_RETRIES = 3
+# Как часто забывать чаты, у которых нет запланированных отправок
+PRUNE_INTERVAL = 60.0
+
+
+class MessageGovernor:
+    """Планировщик исходящих сообщений: лимиты на чат и на бота, склейка правок"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL):
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.global_next = 0.0
+        self.chat_next = {}
+        self.pruned_at = 0.0
+        self.pending_edits = {}
+        self.lock = asyncio.Lock()
+
+    async def _wait_slot(self, chat_id):
+        """Резервирует ближайший слот отправки для чата и ждет его"""
+        async with self.lock:
+            now = time.monotonic()
+            if now - self.pruned_at >= PRUNE_INTERVAL:
+                self._prune(now)
+            slot = max(now, self.global_next, self.chat_next.get(chat_id, 0.0))
+            self.global_next = slot + self.global_interval
+            self.chat_next[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _prune(self, now):
+        """Удаляет чаты, слот которых уже прошел: для них лимит ничего не меняет"""
+        self.chat_next = {chat_id: slot for chat_id, slot in self.chat_next.items() if slot > now}
+        self.pruned_at = now
+
+    async def _block_chat(self, chat_id, seconds):
+        """Telegram попросил подождать: сдвигаем слоты чата"""
+        async with self.lock:
+            until = time.monotonic() + seconds
+            self.chat_next[chat_id] = max(self.chat_next.get(chat_id, 0.0), until)
+
+    async def _deliver(self, chat_id, send, reserved=False):
+        """Отправляет с повтором после RetryAfter"""
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt or not reserved:
+                await self._wait_slot(chat_id)
+            try:
+                return await send()
+            except RetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                retry_after = e.retry_after
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                print(f"⚠️ Flood control для чата {chat_id}: ждем {retry_after} с")
+                await self._block_chat(chat_id, float(retry_after))
+            except BadRequest as e:
+                # Правка без изменений не считается ошибкой
+                if "message is not modified" in str(e).lower():
+                    return None
+                raise
+
+    async def send(self, bot, chat_id, text, **kwargs):
+        """Отправляет новое сообщение с учетом лимитов"""
+        return await self._deliver(chat_id, lambda: bot.send_message(chat_id, text, **kwargs))
+
+    async def reply(self, message, text, **kwargs):
+        """Отвечает на сообщение с учетом лимитов"""
+        return await self._deliver(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+    async def edit(self, query, text, wait=False, fallback_reply=False, **kwargs):
+        """Редактирует сообщение callback-а. Пачка правок одного сообщения
+        сводится к последней; по умолчанию не ждет фактической отправки,
+        чтобы следующий клик успел заменить ожидающую правку."""
+        if query.message:
+            chat_id = query.message.chat_id
+            key = (chat_id, query.message.message_id)
+        else:
+            chat_id = None
+            key = (None, query.inline_message_id)
+
+        pending = self.pending_edits.get(key)
+        if pending:
+            # Отправка уже запланирована: подменяем содержимое на последнее
+            pending['send'] = lambda: query.edit_message_text(text, **kwargs)
+            pending['fallback'] = (lambda: query.message.reply_text(text, **kwargs)) if fallback_reply else None
+        else:
+            pending = {
+                'send': lambda: query.edit_message_text(text, **kwargs),
+                'fallback': (lambda: query.message.reply_text(text, **kwargs)) if fallback_reply else None,
+                'future': asyncio.get_running_loop().create_future()
+            }
+            pending['future'].add_done_callback(self._log_edit_error)
+            self.pending_edits[key] = pending
+            asyncio.create_task(self._flush_edit(chat_id, key, pending))
+
+        if wait:
+            return await pending['future']
+        return None
+
+    async def _flush_edit(self, chat_id, key, pending):
+        try:
+            await self._wait_slot(chat_id)
+            # За время ожидания могли прийти новые правки - берем последнюю
+            if self.pending_edits.get(key) is pending:
+                del self.pending_edits[key]
+            try:
+                result = await self._deliver(chat_id, pending['send'], reserved=True)
+            except BadRequest:
+                if not pending['fallback'] or not chat_id:
+                    raise
+                # Сообщение нельзя изменить - отправляем новое
+                result = await self._deliver(chat_id, pending['fallback'])
+            pending['future'].set_result(result)
+        except Exception as e:
+            if self.pending_edits.get(key) is pending:
+                del self.pending_edits[key]
+            pending['future'].set_exception(e)
+
+    @staticmethod
+    def _log_edit_error(future):
+        if not future.cancelled() and future.exception():
+            print(f"❌ Ошибка отправки правки: {future.exception()}")
+
+
+# Общий экземпляр для всех обработчиков
+message_governor = MessageGovernor()
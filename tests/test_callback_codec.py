@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from callback_codec import (
+    CALLBACK_DATA_LIMIT, CallbackPayloadStore, encode_token, expired_product_index, product_token_decoder
+)
+
+
+def test_token_round_trip():
+    store = CallbackPayloadStore()
+    data = store.encode('pa', ('42', 'SKU-1'), 3)
+    action, token = data.split(':')
+    assert action == 'pa'
+    assert store.resolve(token) == (3, ('42', 'SKU-1'))
+    # Одинаковый payload получает тот же токен
+    assert store.encode('pa', ('42', 'SKU-1'), 3) == data
+
+
+def test_tokens_differ_between_processes():
+    first, second = CallbackPayloadStore(), CallbackPayloadStore()
+    assert first.encode('pa', 1, 1) != second.encode('pa', 1, 1)
+
+
+def test_least_recently_used_token_is_evicted():
+    store = CallbackPayloadStore(capacity=2)
+    old = store.encode('pa', 1, 1).split(':')[1]
+    kept = store.encode('pa', 2, 1).split(':')[1]
+    store.resolve(old)
+    store.encode('pa', 3, 1)
+    assert store.resolve(old) is not None
+    assert store.resolve(kept) is None
+
+
+def test_callback_data_fits_telegram_limit():
+    store = CallbackPayloadStore()
+    store.counter = 64 ** 10
+    assert len(store.encode('pa', 'x' * 500, 1).encode()) <= CALLBACK_DATA_LIMIT
+    with pytest.raises(ValueError):
+        store.encode('a' * CALLBACK_DATA_LIMIT, 1, 1)
+
+
+def test_encode_token_is_compact():
+    assert encode_token(0) == '0'
+    assert len(encode_token(64 ** 3 - 1)) == 3
+
+
+def test_product_decoder_checks_sku():
+    store = CallbackPayloadStore()
+    catalog = SimpleNamespace(current=SimpleNamespace(
+        products={1: {'ozon_id': 'A'}, 2: {'ozon_id': 'B'}},
+        index_by_sku={'A': 1, 'B': 2},
+    ))
+    decode = product_token_decoder(catalog, store)
+    token_a = store.encode('pa', (1, 'A'), 1).split(':')[1]
+    assert decode(token_a) == 1
+
+    # Каталог обновился: под номером 1 теперь другой товар, A переехал
+    catalog.current = SimpleNamespace(products={1: {'ozon_id': 'B'}, 2: {'ozon_id': 'A'}}, index_by_sku={'B': 1, 'A': 2})
+    assert decode(token_a) == 2
+
+    # Товар пропал из каталога
+    catalog.current = SimpleNamespace(products={1: {'ozon_id': 'B'}}, index_by_sku={'B': 1})
+    assert decode(token_a) is None
+    assert decode('unknown') is None
+
+
+def test_legacy_buttons_are_expired():
+    assert expired_product_index('5') is None
@@ -0,0 +1,61 @@
+import asyncio
+
+from callback_router import CallbackRouter
+
+
+async def view(*args):
+    return ('view', args)
+
+
+async def item(*args):
+    return ('item', args)
+
+
+async def item_page(*args):
+    return ('item_page', args)
+
+
+def make_router():
+    router = CallbackRouter()
+    router.route("view_products", view)
+    router.prefix("item_", item, int)
+    router.prefix("item_page_", item_page, int)
+    return router
+
+
+def test_exact_route():
+    assert make_router().resolve("view_products") == (view, ())
+
+
+def test_prefix_passes_decoded_payload():
+    assert make_router().resolve("item_42") == (item, (42,))
+
+
+def test_longest_prefix_wins():
+    assert make_router().resolve("item_page_3") == (item_page, (3,))
+
+
+def test_bad_payload_and_unknown_data_are_not_routed():
+    router = make_router()
+    assert router.resolve("item_abc") == (None, ())
+    assert router.resolve("unknown") == (None, ())
+    assert router.resolve("") == (None, ())
+
+
+def test_prefix_without_decoder_passes_raw_text():
+    router = CallbackRouter()
+    router.prefix("pa:", item)
+    assert router.resolve("pa:x1") == (item, ("x1",))
+
+
+def test_dispatch_calls_handler_with_context():
+    router = CallbackRouter()
+    calls = []
+
+    async def handler(query, context, number):
+        calls.append((query, context, number))
+
+    router.prefix("n_", handler, int)
+    assert asyncio.run(router.dispatch("n_5", 'query', 'context'))
+    assert calls == [('query', 'context', 5)]
+    assert not asyncio.run(router.dispatch(None, 'query', 'context'))
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from checkout_quotes import QuoteBatcher
+
+
+class FakeCatalog:
+    def __init__(self, quotes, fails=False):
+        self.quotes = quotes
+        self.fails = fails
+        self.calls = []
+
+    def quote(self, product_ids):
+        self.calls.append(product_ids)
+        if self.fails:
+            raise RuntimeError("Ozon недоступен")
+        return {sku: self.quotes[sku] for sku in product_ids if sku in self.quotes}
+
+
+def test_concurrent_checkouts_share_one_request():
+    catalog = FakeCatalog({1: 'q1', 2: 'q2', 3: 'q3'})
+    batcher = QuoteBatcher(catalog, window=0.01)
+
+    async def checkouts():
+        return await asyncio.gather(batcher.quote([1, 2]), batcher.quote([2, 3]), batcher.quote([4]))
+
+    assert asyncio.run(checkouts()) == [{1: 'q1', 2: 'q2'}, {2: 'q2', 3: 'q3'}, {}]
+    # SKU всех корзин - без повторов и одним запросом
+    assert catalog.calls == [[1, 2, 3, 4]]
+    assert (batcher.batches, batcher.requests) == (1, 3)
+
+
+def test_later_checkout_starts_a_new_batch():
+    catalog = FakeCatalog({1: 'q1'})
+    batcher = QuoteBatcher(catalog, window=0.01)
+
+    async def checkouts():
+        await batcher.quote([1])
+        await batcher.quote([1])
+
+    asyncio.run(checkouts())
+    assert catalog.calls == [[1], [1]]
+
+
+def test_failure_reaches_every_waiting_checkout():
+    batcher = QuoteBatcher(FakeCatalog({}, fails=True), window=0.01)
+
+    async def checkouts():
+        return await asyncio.gather(batcher.quote([1]), batcher.quote([2]), return_exceptions=True)
+
+    results = asyncio.run(checkouts())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelled_checkout_does_not_cancel_the_batch():
+    catalog = FakeCatalog({1: 'q1', 2: 'q2'})
+    batcher = QuoteBatcher(catalog, window=0.01)
+
+    async def checkouts():
+        abandoned = asyncio.create_task(batcher.quote([1]))
+        kept = asyncio.create_task(batcher.quote([2]))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await abandoned
+        return await kept
+
+    assert asyncio.run(checkouts()) == {2: 'q2'}
@@ -0,0 +1,52 @@
+import pytest
+
+from city_index import CityIndex, normalize_city, transliterate
+
+
+@pytest.fixture(scope='module')
+def index():
+    return CityIndex()
+
+
+@pytest.mark.parametrize('text, key', [
+    ("Москва", 'moscow'),
+    ("  мск ", 'moscow'),
+    ("Питер", 'saint-petersburg'),
+    ("St. Petersburg", 'saint-petersburg'),
+    ("moskva", 'moscow'),
+    ("Химки", 'khimki'),
+    ("Podolsk", 'podolsk'),
+    ("Королев", 'korolyov'),
+    ("Набережные Челны", 'naberezhnye-chelny'),
+    ("Austin", 'austin'),
+])
+def test_resolves_names_aliases_and_transliteration(index, text, key):
+    assert index.resolve(text).key == key
+
+
+def test_resolves_typos(index):
+    assert index.resolve("Новосибирсг").key == 'novosibirsk'
+
+
+def test_unknown_text_is_rejected(index):
+    assert index.resolve("абырвалг кукуево") is None
+    assert index.resolve("   ") is None
+
+
+def test_suggest_by_prefix(index):
+    keys = [city.key for city in index.suggest("сама")]
+    assert 'samara' in keys
+    assert len(index.suggest("к", limit=3)) == 3
+    assert index.suggest("") == []
+
+
+def test_every_row_parses(index):
+    cities = [index._record(offset) for offset in index.records]
+    assert len({city.key for city in cities}) == len(cities)
+    assert all(-90 <= city.lat <= 90 and -180 <= city.lon <= 180 for city in cities)
+
+
+def test_normalize_and_transliterate():
+    assert normalize_city("Ростов-на-Дону") == "ростов на дону"
+    assert normalize_city("Орёл") == "орел"
+    assert transliterate("москва") == "moskva"
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from json_stream import iter_items
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENT = json.dumps({
+    'meta': {'skip': [1, {'deep': "]}"}], 'text': "кавычка \" и \\ слэш"},
+    'result': {
+        'total': 3,
+        'items': [
+            {'id': 1, 'name': "Чайник", 'tags': ["a", "b"]},
+            {'id': 2, 'name': "emoji 🚀", 'price': 12.5},
+            {'id': 3, 'name': None, 'nested': {'items': []}},
+        ],
+        'after': "не читается",
+    },
+}, ensure_ascii=False)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1 << 16])
+def test_items_survive_any_chunking(size):
+    expected = json.loads(DOCUMENT)['result']['items']
+    assert list(iter_items(chunked(DOCUMENT, size))) == expected
+
+
+def test_missing_path_yields_nothing():
+    assert list(iter_items(chunked('{"result": {"other": []}}', 4))) == []
+    assert list(iter_items(chunked('{"error": "bad"}', 4))) == []
+
+
+def test_empty_array():
+    assert list(iter_items(chunked('{"result": {"items": [ ]}}', 3))) == []
+
+
+def test_custom_path():
+    text = '{"a": 1, "data": {"list": [1, 2, 3]}}'
+    assert list(iter_items(chunked(text, 5), path=('data', 'list'))) == [1, 2, 3]
+
+
+def test_broken_array_raises():
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_items(chunked('{"result": {"items": [1 2]}}', 4)))
+
+
+def test_items_are_lazy():
+    def chunks():
+        yield b'{"result": {"items": [{"id": 1},'
+        raise AssertionError("второй кусок читать рано")
+
+    assert next(iter_items(chunks())) == {'id': 1}
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+
+from message_templates import MessageCatalog, Template, user_language
+
+
+def test_template_renders_fields_with_specs():
+    template = Template("🌡️ {temp:.1f}°C, {name!r} {{не поле}}")
+    assert template.fields == ['temp', 'name']
+    assert template.render({'temp': 3.14159, 'name': "Москва"}) == "🌡️ 3.1°C, 'Москва' {не поле}"
+
+
+def test_render_many_joins_rows():
+    template = Template("• {name}")
+    assert template.render_many([{'name': 'a'}, {'name': 'b'}], "\n") == "• a\n• b"
+
+
+def test_missing_value_raises():
+    with pytest.raises(KeyError):
+        Template("{total} ₽").render({})
+
+
+def test_catalog_falls_back_to_default_language():
+    catalog = MessageCatalog({'ru': {'hello': "Привет, {who}", 'bye': "Пока"}, 'en': {'hello': "Hi, {who}"}})
+    assert catalog.render('hello', 'en', who="Ann") == "Hi, Ann"
+    assert catalog.render('bye', 'en') == "Пока"
+    assert catalog.render('hello', 'de', who="Ann") == "Привет, Ann"
+
+
+def test_user_language():
+    assert user_language(SimpleNamespace(language_code='uk')) == 'ru'
+    assert user_language(SimpleNamespace(language_code='en-US')) == 'en'
+    assert user_language(SimpleNamespace(language_code=None)) == 'ru'
+    assert user_language(SimpleNamespace(language_code='ru'), {'lang': 'en'}) == 'en'
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from order_status import LOST_STATUS, MAX_MISSES, OrderStatusPoller
+from order_store import OrderStore
+
+
+class FakeOzon:
+    """Ozon с заданными отправлениями: posting_number -> status"""
+
+    def __init__(self, postings, list_fails=False):
+        self.postings = postings
+        self.list_fails = list_fails
+        self.lists = []
+        self.gets = []
+
+    def post_items(self, path, payload, items_path):
+        self.lists.append(payload['filter'])
+        if self.list_fails:
+            return None
+        wanted = payload['filter'].get('status')
+        return [{'posting_number': number, 'status': status}
+                for number, status in self.postings.items() if wanted in (None, status)]
+
+    def get_posting(self, posting_number):
+        self.gets.append(posting_number)
+        status = self.postings.get(posting_number)
+        return status and {'status': status}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OrderStore(str(tmp_path / "orders.db"))
+
+
+def poller_for(store, ozon):
+    notified = []
+
+    async def notify(order, status):
+        notified.append((order['number'], status))
+
+    return OrderStatusPoller(lambda: ozon, store, notify), notified
+
+
+def test_list_finds_unchanged_postings_and_get_checks_the_rest(store):
+    same = store.add(1, {}, status='awaiting_packaging', posting_number='P1')
+    moved = store.add(2, {}, status='awaiting_packaging', posting_number='P2')
+    ozon = FakeOzon({'P1': 'awaiting_packaging', 'P2': 'delivering'})
+    poller, notified = poller_for(store, ozon)
+
+    assert asyncio.run(poller.poll_once()) == 1
+    assert notified == [(moved, 'delivering')]
+    # Один список по статусу и периоду заказов, по одному - только то, чего в нем нет
+    assert [f['status'] for f in ozon.lists] == ['awaiting_packaging']
+    assert ozon.gets == ['P2']
+    assert [order['number'] for order in store.open_postings()] == [same, moved]
+
+
+def test_own_statuses_are_listed_without_status_filter(store):
+    store.add(1, {}, status='created_in_ozon', posting_number='P1')
+    ozon = FakeOzon({'P1': 'awaiting_packaging'})
+    poller, notified = poller_for(store, ozon)
+
+    assert asyncio.run(poller.poll_once()) == 1
+    assert 'status' not in ozon.lists[0]
+    assert ozon.gets == []
+
+
+def test_failed_list_stops_the_pass_without_counting_misses(store):
+    number = store.add(1, {}, status='created_in_ozon', posting_number='P1')
+    ozon = FakeOzon({}, list_fails=True)
+    poller, _ = poller_for(store, ozon)
+
+    assert asyncio.run(poller.poll_once()) == 0
+    assert ozon.gets == []
+    assert store.record_miss(number) == 1
+
+
+def test_misses_survive_restart(store):
+    number = store.add(1, {}, status='created_in_ozon', posting_number='P1')
+    for _ in range(MAX_MISSES - 1):
+        poller, _ = poller_for(OrderStore(store.path), FakeOzon({}))
+        asyncio.run(poller.poll_once())
+    assert store.open_postings()
+
+    poller, _ = poller_for(OrderStore(store.path), FakeOzon({}))
+    asyncio.run(poller.poll_once())
+    assert store.open_postings() == []
+    orders, _ = store.page(1)
+    assert orders[0]['number'] == number and orders[0]['status'] == LOST_STATUS
@@ -0,0 +1,33 @@
+import pytest
+
+from order_store import OrderStore, orders_db_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OrderStore(str(tmp_path / "orders.db"))
+
+
+def test_pages_go_from_newest(store):
+    numbers = [store.add(1, {'n': n}) for n in range(7)]
+    store.add(2, {'n': 'other'})
+    orders, cursor = store.page(1, size=5)
+    assert [order['number'] for order in orders] == numbers[:1:-1]
+    orders, cursor = store.page(1, before=cursor, size=5)
+    assert [order['number'] for order in orders] == numbers[1::-1]
+    assert cursor is None
+
+
+def test_open_postings_skip_finished_orders(store):
+    open_number = store.add(1, {}, status='created_in_ozon', posting_number='P1')
+    delivered = store.add(1, {}, status='created_in_ozon', posting_number='P2')
+    store.add(1, {}, status='created')
+    store.update_status(delivered, 'delivered')
+    assert [order['number'] for order in store.open_postings()] == [open_number]
+    assert store.open_postings(after=open_number) == []
+
+
+def test_each_bot_has_its_own_database(monkeypatch):
+    assert orders_db_path('bot3') != orders_db_path('ozon_order')
+    monkeypatch.setenv('ORDERS_DB_PATH_BOT3', '/data/bot3.db')
+    assert orders_db_path('bot3') == '/data/bot3.db'
@@ -0,0 +1,46 @@
+import pytest
+
+from order_store import OrderStore, submission_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OrderStore(str(tmp_path / "orders.db"))
+
+
+def test_repeated_submission_returns_first_order(store):
+    key, first, order = store.claim_submission(1, 'attempt')
+    assert first and order is None
+
+    # Повторное нажатие, пока заказ создается
+    assert store.claim_submission(1, 'attempt') == (key, False, None)
+
+    number = store.add(1, {'total': 100, 'status': 'created'})
+    store.complete_submission(key, number)
+    _, first, order = store.claim_submission(1, 'attempt')
+    assert not first
+    assert order['number'] == number and order['total'] == 100
+
+
+def test_new_attempt_is_a_new_submission(store):
+    store.claim_submission(1, 'attempt')
+    assert store.claim_submission(1, 'other')[1]
+    assert store.claim_submission(2, 'attempt')[1]
+
+
+def test_abandoned_submission_can_be_retried(store):
+    key, _, _ = store.claim_submission(1, 'attempt')
+    store.abandon_submission(key)
+    assert store.claim_submission(1, 'attempt')[1]
+
+
+def test_completed_submission_is_not_abandoned(store):
+    key, _, _ = store.claim_submission(1, 'attempt')
+    store.complete_submission(key, store.add(1, {}))
+    store.abandon_submission(key)
+    assert not store.claim_submission(1, 'attempt')[1]
+
+
+def test_submission_key_depends_on_user_and_attempt():
+    assert submission_key(1, 'a') != submission_key(2, 'a')
+    assert submission_key(1, 'a') != submission_key(1, 'b')
@@ -0,0 +1,124 @@
+import pytest
+
+requests = pytest.importorskip('requests')
+
+import ozon_limiter
+from ozon_limiter import CircuitBreaker, CircuitOpenError, OzonRateLimiter, TokenBucket, method_group
+
+URL = "https://api-seller.ozon.ru/v3/product/info/list"
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Ответы Ozon по порядку: Response или исключение"""
+    queue = []
+
+    def post(url, **kwargs):
+        reply = queue.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(ozon_limiter.requests, 'post', post)
+    monkeypatch.setattr(ozon_limiter.time, 'sleep', lambda delay: None)
+    return queue
+
+
+@pytest.fixture
+def limiter():
+    return OzonRateLimiter(max_retries=2, base_delay=0)
+
+
+def test_method_groups():
+    assert method_group(URL) == 'product'
+    assert method_group("https://api-seller.ozon.ru/v4/product/info/stocks") == 'stocks'
+    assert method_group("https://api-seller.ozon.ru/v5/product/info/prices") == 'prices'
+    assert method_group("https://api-seller.ozon.ru/v3/posting/fbs/get") == 'posting'
+    assert method_group("https://api-seller.ozon.ru/v1/product/info/description") == 'description'
+    assert method_group("https://api-seller.ozon.ru/v1/warehouse/list") == 'default'
+
+
+def test_retries_server_errors(replies, limiter):
+    replies.extend([Response(503), Response(200)])
+    assert limiter.post(URL).status_code == 200
+
+
+def test_non_idempotent_request_is_not_repeated_after_server_error(replies, limiter):
+    replies.extend([Response(500), Response(200)])
+    assert limiter.post(URL, idempotent=False).status_code == 500
+
+
+def test_non_idempotent_request_is_repeated_after_429(replies, limiter):
+    replies.extend([Response(429, {'Retry-After': '0'}), Response(200)])
+    assert limiter.post(URL, idempotent=False).status_code == 200
+
+
+def test_timeout_is_raised_for_non_idempotent_request(replies, limiter):
+    replies.extend([requests.exceptions.Timeout("slow"), Response(200)])
+    with pytest.raises(requests.exceptions.Timeout):
+        limiter.post(URL, idempotent=False)
+
+
+def test_breaker_opens_after_failures(replies):
+    limiter = OzonRateLimiter(max_retries=0)
+    replies.extend([Response(500)] * 5)
+    for _ in range(5):
+        limiter.post(URL)
+    with pytest.raises(CircuitOpenError):
+        limiter.post(URL)
+
+
+def test_probe_is_resolved_by_429_and_by_other_errors():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()  # пробный запрос
+    assert not breaker.allow()  # второй не пускаем, пока проба не закончилась
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_unexpected_error_ends_probe(replies):
+    limiter = OzonRateLimiter(max_retries=0)
+    bucket, breaker = limiter._group('product')
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0
+    breaker.record_failure()
+    replies.extend([ValueError("bad json"), Response(200)])
+    with pytest.raises(ValueError):
+        limiter.post(URL)
+    # Проба закончилась ошибкой - следующий запрос снова пробный, а не заблокирован навсегда
+    assert limiter.post(URL).status_code == 200
+
+
+def test_throttle_lowers_rate_and_relax_restores_it():
+    bucket = TokenBucket(rate=10.0, capacity=10)
+    bucket.throttle()
+    assert bucket.rate < 10.0
+    for _ in range(100):
+        bucket.relax()
+    assert bucket.rate == 10.0
+
+
+def test_retry_after_is_waited_once_and_clamped(replies, monkeypatch):
+    clock = [1000.0]
+    waits = []
+
+    def sleep(delay):
+        waits.append(delay)
+        clock[0] += delay
+
+    monkeypatch.setattr(ozon_limiter.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(ozon_limiter.time, 'sleep', sleep)
+    limiter = OzonRateLimiter(max_retries=2, max_delay=5.0)
+    replies.extend([Response(429, {'Retry-After': '120'}), Response(200)])
+    assert limiter.post(URL).status_code == 200
+    # Пауза выдерживается один раз (в ведре) и не дольше max_delay
+    assert sum(waits) == 5.0
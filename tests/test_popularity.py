@@ -0,0 +1,37 @@
+from weather_cache import CountMinSketch, PopularityTracker
+
+
+def test_sketch_never_underestimates():
+    sketch = CountMinSketch(width=64, depth=4)
+    counts = {f"city{i}": i % 7 + 1 for i in range(200)}
+    for key, count in counts.items():
+        sketch.add(key, count)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+
+
+def test_sketch_decay_halves_counts():
+    sketch = CountMinSketch()
+    sketch.add('moscow', 10)
+    sketch.decay()
+    assert sketch.estimate('moscow') == 5
+
+
+def test_tracker_finds_heavy_hitters():
+    tracker = PopularityTracker(top_k=3)
+    for _ in range(50):
+        for key in ('moscow', 'spb', 'kazan'):
+            tracker.record(key)
+    for i in range(100):
+        tracker.record(f"rare{i}")
+    assert set(tracker.top()) == {'moscow', 'spb', 'kazan'}
+    # Кандидатов не больше 4*K, сколько бы редких городов ни пришло
+    assert len(tracker.candidates) <= 12
+
+
+def test_tracker_follows_trend_after_decay():
+    tracker = PopularityTracker(top_k=1, decay_every=100)
+    for _ in range(60):
+        tracker.record('old')
+    for _ in range(200):
+        tracker.record('new')
+    assert tracker.top() == ['new']
@@ -0,0 +1,121 @@
+import time
+
+from stock_ledger import SOLD_MEMORY, STOCK_LAG, StockLedger
+
+
+def make_ledger(**levels):
+    ledger = StockLedger()
+    ledger.reconcile(levels, time.time())
+    return ledger
+
+
+def test_last_unit_goes_to_one_buyer():
+    ledger = make_ledger(sku=1)
+    assert ledger.reserve('sku', 'alice')
+    assert not ledger.reserve('sku', 'bob')
+    assert ledger.available('sku') == 0
+
+
+def test_release_returns_units():
+    ledger = make_ledger(sku=3)
+    ledger.reserve('sku', 'alice', 2)
+    ledger.release('sku', 'alice', 1)
+    assert ledger.available('sku') == 2
+    ledger.release_all('alice', ['sku'])
+    assert ledger.available('sku') == 3
+
+
+def test_expired_hold_returns_to_stock():
+    ledger = StockLedger(hold_ttl=-1)
+    ledger.reconcile({'sku': 1}, time.time())
+    ledger.reserve('sku', 'alice')
+    assert ledger.available('sku') == 1
+
+
+def test_commit_reports_shortage_without_selling():
+    ledger = make_ledger(sku=1)
+    ledger.reserve('sku', 'bob')
+    assert ledger.commit('alice', {'sku': 1}) == {'sku': 1}
+    assert ledger.commit('bob', {'sku': 1}) == {}
+
+
+def test_unknown_sku_is_sold_without_check():
+    ledger = make_ledger()
+    assert ledger.commit('alice', {'other': 10}) == {}
+
+
+def test_rollback_returns_sale():
+    ledger = make_ledger(sku=2)
+    ledger.reserve('sku', 'alice')
+    ledger.commit('alice', {'sku': 1})
+    ledger.rollback('alice', {'sku': 1})
+    assert ledger.available('sku') == 2
+
+
+def test_reconcile_subtracts_sales_ozon_may_not_see():
+    ledger = make_ledger(sku=5)
+    ledger.reserve('sku', 'alice', 2)
+    ledger.commit('alice', {'sku': 2})
+    ledger.reserve('sku', 'bob')
+
+    # Остатки запрошены сразу после продажи: Ozon еще показывает 5
+    ledger.reconcile({'sku': 5}, time.time())
+    assert ledger.available('sku') == 2
+
+    # Остатки запрошены после окна отражения: Ozon уже вычел продажу сам
+    ledger.reconcile({'sku': 3}, time.time() + STOCK_LAG + 1)
+    assert ledger.available('sku') == 2
+
+
+def test_local_sale_is_remembered_longer():
+    ledger = make_ledger(sku=5)
+    ledger.reserve('sku', 'alice')
+    ledger.commit('alice', {'sku': 1})
+    ledger.mark_local('alice', {'sku': 1})
+
+    ledger.reconcile({'sku': 5}, time.time() + STOCK_LAG + 1)
+    assert ledger.available('sku') == 4
+    ledger.reconcile({'sku': 5}, time.time() + SOLD_MEMORY + 1)
+    assert ledger.available('sku') == 5
+
+
+def test_reconcile_forgets_skus_missing_from_catalog():
+    ledger = make_ledger(sku=1)
+    ledger.reconcile({}, time.time())
+    assert ledger.available('sku') is None
+
+
+def test_commit_keeps_hold_for_items_left_in_cart():
+    ledger = make_ledger(sku=5)
+    for _ in range(3):
+        ledger.reserve('sku', 'alice')
+    assert ledger.commit('alice', {'sku': 2}) == {}
+    # Третья единица добавлена во время оформления и осталась за покупателем
+    assert ledger.available('sku') == 2
+    assert not ledger.reserve('sku', 'bob', 3)
+    assert ledger.commit('alice', {'sku': 1}) == {}
+    assert ledger.available('sku') == 2
+
+
+class Snapshot:
+    """Снимок каталога с тем же интерфейсом, что shop_core.CatalogSnapshot"""
+
+    def __init__(self, products):
+        self.products = products
+        self.stocks_at = time.time()
+
+    def sku(self, key):
+        return self.products[key].get('ozon_id', key)
+
+
+def test_reconcile_catalog_keys_stock_by_sku():
+    ledger = StockLedger()
+    ledger.reconcile_catalog(Snapshot({1: {'ozon_id': 501, 'quantity': 2}, 'demo': {'quantity': 1}}))
+    assert ledger.reserve(501, 'alice')
+    assert ledger.available(501) == 1
+    assert ledger.available('demo') == 1
+
+    # Новая версия каталога: остаток Ozon минус резерв корзины
+    ledger.reconcile_catalog(Snapshot({2: {'ozon_id': 501, 'quantity': 5}}))
+    assert ledger.available(501) == 4
+    assert ledger.available('demo') is None
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('telegram')
+from telegram.error import BadRequest, RetryAfter
+
+import telegram_sender
+from telegram_sender import MessageGovernor
+
+
+def fast_governor():
+    return MessageGovernor(global_rate=1000, per_chat_interval=0.05)
+
+
+class FakeBot:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+def test_messages_to_one_chat_are_spaced():
+    bot = FakeBot()
+    governor = fast_governor()
+
+    async def burst():
+        await asyncio.gather(*(governor.send(bot, chat, str(n)) for n in range(3) for chat in (1, 2)))
+
+    asyncio.run(burst())
+    for chat in (1, 2):
+        moments = [moment for chat_id, _, moment in bot.sent if chat_id == chat]
+        assert len(moments) == 3
+        assert all(b - a >= 0.04 for a, b in zip(moments, moments[1:]))
+
+
+def test_retry_after_is_waited_once_and_resent():
+    bot = FakeBot([RetryAfter(0.05)])
+    governor = fast_governor()
+    started = time.monotonic()
+    assert asyncio.run(governor.send(bot, 1, "hi")) == "hi"
+    assert time.monotonic() - started >= 0.05
+    assert [text for _, text, _ in bot.sent] == ["hi"]
+
+
+def test_unchanged_edit_is_not_an_error():
+    bot = FakeBot([BadRequest("Message is not modified")])
+    assert asyncio.run(fast_governor().send(bot, 1, "same")) is None
+
+
+def test_pending_edits_collapse_to_the_last_one():
+    edits = []
+
+    async def edit_message_text(text, **kwargs):
+        edits.append(text)
+        return text
+
+    query = SimpleNamespace(
+        message=SimpleNamespace(chat_id=1, message_id=10),
+        edit_message_text=edit_message_text,
+    )
+    governor = fast_governor()
+
+    async def clicks():
+        # Первая правка занимает слот чата, следующие ждут и сводятся к последней
+        await governor.edit(query, "1", wait=True)
+        for text in "234":
+            await governor.edit(query, text)
+        return await governor.edit(query, "5", wait=True)
+
+    assert asyncio.run(clicks()) == "5"
+    assert edits == ["1", "5"]
+
+
+def test_idle_chats_are_forgotten(monkeypatch):
+    governor = fast_governor()
+    governor.chat_next = {1: 0.0, 2: time.monotonic() + 60}
+    monkeypatch.setattr(telegram_sender, 'PRUNE_INTERVAL', 0.0)
+    asyncio.run(governor._wait_slot(3))
+    assert set(governor.chat_next) == {2, 3}
@@ -0,0 +1,53 @@
+from weather_cache import WeatherCache
+
+
+def test_fresh_and_stale_entries():
+    cache = WeatherCache(ttl=60)
+    cache.put('a', 1)
+    data, age = cache.lookup('a')
+    assert data == 1 and cache.is_fresh(age)
+    assert cache.get('a') == 1
+
+    cache.ttl = 0
+    data, age = cache.lookup('a')
+    # Устаревшие данные отдаются, пока не прошло max_stale
+    assert data == 1 and not cache.is_fresh(age)
+    assert cache.get('a') is None
+
+
+def test_entries_past_max_stale_are_dropped():
+    cache = WeatherCache(max_stale=0)
+    cache.put('a', 1)
+    assert cache.lookup('a') == (None, None)
+    assert cache.age('a') is None
+
+
+def test_negative_entries_expire_and_clear_on_success():
+    cache = WeatherCache(negative_ttl=60)
+    cache.put_negative('a', "нет такого города")
+    assert cache.get_negative('a') == "нет такого города"
+    cache.put('a', 1)
+    assert cache.get_negative('a') is None
+
+    cache.negative_ttl = 0
+    cache.put_negative('b', "ошибка")
+    assert cache.get_negative('b') is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = WeatherCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.lookup('a')
+    cache.put('c', 3)
+    assert cache.lookup('b') == (None, None)
+    assert cache.lookup('a')[0] == 1
+
+
+def test_cache_sweep_drops_stale_entries():
+    cache = WeatherCache(max_stale=0)
+    cache.put('a', 1)
+    cache.put_negative('b', "ошибка")
+    cache.negative_ttl = 0
+    assert cache.sweep() == 2
+    assert not cache.entries and not cache.negative
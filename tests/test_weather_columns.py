@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('requests')
+np = pytest.importorskip('numpy')
+
+from city_index import City
+from weather_columns import ForecastColumns
+from weather_providers import LocalWeatherProvider
+
+MOSCOW = City('moscow', "Москва", "Moscow", "Россия", 55.7558, 37.6173)
+
+
+def test_columns_match_hours():
+    bundle = LocalWeatherProvider().fetch(MOSCOW, 2)
+    columns = ForecastColumns(bundle['forecast'], bundle['marine'])
+    hours = [hour for day in bundle['forecast']['forecast']['forecastday'] for hour in day['hour']]
+    assert len(columns) == len(hours)
+    assert np.allclose(columns.temp, [hour['temp_c'] for hour in hours])
+    assert list(columns.daily_max) == [day['day']['maxtemp_c'] for day in bundle['forecast']['forecast']['forecastday']]
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('requests')
+
+from city_index import City
+from weather_providers import HedgedWeatherClient, LocalWeatherProvider, WeatherApiError, build_weather_client
+
+MOSCOW = City('moscow', "Москва", "Moscow", "Россия", 55.7558, 37.6173)
+
+
+class FailingProvider:
+    name = 'failing'
+
+    def fetch(self, place, days):
+        raise WeatherApiError("нет ответа")
+
+
+def test_local_provider_is_deterministic():
+    provider = LocalWeatherProvider()
+    first, second = provider.fetch(MOSCOW, 3), provider.fetch(MOSCOW, 3)
+    assert first == second
+    days = first['forecast']['forecast']['forecastday']
+    assert len(days) == 3 and all(len(day['hour']) == 24 for day in days)
+    assert first['current']['location']['name'] == "Москва"
+
+
+def test_hedged_client_falls_back_to_next_provider():
+    client = HedgedWeatherClient([FailingProvider(), LocalWeatherProvider()])
+    bundle = asyncio.run(client.fetch(MOSCOW, 1))
+    assert bundle['provider'] == 'local'
+
+
+def test_hedged_client_raises_when_all_fail():
+    client = HedgedWeatherClient([FailingProvider()])
+    with pytest.raises(WeatherApiError):
+        asyncio.run(client.fetch(MOSCOW, 1))
+
+
+def test_build_client_skips_providers_without_keys():
+    assert build_weather_client(None, 'weatherapi') is None
+    client = build_weather_client(None, 'weatherapi,local')
+    assert [provider.name for provider in client.providers] == ['local']
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from weather_subscriptions import SubscriptionStore, parse_time, slots_between
+
+
+def test_parse_time():
+    assert parse_time("8:30") == "08:30"
+    assert parse_time("07.05") == "07:05"
+    assert parse_time("24:00") is None
+
+
+def test_slots_between_handles_clock_changes():
+    assert slots_between(datetime(2026, 1, 1, 23, 58), datetime(2026, 1, 2, 0, 1, 30)) == ["23:59", "00:00", "00:01"]
+    # Ранний запуск и перевод часов назад не повторяют слоты
+    assert slots_between(datetime(2026, 1, 1, 8, 0, 59), datetime(2026, 1, 1, 8, 0)) == []
+    assert slots_between(datetime(2026, 10, 25, 2, 59), datetime(2026, 10, 25, 2, 1)) == []
+    assert len(slots_between(datetime(2026, 1, 1, 0, 0), datetime(2026, 1, 2, 0, 0), limit=10)) == 10
+
+
+def test_subscriptions_persist_with_language(tmp_path):
+    path = str(tmp_path / "subscriptions.db")
+    store = SubscriptionStore(path, legacy_path=None)
+    store.add(1, 'moscow', "08:00", 'en')
+    store.add(2, 'moscow', "08:00")
+    store.add(1, 'moscow', "09:00", 'en')
+    assert store.due("08:00") == {'moscow': {2: 'ru'}}
+
+    reloaded = SubscriptionStore(path, legacy_path=None)
+    assert reloaded.due("09:00") == {'moscow': {1: 'en'}}
+    assert reloaded.remove(1) == 1
+    assert SubscriptionStore(path, legacy_path=None).for_chat(1) == {}
+
+
+def test_subscriptions_import_legacy_file(tmp_path):
+    legacy = tmp_path / "subscriptions.json"
+    legacy.write_text('{"5": {"moscow": "07:30"}}', encoding='utf-8')
+    store = SubscriptionStore(str(tmp_path / "subscriptions.db"), legacy_path=str(legacy))
+    assert store.due("07:30") == {'moscow': {5: 'ru'}}
+    assert not legacy.exists()
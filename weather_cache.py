@@ -0,0 +1,157 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class CountMinSketch:
+    """Приближенный счетчик частот с фиксированным объемом памяти"""
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        for row in range(self.depth):
+            chunk = digest[row * 4:(row + 1) * 4]
+            yield row, int.from_bytes(chunk, 'little') % self.width
+
+    def add(self, key, count=1):
+        """Увеличивает счетчик ключа и возвращает новую оценку"""
+        estimate = None
+        for row, position in self._positions(key):
+            self.rows[row][position] += count
+            value = self.rows[row][position]
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def estimate(self, key):
+        return min(self.rows[row][position] for row, position in self._positions(key))
+
+    def decay(self):
+        """Делит все счетчики пополам, чтобы популярность следовала за трендом"""
+        for row in self.rows:
+            for position in range(self.width):
+                row[position] >>= 1
+
+
+class PopularityTracker:
+    """Отслеживает самые запрашиваемые города (heavy hitters) по count-min sketch"""
+
+    def __init__(self, top_k=20, decay_every=10000):
+        self.top_k = top_k
+        self.decay_every = decay_every
+        self.sketch = CountMinSketch()
+        self.candidates = {}
+        self.events = 0
+
+    def record(self, key):
+        """Учитывает запрос города"""
+        self.candidates[key] = self.sketch.add(key)
+        self.events += 1
+
+        # Держим в кандидатах не больше 4*K ключей
+        if len(self.candidates) > self.top_k * 4:
+            for stale_key in sorted(self.candidates, key=self.candidates.get)[:self.top_k * 2]:
+                del self.candidates[stale_key]
+
+        if self.events % self.decay_every == 0:
+            self.sketch.decay()
+            self.candidates = {key: self.sketch.estimate(key) for key in self.candidates}
+
+    def top(self):
+        """Возвращает K самых популярных ключей"""
+        return sorted(self.candidates, key=self.candidates.get, reverse=True)[:self.top_k]
+
+
+class WeatherCache:
+    """Кэш погодных данных по ключу города.
+
+    Свежие записи (моложе ttl) отдаются как есть; устаревшие, но моложе
+    max_stale, тоже отдаются сразу, а обновление идет в фоне
+    (stale-while-revalidate). Ошибки API кэшируются отдельно на negative_ttl.
+
+    Число записей ограничено max_entries: при переполнении вытесняются давно
+    не запрошенные (LRU), а раз в sweep_every добавлений удаляются все
+    записи старше max_stale, даже если их больше никто не запрашивает.
+    """
+
+    def __init__(self, ttl=600, max_stale=6 * 3600, negative_ttl=900, max_entries=2000, sweep_every=500):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self.entries = OrderedDict()
+        self.negative = OrderedDict()
+        self.puts = 0
+
+    def get(self, key):
+        """Возвращает данные, если они еще свежие"""
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def lookup(self, key):
+        """Возвращает (данные, возраст) последнего удачного ответа или (None, None)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, None
+        age = time.monotonic() - entry[0]
+        if age >= self.max_stale:
+            del self.entries[key]
+            return None, None
+        self.entries.move_to_end(key)
+        return entry[1], age
+
+    def is_fresh(self, age):
+        return age is not None and age < self.ttl
+
+    def age(self, key):
+        """Возраст записи в секундах или None, если записи нет"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return time.monotonic() - entry[0]
+
+    def put(self, key, data):
+        self.entries[key] = (time.monotonic(), data)
+        self.entries.move_to_end(key)
+        self.negative.pop(key, None)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.puts += 1
+        if self.puts % self.sweep_every == 0:
+            self.sweep()
+
+    def put_negative(self, key, error_message):
+        """Запоминает ошибку API, чтобы не повторять заведомо неудачный запрос"""
+        self.negative[key] = (time.monotonic(), error_message)
+        self.negative.move_to_end(key)
+        if len(self.negative) > self.max_entries:
+            self.negative.popitem(last=False)
+
+    def sweep(self):
+        """Удаляет записи старше max_stale и истекшие ошибки; возвращает число удаленных"""
+        now = time.monotonic()
+        expired = [key for key, entry in self.entries.items() if now - entry[0] >= self.max_stale]
+        for key in expired:
+            del self.entries[key]
+        removed = len(expired)
+        # Ошибки добавляются по времени, поэтому истекшие - в начале
+        while self.negative and now - next(iter(self.negative.values()))[0] >= self.negative_ttl:
+            self.negative.popitem(last=False)
+            removed += 1
+        return removed
+
+    def get_negative(self, key):
+        """Сообщение закэшированной ошибки или None"""
+        entry = self.negative.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.negative_ttl:
+            del self.negative[key]
+            return None
+        return entry[1]
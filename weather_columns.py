@@ -0,0 +1,83 @@
+import time
+from functools import cached_property
+
+import numpy as np
+
+# Порог вероятности дождя, с которого час считается дождливым
+RAIN_CHANCE_THRESHOLD = 50
+
+# Ширина окна, по которому ищется пик волнения
+WAVE_WINDOW_HOURS = 3
+
+
+def runs(mask):
+    """Непрерывные участки True в булевом массиве: [(начало, конец включительно)]"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class ForecastColumns:
+    """Почасовые ряды прогноза и морских данных в виде NumPy-колонок.
+
+    Колонки строятся один раз на ответ API и хранятся вместе с ним в кэше,
+    агрегаты считаются векторно при первом обращении и тоже кэшируются.
+    """
+
+    def __init__(self, forecast_data, marine_data=None):
+        days = []
+        if forecast_data and 'error' not in forecast_data and 'forecast' in forecast_data:
+            days = forecast_data['forecast']['forecastday']
+        hours = [hour for day in days for hour in day['hour']]
+
+        self.dates = [day['date'] for day in days]
+        # Индекс первого часа каждого дня - для агрегатов по дням
+        self.day_starts = np.cumsum([0] + [len(day['hour']) for day in days[:-1]]).astype(np.intp)
+        self.epoch = np.fromiter((hour['time_epoch'] for hour in hours), np.int64, len(hours))
+        self.time = np.array([hour['time'] for hour in hours], dtype=str)
+        self.clock = np.array([hour['time'][11:16] for hour in hours], dtype=str)
+        self.temp = np.fromiter((hour['temp_c'] for hour in hours), np.float64, len(hours))
+        self.wind = np.fromiter((hour['wind_kph'] for hour in hours), np.float64, len(hours))
+        self.rain = np.fromiter((hour['chance_of_rain'] for hour in hours), np.int64, len(hours))
+
+        marine_hours = []
+        if marine_data and 'forecast' in marine_data:
+            marine_hours = [hour for day in marine_data['forecast']['forecastday'] for hour in day.get('hour', [])]
+        self.marine_time = np.array([hour['time'] for hour in marine_hours], dtype=str)
+        self.wave_height = np.fromiter((hour.get('sig_ht_mt', 0) for hour in marine_hours), np.float64, len(marine_hours))
+        self.wave_period = np.fromiter((hour.get('swell_period_secs', 0) for hour in marine_hours), np.float64, len(marine_hours))
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def upcoming(self, limit=None):
+        """Срез индексов часов начиная с текущего"""
+        start = int(np.searchsorted(self.epoch, time.time() - 3600))
+        return slice(start, None if limit is None else start + limit)
+
+    @cached_property
+    def daily_min(self):
+        return np.minimum.reduceat(self.temp, self.day_starts) if len(self) else self.temp
+
+    @cached_property
+    def daily_max(self):
+        return np.maximum.reduceat(self.temp, self.day_starts) if len(self) else self.temp
+
+    @cached_property
+    def rain_windows(self):
+        """Интервалы дождливых часов: [(индекс начала, индекс конца, макс. вероятность)]"""
+        return [
+            (start, end, int(self.rain[start:end + 1].max()))
+            for start, end in runs(self.rain >= RAIN_CHANCE_THRESHOLD)
+        ]
+
+    @cached_property
+    def wave_peak(self):
+        """Окно максимального волнения: (индекс начала, индекс конца, средняя высота) или None"""
+        if not len(self.wave_height):
+            return None
+        width = min(WAVE_WINDOW_HOURS, len(self.wave_height))
+        means = np.convolve(self.wave_height, np.ones(width) / width, mode='valid')
+        start = int(means.argmax())
+        return start, start + width - 1, float(means[start])
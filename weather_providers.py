@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+# Порядок провайдеров: первый - основной, второй - запасной для хеджирования
+WEATHER_PROVIDERS = os.environ.get('WEATHER_PROVIDERS', 'weatherapi,open-meteo')
+
+# Пока статистики мало, второй запрос отправляем через столько секунд
+DEFAULT_HEDGE_DELAY = 2.0
+# Границы задержки хеджа, чтобы один выброс не сломал оценку p95
+MIN_HEDGE_DELAY = 0.3
+MAX_HEDGE_DELAY = 5.0
+LATENCY_WINDOW = 200  # сколько последних замеров хранить
+MIN_LATENCY_SAMPLES = 20
+
+# Коды погоды WMO (Open-Meteo) -> описание
+WMO_CONDITIONS = {
+    0: "Ясно", 1: "Преимущественно ясно", 2: "Переменная облачность", 3: "Пасмурно",
+    45: "Туман", 48: "Изморозь",
+    51: "Слабая морось", 53: "Морось", 55: "Сильная морось",
+    56: "Ледяная морось", 57: "Сильная ледяная морось",
+    61: "Небольшой дождь", 63: "Дождь", 65: "Сильный дождь",
+    66: "Ледяной дождь", 67: "Сильный ледяной дождь",
+    71: "Небольшой снег", 73: "Снег", 75: "Сильный снег", 77: "Снежные зерна",
+    80: "Ливень", 81: "Сильный ливень", 82: "Очень сильный ливень",
+    85: "Снегопад", 86: "Сильный снегопад",
+    95: "Гроза", 96: "Гроза с градом", 99: "Сильная гроза с градом",
+}
+
+
+class WeatherApiError(Exception):
+    """Погодный API вернул ошибку (например, неизвестное место)"""
+
+
+class WeatherProvider:
+    """Источник погоды. fetch() блокирующий и возвращает набор данных в формате
+    weatherapi.com: {'current', 'astronomy', 'forecast', 'marine'}"""
+
+    name = 'provider'
+
+    def fetch(self, place, days):
+        raise NotImplementedError
+
+
+class WeatherApiProvider(WeatherProvider):
+    """weatherapi.com: текущая погода, астрономия, прогноз и морские данные"""
+
+    name = 'weatherapi'
+    base_url = "http://api.weatherapi.com/v1"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def fetch(self, place, days):
+        # Все варианты названия одного места дают один и тот же запрос
+        location_query = place.query
+
+        # Получаем текущую погоду
+        current_params = {
+            'key': self.api_key,
+            'q': location_query,
+            'lang': 'ru'
+        }
+
+        # Получаем астрономические данные (восход, закат)
+        astronomy_params = {
+            'key': self.api_key,
+            'q': location_query,
+            'dt': 'today'
+        }
+
+        # Получаем прогноз сразу на days дней: из него строятся все представления
+        forecast_params = {
+            'key': self.api_key,
+            'q': location_query,
+            'days': days,
+            'lang': 'ru'
+        }
+
+        # Делаем основные запросы
+        current_response = requests.get(f"{self.base_url}/current.json", params=current_params, timeout=10)
+        astronomy_response = requests.get(f"{self.base_url}/astronomy.json", params=astronomy_params, timeout=10)
+        forecast_response = requests.get(f"{self.base_url}/forecast.json", params=forecast_params, timeout=10)
+
+        current_data = current_response.json()
+        astronomy_data = astronomy_response.json()
+        forecast_data = forecast_response.json()
+
+        if 'error' in current_data:
+            raise WeatherApiError(current_data['error']['message'])
+
+        if 'error' in astronomy_data:
+            raise WeatherApiError(astronomy_data['error']['message'])
+
+        # Пытаемся получить marine данные
+        marine_data = {}
+        try:
+            marine_params = {
+                'key': self.api_key,
+                'q': location_query,
+                'days': 1
+            }
+
+            print(f"Requesting marine data for: {place.name_en}")
+            marine_response = requests.get(f"{self.base_url}/marine.json", params=marine_params, timeout=5)
+            marine_data = marine_response.json()
+        except requests.exceptions.Timeout:
+            print(f"Marine API timeout for {place.name_en}")
+        except Exception as e:
+            print(f"Marine API error for {place.name_en}: {e}")
+
+        return {
+            'current': current_data,
+            'astronomy': astronomy_data,
+            'forecast': forecast_data,
+            'marine': marine_data
+        }
+
+
+def place_location(place):
+    """Блок location для места: у ячеек сетки названия нет, показываем координаты"""
+    return {
+        'name': place.name_ru or f"{place.lat:.2f}, {place.lon:.2f}",
+        'country': place.country,
+    }
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """open-meteo.com (без ключа); ответ приводится к формату weatherapi.com.
+
+    Морских данных нет, поэтому блок волн при этом провайдере не показывается.
+    """
+
+    name = 'open-meteo'
+    url = "https://api.open-meteo.com/v1/forecast"
+
+    def fetch(self, place, days):
+        params = {
+            'latitude': place.lat,
+            'longitude': place.lon,
+            'current': 'temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,'
+                       'wind_speed_10m,pressure_msl,visibility',
+            'hourly': 'temperature_2m,precipitation_probability,wind_speed_10m',
+            'daily': 'weather_code,temperature_2m_max,temperature_2m_min,sunrise,sunset,'
+                     'precipitation_probability_max,wind_speed_10m_max,snowfall_sum,relative_humidity_2m_mean',
+            'timezone': 'auto',
+            'forecast_days': days,
+        }
+        response = requests.get(self.url, params=params, timeout=10)
+        data = response.json()
+        if data.get('error'):
+            raise WeatherApiError(data.get('reason', 'Open-Meteo error'))
+
+        offset = data.get('utc_offset_seconds', 0)
+        current = data['current']
+        daily = data['daily']
+        hourly = data['hourly']
+
+        hours_by_date = {}
+        for index, iso_time in enumerate(hourly['time']):
+            local = datetime.fromisoformat(iso_time)
+            hours_by_date.setdefault(local.date().isoformat(), []).append({
+                'time_epoch': int(local.replace(tzinfo=timezone.utc).timestamp()) - offset,
+                'time': local.strftime("%Y-%m-%d %H:%M"),
+                'temp_c': hourly['temperature_2m'][index],
+                'wind_kph': hourly['wind_speed_10m'][index],
+                'chance_of_rain': hourly['precipitation_probability'][index] or 0,
+            })
+
+        forecast_days = []
+        for index, date in enumerate(daily['time']):
+            chance = daily['precipitation_probability_max'][index] or 0
+            astro = {
+                'sunrise': daily['sunrise'][index][11:16],
+                'sunset': daily['sunset'][index][11:16],
+            }
+            forecast_days.append({
+                'date': date,
+                'astro': astro,
+                'day': {
+                    'maxtemp_c': daily['temperature_2m_max'][index],
+                    'mintemp_c': daily['temperature_2m_min'][index],
+                    'condition': {'text': WMO_CONDITIONS.get(daily['weather_code'][index], "—")},
+                    'avghumidity': daily['relative_humidity_2m_mean'][index],
+                    'maxwind_kph': daily['wind_speed_10m_max'][index],
+                    'daily_chance_of_rain': chance,
+                    'daily_chance_of_snow': chance if daily['snowfall_sum'][index] else 0,
+                },
+                'hour': hours_by_date.get(date, []),
+            })
+
+        return {
+            'current': {
+                'location': place_location(place),
+                'current': {
+                    'temp_c': current['temperature_2m'],
+                    'feelslike_c': current['apparent_temperature'],
+                    'condition': {'text': WMO_CONDITIONS.get(current['weather_code'], "—")},
+                    'humidity': current['relative_humidity_2m'],
+                    'wind_kph': current['wind_speed_10m'],
+                    'pressure_mb': current['pressure_msl'],
+                    'vis_km': round(current['visibility'] / 1000, 1),
+                },
+            },
+            'astronomy': {'astronomy': {'astro': forecast_days[0]['astro']}},
+            'forecast': {'forecast': {'forecastday': forecast_days}},
+            'marine': {},
+        }
+
+
+class LocalWeatherProvider(WeatherProvider):
+    """Локальная заглушка без сети: правдоподобные данные, детерминированные
+    по координатам. Для тестов и запуска бота без ключей (WEATHER_PROVIDERS=local)."""
+
+    name = 'local'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def fetch(self, place, days):
+        if self.latency:
+            time.sleep(self.latency)
+
+        seed = int.from_bytes(hashlib.blake2b(place.query.encode(), digest_size=4).digest(), 'little')
+        base_temp = 25 - abs(place.lat) * 0.5 + seed % 7
+        start = datetime.now().replace(minute=0, second=0, microsecond=0, hour=0)
+
+        forecast_days = []
+        for day in range(days):
+            date = start + timedelta(days=day)
+            hours = []
+            for hour in range(24):
+                moment = date + timedelta(hours=hour)
+                temp = round(base_temp + 5 * math.sin((hour - 9) / 24 * 2 * math.pi) + day % 3, 1)
+                hours.append({
+                    'time_epoch': int(moment.timestamp()),
+                    'time': moment.strftime("%Y-%m-%d %H:%M"),
+                    'temp_c': temp,
+                    'wind_kph': round(5 + (seed >> 3) % 15 + hour % 4, 1),
+                    'chance_of_rain': (seed + day * 37 + hour * 11) % 100,
+                })
+            temps = [hour['temp_c'] for hour in hours]
+            forecast_days.append({
+                'date': date.strftime("%Y-%m-%d"),
+                'astro': {'sunrise': "07:00 AM", 'sunset': "06:00 PM"},
+                'day': {
+                    'maxtemp_c': max(temps),
+                    'mintemp_c': min(temps),
+                    'condition': {'text': WMO_CONDITIONS[(0, 2, 3, 61)[(seed + day) % 4]]},
+                    'avghumidity': 40 + seed % 50,
+                    'maxwind_kph': max(hour['wind_kph'] for hour in hours),
+                    'daily_chance_of_rain': max(hour['chance_of_rain'] for hour in hours),
+                    'daily_chance_of_snow': 0,
+                },
+                'hour': hours,
+            })
+
+        now_hour = forecast_days[0]['hour'][datetime.now().hour]
+        return {
+            'current': {
+                'location': place_location(place),
+                'current': {
+                    'temp_c': now_hour['temp_c'],
+                    'feelslike_c': round(now_hour['temp_c'] - 2, 1),
+                    'condition': forecast_days[0]['day']['condition'],
+                    'humidity': forecast_days[0]['day']['avghumidity'],
+                    'wind_kph': now_hour['wind_kph'],
+                    'pressure_mb': 1000 + seed % 30,
+                    'vis_km': 10,
+                },
+            },
+            'astronomy': {'astronomy': {'astro': forecast_days[0]['astro']}},
+            'forecast': {'forecast': {'forecastday': forecast_days}},
+            'marine': {},
+        }
+
+
+class HedgedWeatherClient:
+    """Запрос погоды с хеджированием.
+
+    Сначала спрашиваем основной провайдер; если он не ответил за p95 своих
+    недавних задержек (или ответил ошибкой), параллельно спрашиваем запасной
+    и берем первый удачный ответ. Так хвост задержек ограничен, а отказ
+    одного провайдера не оставляет пользователя без погоды.
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+        self.latencies = {provider.name: deque(maxlen=LATENCY_WINDOW) for provider in providers}
+
+    def hedge_delay(self, provider):
+        """p95 задержки провайдера в секундах"""
+        samples = self.latencies[provider.name]
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return min(MAX_HEDGE_DELAY, max(MIN_HEDGE_DELAY, p95))
+
+    def _fetch(self, provider, place, days):
+        started = time.monotonic()
+        try:
+            bundle = provider.fetch(place, days)
+        finally:
+            # Неудачи тоже учитываем: медленный отказ - тоже задержка
+            self.latencies[provider.name].append(time.monotonic() - started)
+        bundle['provider'] = provider.name
+        return bundle
+
+    async def fetch(self, place, days):
+        """Данные о погоде от самого быстрого исправного провайдера"""
+        pending = {}
+        errors = []
+        providers = iter(self.providers)
+
+        def launch():
+            provider = next(providers, None)
+            if provider is None:
+                return None
+            task = asyncio.create_task(asyncio.to_thread(self._fetch, provider, place, days))
+            pending[task] = provider
+            return provider
+
+        provider = launch()
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, timeout=self.hedge_delay(provider), return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                failed = pending.pop(task)
+                if task.exception() is None:
+                    # Отставший запрос дорабатывает в своем потоке, результат не нужен
+                    for other in pending:
+                        other.add_done_callback(_ignore_result)
+                    return task.result()
+                print(f"⚠️ Провайдер погоды {failed.name} не ответил: {task.exception()}")
+                errors.append(task.exception())
+
+            if not done or not pending:
+                # Основной тормозит или упал - подключаем следующий
+                next_provider = launch()
+                if next_provider is not None:
+                    print(f"🪢 Хеджируем запрос погоды через {next_provider.name}")
+                    provider = next_provider
+
+        raise errors[0]
+
+
+def _ignore_result(task):
+    if not task.cancelled():
+        task.exception()
+
+
+def build_weather_client(api_key, provider_names=WEATHER_PROVIDERS):
+    """Клиент погоды из списка провайдеров; None, если ни один не доступен"""
+    providers = []
+    for name in (name.strip() for name in provider_names.split(',')):
+        if name == 'weatherapi':
+            if api_key:
+                providers.append(WeatherApiProvider(api_key))
+        elif name == 'open-meteo':
+            providers.append(OpenMeteoProvider())
+        elif name == 'local':
+            providers.append(LocalWeatherProvider())
+        elif name:
+            print(f"⚠️ Неизвестный провайдер погоды: {name}")
+    if not providers:
+        return None
+    print(f"🌐 Провайдеры погоды: {', '.join(provider.name for provider in providers)}")
+    return HedgedWeatherClient(providers)
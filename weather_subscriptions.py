@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import sqlite3
+from datetime import timedelta
+
+# База с подписками на ежедневный прогноз
+SUBSCRIPTIONS_DB_PATH = os.environ.get('SUBSCRIPTIONS_DB_PATH', 'subscriptions.db')
+# Прежний JSON-файл подписок: переносится в базу при первом запуске
+SUBSCRIPTIONS_PATH = os.environ.get('SUBSCRIPTIONS_PATH', 'subscriptions.json')
+# Сколько пропущенных минут рассылки досылать (перевод часов вперед, долгая пауза)
+MAX_CATCH_UP = 120
+
+TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3])[:.]([0-5]\d)$')
+
+
+def parse_time(text):
+    """Разбирает время вида 8:30 / 08.30 и возвращает "HH:MM" или None"""
+    match = TIME_PATTERN.match(text.strip())
+    if not match:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    city_key TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    lang TEXT NOT NULL DEFAULT 'ru',
+    PRIMARY KEY (chat_id, city_key)
+);
+"""
+
+
+def slots_between(last, now, limit=MAX_CATCH_UP):
+    """Слоты "HH:MM" по местным часам после last до now включительно.
+
+    Часы, пройденные повторно (ранний запуск, перевод часов назад), не дают
+    слотов; пропущенные при переводе вперед минуты досылаются, но не больше limit.
+    """
+    last = last.replace(second=0, microsecond=0, tzinfo=None)
+    now = now.replace(second=0, microsecond=0, tzinfo=None)
+    slots = []
+    minute = last + timedelta(minutes=1)
+    while minute <= now and len(slots) < limit:
+        slots.append(minute.strftime("%H:%M"))
+        minute += timedelta(minutes=1)
+    return slots
+
+
+class SubscriptionStore:
+    """Подписки на ежедневный прогноз с индексом "время -> город -> чаты".
+
+    Рассылка за минуту получает сразу все города этого слота, поэтому
+    каждый город запрашивается один раз, сколько бы подписчиков у него ни было.
+    Каждая подписка - одна строка SQLite: добавление и удаление пишут только
+    ее, а не весь набор подписок.
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_DB_PATH, legacy_path=SUBSCRIPTIONS_PATH):
+        self.path = path
+        self.by_chat = {}  # chat_id -> {city_key: "HH:MM"}
+        self.slots = {}  # "HH:MM" -> {city_key: {chat_id: язык}}
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.executescript(SCHEMA)
+        self._import_legacy(legacy_path)
+        self._load()
+
+    def _import_legacy(self, legacy_path):
+        """Переносит подписки из прежнего JSON-файла"""
+        if not legacy_path or not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Не удалось прочитать подписки: {e}")
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO subscriptions (chat_id, city_key, slot) VALUES (?, ?, ?)",
+                [(int(chat_id), city_key, slot) for chat_id, cities in data.items() for city_key, slot in cities.items()]
+            )
+        os.replace(legacy_path, f"{legacy_path}.imported")
+        print(f"📬 Подписки перенесены из {legacy_path} в {self.path}")
+
+    def _load(self):
+        for chat_id, city_key, slot, lang in self.db.execute("SELECT chat_id, city_key, slot, lang FROM subscriptions"):
+            self._index(chat_id, city_key, slot, lang)
+        print(f"📬 Загружено подписок: {sum(len(cities) for cities in self.by_chat.values())}")
+
+    def _index(self, chat_id, city_key, slot, lang):
+        self._unindex(chat_id, city_key)
+        self.by_chat.setdefault(chat_id, {})[city_key] = slot
+        self.slots.setdefault(slot, {}).setdefault(city_key, {})[chat_id] = lang
+
+    def _unindex(self, chat_id, city_key):
+        slot = self.by_chat.get(chat_id, {}).pop(city_key, None)
+        if slot is None:
+            return False
+        if not self.by_chat[chat_id]:
+            del self.by_chat[chat_id]
+        chats = self.slots[slot][city_key]
+        chats.pop(chat_id, None)
+        if not chats:
+            del self.slots[slot][city_key]
+            if not self.slots[slot]:
+                del self.slots[slot]
+        return True
+
+    def add(self, chat_id, city_key, slot, lang='ru'):
+        """Подписывает чат на прогноз по городу в заданное время"""
+        self._index(chat_id, city_key, slot, lang)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO subscriptions (chat_id, city_key, slot, lang) VALUES (?, ?, ?, ?)",
+                (chat_id, city_key, slot, lang)
+            )
+
+    def remove(self, chat_id, city_key=None):
+        """Отписывает чат от города (или от всех городов); возвращает число удаленных подписок"""
+        city_keys = [city_key] if city_key else list(self.by_chat.get(chat_id, {}))
+        removed = [key for key in city_keys if self._unindex(chat_id, key)]
+        if removed:
+            with self.db:
+                self.db.executemany(
+                    "DELETE FROM subscriptions WHERE chat_id = ? AND city_key = ?",
+                    [(chat_id, key) for key in removed]
+                )
+        return len(removed)
+
+    def for_chat(self, chat_id):
+        """Подписки чата: {city_key: "HH:MM"}"""
+        return dict(self.by_chat.get(chat_id, {}))
+
+    def due(self, slot):
+        """Подписки на минуту slot: {city_key: {chat_id: язык}}"""
+        return {city_key: dict(chats) for city_key, chats in self.slots.get(slot, {}).items()}
@@ -0,0 +1,261 @@
+from datetime import datetime
+from functools import reduce
+
+import numpy as np
+
+from message_templates import MessageCatalog
+from weather_columns import RAIN_CHANCE_THRESHOLD
+
+# Сколько часов показывать в почасовом прогнозе
+HOURLY_VIEW_HOURS = 24
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+DAY_NAMES = {
+    'ru': ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"],
+    'en': ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+}
+MONTH_NAMES = {
+    'ru': ["янв", "фев", "мар", "апр", "мая", "июн",
+           "июл", "авг", "сен", "окт", "ноя", "дек"],
+    'en': ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
+}
+
+# Тексты сообщений о погоде; компилируются один раз при импорте
+WEATHER_MESSAGES = MessageCatalog({
+    'ru': {
+        'current': (
+            "🌍 {place}\n\n"
+            "📅 **СЕГОДНЯ**\n"
+            "🌡️ Температура: {temp_c}°C\n"
+            "💭 Ощущается как: {feelslike_c}°C\n"
+            "📝 {condition}\n"
+            "💧 Влажность: {humidity}%\n"
+            "🌬️ Ветер: {wind_kph} км/ч\n"
+            "📊 Давление: {pressure_mmhg} мм рт. ст.\n"
+            "🌫️ Видимость: {vis_km} км\n"
+            "🌅 Восход: {sunrise}\n"
+            "🌇 Закат: {sunset}"
+        ),
+        'tomorrow': (
+            "\n\n📅 **ЗАВТРА** ({date})\n"
+            "🌡️ Макс: {maxtemp_c}°C\n"
+            "🌡️ Мин: {mintemp_c}°C\n"
+            "📝 {condition}\n"
+            "💧 Влажность: {avghumidity}%\n"
+            "🌬️ Ветер: {maxwind_kph} км/ч\n"
+            "🌧️ Вероятность дождя: {daily_chance_of_rain}%\n"
+            "❄️ Вероятность снега: {daily_chance_of_snow}%\n"
+            "🌅 Восход: {sunrise}\n"
+            "🌇 Закат: {sunset}"
+        ),
+        'marine': (
+            "\n\n🌊 **Морские условия:**\n"
+            "📏 Высота волн: {wave_height:.1f} м\n"
+            "⏱️ Период волн: {wave_period:.1f} сек\n"
+            "🧭 Направление: {wave_direction}°\n"
+            "📋 {description}"
+        ),
+        'marine_peak': "\n📈 Пик волнения: {start}–{end}, в среднем {height:.1f} м",
+        'wave_calm': "🟢 Спокойное море",
+        'wave_light': "🟡 Легкое волнение",
+        'wave_moderate': "🟠 Умеренное волнение",
+        'wave_rough': "🟣 Сильное волнение",
+        'wave_high': "🔴 Очень сильное волнение",
+        'stale': "\n\n🕒 Данные получены {age} назад, обновляем в фоне",
+        'stale_daily': "\n\n🕒 Обновить данные не удалось, они получены {age} назад",
+        'daily_title': "☀️ Ежедневный прогноз\n\n",
+        'age_minutes': "{minutes} мин",
+        'age_hours': "{hours} ч {minutes} мин",
+        'place': "🌍 {place}\n",
+        'week_title': "🗓️ **ПРОГНОЗ НА {days} ДН.**",
+        'week_day': "\n📅 {date}: {condition}\n🌡️ {low:g}…{high:g}°C  🌬️ {wind} км/ч  🌧️ {rain}%",
+        'week_missing': "\n❌ Прогноз по дням недоступен",
+        'hours_title': "🕐 **ПО ЧАСАМ** ({start}–{end})\n🌡️ {low:g}…{high:g}°C {chart}\n",
+        'hours_missing': "\n❌ Почасовой прогноз недоступен",
+        'kph': "км/ч",
+        'rain_title': "🌧️ **КОГДА БУДЕТ ДОЖДЬ** (вероятность от {threshold}%)\n",
+        'rain_window': "• {date} {start}–{end_date}{end_hour}:59, до {chance}%",
+        'rain_none': "☀️ Дождя не ожидается",
+        'rain_missing': "\n❌ Прогноз осадков недоступен",
+        'view_now': "📅 Сейчас",
+        'view_week': "🗓️ Неделя",
+        'view_hours': "🕐 По часам",
+        'view_rain': "🌧️ Дожди",
+    },
+    'en': {
+        'current': (
+            "🌍 {place}\n\n"
+            "📅 **TODAY**\n"
+            "🌡️ Temperature: {temp_c}°C\n"
+            "💭 Feels like: {feelslike_c}°C\n"
+            "📝 {condition}\n"
+            "💧 Humidity: {humidity}%\n"
+            "🌬️ Wind: {wind_kph} km/h\n"
+            "📊 Pressure: {pressure_mmhg} mmHg\n"
+            "🌫️ Visibility: {vis_km} km\n"
+            "🌅 Sunrise: {sunrise}\n"
+            "🌇 Sunset: {sunset}"
+        ),
+        'tomorrow': (
+            "\n\n📅 **TOMORROW** ({date})\n"
+            "🌡️ Max: {maxtemp_c}°C\n"
+            "🌡️ Min: {mintemp_c}°C\n"
+            "📝 {condition}\n"
+            "💧 Humidity: {avghumidity}%\n"
+            "🌬️ Wind: {maxwind_kph} km/h\n"
+            "🌧️ Chance of rain: {daily_chance_of_rain}%\n"
+            "❄️ Chance of snow: {daily_chance_of_snow}%\n"
+            "🌅 Sunrise: {sunrise}\n"
+            "🌇 Sunset: {sunset}"
+        ),
+        'marine': (
+            "\n\n🌊 **Sea conditions:**\n"
+            "📏 Wave height: {wave_height:.1f} m\n"
+            "⏱️ Wave period: {wave_period:.1f} s\n"
+            "🧭 Direction: {wave_direction}°\n"
+            "📋 {description}"
+        ),
+        'marine_peak': "\n📈 Peak waves: {start}–{end}, {height:.1f} m on average",
+        'wave_calm': "🟢 Calm sea",
+        'wave_light': "🟡 Slight sea",
+        'wave_moderate': "🟠 Moderate sea",
+        'wave_rough': "🟣 Rough sea",
+        'wave_high': "🔴 Very rough sea",
+        'stale': "\n\n🕒 Data is {age} old, refreshing in the background",
+        'stale_daily': "\n\n🕒 Could not refresh the data, it is {age} old",
+        'daily_title': "☀️ Daily forecast\n\n",
+        'age_minutes': "{minutes} min",
+        'age_hours': "{hours} h {minutes} min",
+        'week_title': "🗓️ **{days}-DAY FORECAST**",
+        'week_day': "\n📅 {date}: {condition}\n🌡️ {low:g}…{high:g}°C  🌬️ {wind} km/h  🌧️ {rain}%",
+        'week_missing': "\n❌ Daily forecast is unavailable",
+        'hours_title': "🕐 **HOURLY** ({start}–{end})\n🌡️ {low:g}…{high:g}°C {chart}\n",
+        'hours_missing': "\n❌ Hourly forecast is unavailable",
+        'kph': "km/h",
+        'rain_title': "🌧️ **RAIN WINDOWS** (chance from {threshold}%)\n",
+        'rain_window': "• {date} {start}–{end_date}{end_hour}:59, up to {chance}%",
+        'rain_none': "☀️ No rain expected",
+        'rain_missing': "\n❌ Precipitation forecast is unavailable",
+        'view_now': "📅 Now",
+        'view_week': "🗓️ Week",
+        'view_hours': "🕐 Hourly",
+        'view_rain': "🌧️ Rain",
+    },
+})
+
+
+def format_time(time_str):
+    """Форматирование времени из формата API в читаемый вид"""
+    try:
+        # Преобразуем время из формата "2024-01-15 07:45" в "07:45"
+        dt = datetime.strptime(time_str, "%Y-%m-%d %H:%M")
+        return dt.strftime("%H:%M")
+    except:
+        return time_str
+
+
+def format_date(date_str, lang='ru'):
+    """Форматирование даты в читаемый вид"""
+    try:
+        dt = datetime.strptime(date_str, "%Y-%m-%d")
+        days = DAY_NAMES.get(lang, DAY_NAMES['ru'])
+        months = MONTH_NAMES.get(lang, MONTH_NAMES['ru'])
+        return f"{dt.day} {months[dt.month-1]} ({days[dt.weekday()]})"
+    except:
+        return date_str
+
+
+def forecast_days(forecast_data):
+    """Дни прогноза из ответа forecast.json (пустой список при ошибке)"""
+    if not forecast_data or 'error' in forecast_data or 'forecast' not in forecast_data:
+        return []
+    return forecast_data['forecast']['forecastday']
+
+
+def sparkline(values):
+    """Текстовый график значений"""
+    if not len(values):
+        return ""
+    low, high = values.min(), values.max()
+    spread = (high - low) or 1
+    levels = ((values - low) / spread * (len(SPARK_CHARS) - 1)).astype(int)
+    return "".join(SPARK_CHARS[level] for level in levels)
+
+
+def format_week_view(place_title, forecast_data, columns, lang='ru'):
+    """Прогноз по дням на все загруженные дни"""
+    days = forecast_days(forecast_data)
+    lines = [WEATHER_MESSAGES.render('place', lang, place=place_title)]
+    if not days:
+        lines.append(WEATHER_MESSAGES.render('week_missing', lang))
+        return "\n".join(lines)
+    
+    lines.append(WEATHER_MESSAGES.render('week_title', lang, days=len(days)))
+    day_template = WEATHER_MESSAGES.get('week_day', lang)
+    lines.append(day_template.render_many([
+        {
+            'date': format_date(day['date'], lang),
+            'condition': day['day']['condition']['text'],
+            'low': low,
+            'high': high,
+            'wind': day['day']['maxwind_kph'],
+            'rain': day['day']['daily_chance_of_rain'],
+        }
+        for day, low, high in zip(days, columns.daily_min, columns.daily_max)
+    ], "\n"))
+    return "\n".join(lines)
+
+
+def format_hourly_view(place_title, columns, lang='ru'):
+    """Почасовой прогноз на ближайшие сутки с графиком температуры"""
+    hours = columns.upcoming(HOURLY_VIEW_HOURS)
+    temps = columns.temp[hours]
+    lines = [WEATHER_MESSAGES.render('place', lang, place=place_title)]
+    if not len(temps):
+        lines.append(WEATHER_MESSAGES.render('hours_missing', lang))
+        return "\n".join(lines)
+    
+    clock = columns.clock[hours]
+    kph = WEATHER_MESSAGES.render('kph', lang)
+    # Строки таблицы собираются векторно, колонка за колонкой
+    rows = reduce(np.char.add, [
+        clock,
+        np.char.mod("  %5.1f°C", temps),
+        np.char.mod("  🌧️ %3d%%", columns.rain[hours]),
+        np.char.mod(f"  🌬️ %g {kph}", columns.wind[hours]),
+    ])
+    
+    lines.append(WEATHER_MESSAGES.render(
+        'hours_title', lang,
+        start=clock[0], end=clock[-1], low=temps.min(), high=temps.max(), chart=sparkline(temps)
+    ))
+    lines.extend(rows.tolist())
+    return "\n".join(lines)
+
+
+def format_rain_view(place_title, columns, lang='ru'):
+    """Интервалы дождя по всем дням прогноза"""
+    lines = [WEATHER_MESSAGES.render('place', lang, place=place_title)]
+    if not len(columns):
+        lines.append(WEATHER_MESSAGES.render('rain_missing', lang))
+        return "\n".join(lines)
+    
+    lines.append(WEATHER_MESSAGES.render('rain_title', lang, threshold=RAIN_CHANCE_THRESHOLD))
+    first_hour = columns.upcoming().start
+    windows = [window for window in columns.rain_windows if window[1] >= first_hour]
+    if not windows:
+        lines.append(WEATHER_MESSAGES.render('rain_none', lang))
+    window_template = WEATHER_MESSAGES.get('rain_window', lang)
+    for start, end, chance in windows:
+        first, last = columns.time[max(start, first_hour)], columns.time[end]
+        lines.append(window_template.render({
+            'date': format_date(first[:10], lang),
+            'start': format_time(first),
+            # Окно может переходить через полночь
+            'end_date': "" if last[:10] == first[:10] else f"{format_date(last[:10], lang)} ",
+            'end_hour': format_time(last)[:2],
+            'chance': chance,
+        }))
+    return "\n".join(lines)